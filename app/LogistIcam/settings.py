@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.MetricsMiddleware',  # En premier pour mesurer toute la chaîne
+    'main.middleware.CompressionMiddleware',  # Avant tout middleware qui lit ou modifie le corps des réponses
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,15 +82,59 @@ WSGI_APPLICATION = 'LogistIcam.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'mysql.connector.django',  # pip install mysql-connector-python
+        # mysql.connector.django + pool de connexions persistantes (main/backends/mysql_pool)
+        'ENGINE': 'main.backends.mysql_pool',  # pip install mysql-connector-python
         'NAME': 'logisticam',
         'USER': 'root',
         'PASSWORD': 'BestPasswordEver:)',
         'HOST': 'db.vilaloris.fr',
         'PORT': '3306',
+        'OPTIONS': {
+            'POOL': {
+                'size': int(os.environ.get('LOGISTICAM_DB_POOL_SIZE', 5)),
+                'max_lifetime': int(os.environ.get('LOGISTICAM_DB_POOL_MAX_LIFETIME', 1800)),
+            },
+        },
     }
 }
 
+# Réplica en lecture seule, utilisé par les pages de consultation (rapports, listes, tableau de bord)
+if os.environ.get('LOGISTICAM_DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['LOGISTICAM_DB_REPLICA_HOST'],
+        'PORT': os.environ.get('LOGISTICAM_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    }
+
+# Développement local sans MariaDB : deux fichiers SQLite jouant le primaire et le réplica
+if os.environ.get('LOGISTICAM_DB_SQLITE_DIR'):
+    DATABASES = {
+        alias: {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': Path(os.environ['LOGISTICAM_DB_SQLITE_DIR']) / f'{alias}.sqlite3',
+        }
+        for alias in ('default', 'replica')
+    }
+
+DATABASE_ROUTERS = ['main.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_ALIAS = 'replica'
+# Durée pendant laquelle un utilisateur qui vient d'écrire lit sur le primaire
+REPLICA_PIN_SECONDS = 10
+# Noms d'URL dont les lectures partent sur le réplica
+REPLICA_READ_VIEWS = [
+    'main:home',
+    'main:home_async',
+    'main:list_transactions',
+    'main:all_transactions',
+    'main:list_stocks',
+    'main:list_stocks_rows',
+    'main:details_stock',
+    'main:generate_stock_item_pdf',
+    'main:list_clients',
+    'main:client_pdf_report',
+    'main:client_pdf_report_async',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -104,10 +153,85 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Permissions résolues de chaque utilisateur gardées dans le cache partagé (main.permissions)
+AUTHENTICATION_BACKENDS = ['main.permissions.CachedModelBackend']
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('LOGISTICAM_PERMISSION_CACHE_TIMEOUT', 3600))  # Secondes
+
+# Sessions lues dans le cache partagé, la base n'étant lue qu'en cas d'absence ("cached_db"), ou portées
+# entièrement par un cookie signé ("signed_cookies" : aucune requête, mais pas de déconnexion côté serveur)
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('LOGISTICAM_SESSION_BACKEND', 'cached_db')
+
+# Listes de l'administration : nombre de lignes compté exactement jusqu'à ce seuil, estimé par MariaDB au-delà
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('LOGISTICAM_ADMIN_EXACT_COUNT_LIMIT', 10000))
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/accueil/'
 LOGOUT_REDIRECT_URL = '/accueil'
 
+# Cache partagé entre les workers (numéros de version des index de recherche, ...)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('LOGISTICAM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'logisticam_cache')),
+        'OPTIONS': {
+            # 300 par défaut : moins que les seaux journaliers des classements (3 x LEADERBOARD_RETENTION_DAYS)
+            'MAX_ENTRIES': int(os.environ.get('LOGISTICAM_CACHE_MAX_ENTRIES', 5000)),
+        },
+    }
+}
+# Verrou des numéros de version (main.versioning) : le cache fichier n'a pas d'incrément atomique
+VERSION_LOCK_FILE = os.environ.get('LOGISTICAM_VERSION_LOCK_FILE',
+                                   os.path.join(CACHES['default']['LOCATION'], 'versions.lock'))
+
+# Rapports PDF : threads pour les sections (requêtes, tableaux), processus pour les graphiques
+REPORT_THREADS = int(os.environ.get('LOGISTICAM_REPORT_THREADS', 4))
+REPORT_PROCESSES = int(os.environ.get('LOGISTICAM_REPORT_PROCESSES', 2))
+
+# Prévision de la demande et suggestions de réapprovisionnement (main.forecast)
+FORECAST_HISTORY_DAYS = int(os.environ.get('LOGISTICAM_FORECAST_HISTORY_DAYS', 365))  # Jours de ventes lus
+FORECAST_ALPHA = float(os.environ.get('LOGISTICAM_FORECAST_ALPHA', 0.3))  # Lissage exponentiel, 0-1
+FORECAST_WINDOW_DAYS = int(os.environ.get('LOGISTICAM_FORECAST_WINDOW_DAYS', 28))  # Moyenne mobile et écart-type
+FORECAST_CACHE_TIMEOUT = int(os.environ.get('LOGISTICAM_FORECAST_CACHE_TIMEOUT', 3600))  # Secondes
+REORDER_LEAD_DAYS = int(os.environ.get('LOGISTICAM_REORDER_LEAD_DAYS', 7))  # Délai de livraison
+REORDER_COVER_DAYS = int(os.environ.get('LOGISTICAM_REORDER_COVER_DAYS', 14))  # Jours couverts par une commande
+REORDER_SERVICE_Z = float(os.environ.get('LOGISTICAM_REORDER_SERVICE_Z', 1.65))  # Stock de sécurité (1.65 : ~95 %)
+
+# Classements du tableau de bord (main.leaderboards) : totaux par jour tenus à jour dans le cache partagé
+LEADERBOARD_WINDOW_DAYS = int(os.environ.get('LOGISTICAM_LEADERBOARD_WINDOW_DAYS', 30))  # Fenêtre affichée
+LEADERBOARD_RETENTION_DAYS = int(os.environ.get('LOGISTICAM_LEADERBOARD_RETENTION_DAYS', 90))  # Plus longue fenêtre
+
+# Écriture groupée des ventes (main.ingest) : un commit pour toutes les ventes reçues pendant INGEST_FLUSH_MS
+INGEST_GROUP_COMMIT = os.environ.get('LOGISTICAM_INGEST_GROUP_COMMIT', '0') == '1'
+INGEST_FLUSH_MS = float(os.environ.get('LOGISTICAM_INGEST_FLUSH_MS', 5))
+INGEST_BATCH_SIZE = int(os.environ.get('LOGISTICAM_INGEST_BATCH_SIZE', 200))  # Ventes par commit au plus
+INGEST_SUBMIT_TIMEOUT = float(os.environ.get('LOGISTICAM_INGEST_SUBMIT_TIMEOUT', 30))  # Secondes d'attente d'une vente
+
+# Synchronisation des caisses hors ligne (main.sync, /sync/changes)
+SYNC_GAP_SECONDS = int(os.environ.get('LOGISTICAM_SYNC_GAP_SECONDS', 60))  # Âge d'un trou de séquence tenu pour définitif
+SYNC_BATCH_SIZE = int(os.environ.get('LOGISTICAM_SYNC_BATCH_SIZE', 1000))  # Lignes du journal par réponse
+SYNC_MAX_BATCH_SIZE = int(os.environ.get('LOGISTICAM_SYNC_MAX_BATCH_SIZE', 10000))  # Plus grand "limit" accepté
+# Jeton attendu dans l'en-tête "Authorization: Bearer <jeton>" des caisses
+SYNC_TOKEN = os.environ.get('LOGISTICAM_SYNC_TOKEN')
+
+# Tableau de bord en direct (main.live, flux Server-Sent Events servis sous ASGI)
+# Fichier SQLite partagé par les workers pour diffuser les événements ; sans lui, diffusion dans le processus
+LIVE_EVENTS_DB = os.environ.get('LOGISTICAM_LIVE_EVENTS_DB')
+LIVE_POLL_INTERVAL = float(os.environ.get('LOGISTICAM_LIVE_POLL_INTERVAL', 0.5))  # Secondes entre deux lectures
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get('LOGISTICAM_LIVE_HEARTBEAT_SECONDS', 15))
+LIVE_STREAM_SECONDS = int(os.environ.get('LOGISTICAM_LIVE_STREAM_SECONDS', 300))  # Durée d'un flux avant reconnexion
+LIVE_RESYNC_SECONDS = int(os.environ.get('LOGISTICAM_LIVE_RESYNC_SECONDS', 300))  # Relecture des KPI en base
+
+# Compression des réponses HTML/JSON (main.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.environ.get('LOGISTICAM_COMPRESSION_MIN_SIZE', 1024))  # Octets
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('LOGISTICAM_COMPRESSION_BROTLI_QUALITY', 4))  # 0-11
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('LOGISTICAM_COMPRESSION_GZIP_LEVEL', 6))  # 1-9
+
+# Metrics
+# Dossier partagé entre les workers pour agréger les métriques exposées sur /metrics
+METRICS_DIR = os.environ.get('LOGISTICAM_METRICS_DIR')
+# Jeton attendu dans l'en-tête "Authorization: Bearer <jeton>" du scraper
+METRICS_TOKEN = os.environ.get('LOGISTICAM_METRICS_TOKEN')
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -124,6 +248,18 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Hors DEBUG, "manage.py collectstatic" est requis à chaque déploiement : noms hashés + variantes .br/.gz
+STATIC_ROOT = os.environ.get('LOGISTICAM_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'main.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
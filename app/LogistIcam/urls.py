@@ -14,10 +14,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from main import staticfiles
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Fichiers statiques servis par l'application (variantes pré-compressées, cache long)
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), staticfiles.serve),
     path('', include('main.urls')),
 ]
@@ -1,6 +1,95 @@
+from datetime import date, datetime, time, timedelta
+
 from django.contrib import admin
+from django.db import models
+from django.utils import timezone
+
 from .models import Stock, Transaction, Client
+from .paginators import EstimatedCountPaginator
+
+
+class ProbedDatesQuerySet(models.QuerySet):
+    """
+    QuerySet whose :meth:`datetimes` finds the periods holding rows by probing each one.
+
+    The date hierarchy of the admin lists the years (months, days) holding
+    rows with a ``SELECT DISTINCT`` over the truncated dates of the whole
+    selection, a scan of the table. Here the bounds of the selection are read
+    from the index, then every period between them is probed with an
+    ``EXISTS`` over an index range: at most 31 probes, each reading one row.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=timezone.NOT_PASSED):
+        if kind not in ('year', 'month', 'day') or tzinfo is not None:
+            return super().datetimes(field_name, kind, order=order, tzinfo=tzinfo, is_dst=is_dst)
+        bounds = self.aggregate(first=models.Min(field_name), last=models.Max(field_name))
+        if bounds['first'] is None:
+            return []
+
+        periods = []
+        day, last = _period_start(timezone.localtime(bounds['first']).date(), kind), timezone.localtime(bounds['last'])
+        while (start := timezone.make_aware(datetime.combine(day, time.min))) <= last:
+            day = _next_period(day, kind)
+            end = timezone.make_aware(datetime.combine(day, time.min))
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                periods.append(start)
+        return periods if order == 'ASC' else periods[::-1]
+
+
+def _period_start(day, kind):
+    if kind == 'year':
+        return date(day.year, 1, 1)
+    if kind == 'month':
+        return date(day.year, day.month, 1)
+    return day
+
+
+def _next_period(day, kind):
+    if kind == 'year':
+        return date(day.year + 1, 1, 1)
+    if kind == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings shared by the tables that grow large.
+
+    The count of the rows is estimated past ``settings.ADMIN_EXACT_COUNT_LIMIT``
+    and the unfiltered total, a second ``COUNT(*)``, is not shown.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Stock)
+class StockAdmin(LargeTableAdmin):
+    list_display = ('produit', 'quantity', 'prix_achat', 'prix_vente', 'average_cost')
+    search_fields = ('produit',)
+    ordering = ('produit',)  # Index unique
+
+
+@admin.register(Client)
+class ClientAdmin(LargeTableAdmin):
+    list_display = ('name', 'surname', 'type')
+    list_filter = ('type',)
+    search_fields = ('name', 'surname')
+    ordering = ('name', 'surname')  # clients_name_surname_idx
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'time', 'type', 'produit', 'client', 'quantity', 'unit_price', 'price', 'new_stock_qt')
+    list_filter = ('type',)
+    # Produit et client lus par la même requête que les transactions (__str__ des deux modèles)
+    list_select_related = ('produit', 'client')
+    date_hierarchy = 'time'
+    ordering = ('-time',)  # transactions_time_idx
+    # Listes déroulantes de dizaines de milliers d'options remplacées par une recherche
+    autocomplete_fields = ('produit', 'client')
 
-admin.site.register(Stock)
-admin.site.register(Transaction)
-admin.site.register(Client)
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return ProbedDatesQuerySet(model=queryset.model, query=queryset.query, using=queryset._db,
+                                   hints=queryset._hints)
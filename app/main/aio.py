@@ -0,0 +1,87 @@
+"""
+Helpers for the async (ASGI) views.
+
+Django's async ORM methods (``acount``, ``aaggregate``, ``async for``...) run
+the query through ``sync_to_async(thread_sensitive=True)``: within one
+request they all share a single thread, so ``asyncio.gather`` alone would
+still run them one after another. :func:`gather_queries` gives every branch
+its own :class:`~asgiref.sync.ThreadSensitiveContext`, hence its own thread
+and database connection, so that independent aggregates really run at the
+same time.
+"""
+import asyncio
+import inspect
+from functools import wraps
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import connections
+
+
+async def gather_queries(**queries):
+    """
+    Runs independent database queries concurrently.
+
+    Each value is a callable taking no argument: either a coroutine function
+    using the async ORM (e.g. ``queryset.acount``, or a ``functools.partial``
+    of ``queryset.aaggregate``) or a plain synchronous function, which is run
+    in the thread of its branch.
+
+    :param queries: The queries to run, by name.
+    :return: The result of every query, by name.
+    :rtype: dict
+    """
+    results = await asyncio.gather(*(_run_isolated(query) for query in queries.values()))
+    return dict(zip(queries, results))
+
+
+async def alist(queryset):
+    """
+    Evaluates a queryset with the async ORM.
+
+    :param queryset: The queryset (or ``values()`` queryset) to fetch.
+    :type queryset: QuerySet
+    :rtype: list
+    """
+    return [row async for row in queryset]
+
+
+async def _run_isolated(query):
+    async with ThreadSensitiveContext():
+        try:
+            if inspect.iscoroutinefunction(query):
+                return await query()
+            result = await sync_to_async(query)()
+            # Méthodes de manager (ex. Stock.objects.aaggregate) : fonctions ordinaires renvoyant une coroutine
+            return await result if inspect.isawaitable(result) else result
+        finally:
+            # Le thread dédié disparaît avec le contexte : on rend ses connexions (au pool, le cas échéant)
+            await sync_to_async(connections.close_all)()
+
+
+def async_permission_required(perm, login_url=None):
+    """
+    Async counterpart of :func:`django.contrib.auth.decorators.permission_required`.
+
+    The user is loaded and its permissions are checked in a thread, since
+    both need the database.
+
+    :param perm: The permission (e.g. ``"main.view_transaction"``).
+    :type perm: str
+    :param login_url: Where anonymous or unauthorized users are redirected.
+    :type login_url: str or None
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if await sync_to_async(_has_perm)(request, perm):
+                return await view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url or settings.LOGIN_URL)
+        return wrapper
+    return decorator
+
+
+def _has_perm(request, perm):
+    # request.user est chargé paresseusement depuis la session : à évaluer hors de la boucle
+    return request.user.has_perm(perm)
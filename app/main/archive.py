@@ -0,0 +1,169 @@
+"""
+Hot / cold storage of the transactions.
+
+Transactions older than a cutoff are moved in batches from ``transactions``
+to ``transactions_archive`` and their totals are added to the
+:class:`~main.models.TransactionSummary` rows, so that the pages only scan the
+recent (hot) transactions while all-time figures stay exact.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Sum, F, OuterRef, Subquery, Value, DecimalField, IntegerField
+from django.db.models.functions import Coalesce
+
+from . import forecast
+from .models import Transaction, ArchivedTransaction, TransactionSummary
+
+ARCHIVED_FIELDS = ('id', 'produit_id', 'quantity', 'new_stock_qt', 'time', 'client_id', 'price', 'unit_price',
+                   'unit_cost', 'cogs', 'type')
+
+
+def archive_transactions(cutoff, batch_size=1000, on_batch=None):
+    """
+    Moves the transactions older than ``cutoff`` to the archive table.
+
+    Each batch is copied to the archive, added to the summaries and deleted
+    from the hot table inside a single database transaction, so an interrupted
+    run never loses nor double-counts a transaction and can simply be resumed.
+
+    :param cutoff: Transactions strictly older than this datetime are archived.
+    :type cutoff: datetime
+    :param batch_size: Number of transactions moved per database transaction.
+    :type batch_size: int
+    :param on_batch: Optional callback receiving the running total after each batch.
+    :type on_batch: Callable[[int], None] or None
+    :return: The number of archived transactions.
+    :rtype: int
+    """
+    archived = 0
+    while True:
+        with db_transaction.atomic():
+            rows = list(
+                Transaction.objects
+                .filter(time__lt=cutoff)
+                .order_by('id')
+                .select_for_update()
+                .values(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+
+            ArchivedTransaction.objects.bulk_create([ArchivedTransaction(**row) for row in rows])
+            _carry_over(rows)
+            Transaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+        archived += len(rows)
+        if on_batch:
+            on_batch(archived)
+    if archived:
+        # Les ventes archivées sortent de l'historique lu par les prévisions
+        forecast.bump_data_version()
+    return archived
+
+
+def _carry_over(rows):
+    """Adds the totals of a batch of archived transactions to the summary rows."""
+    totals = defaultdict(lambda: {'count': 0, 'quantity': 0, 'amount': Decimal('0'), 'cost': Decimal('0'),
+                                  'last_time': None})
+    for row in rows:
+        total = totals[(row['produit_id'], row['client_id'], row['type'])]
+        total['count'] += 1
+        total['quantity'] += row['quantity']
+        total['amount'] += row['price'] or 0
+        # Vente : coût des marchandises vendues ; achat : montant dépensé
+        total['cost'] += row['cogs'] if row['type'] == 'Vente' else row['quantity'] * row['unit_cost']
+        if total['last_time'] is None or row['time'] > total['last_time']:
+            total['last_time'] = row['time']
+
+    existing = {
+        (summary.produit_id, summary.client_id, summary.type): summary
+        for summary in TransactionSummary.objects.select_for_update().filter(
+            produit_id__in={key[0] for key in totals}
+        )
+    }
+
+    to_update, to_create = [], []
+    for (produit_id, client_id, type_), total in totals.items():
+        summary = existing.get((produit_id, client_id, type_))
+        if summary is None:
+            to_create.append(TransactionSummary(produit_id=produit_id, client_id=client_id, type=type_, **total))
+            continue
+        summary.count += total['count']
+        summary.quantity += total['quantity']
+        summary.amount += total['amount']
+        summary.cost += total['cost']
+        if summary.last_time is None or total['last_time'] > summary.last_time:
+            summary.last_time = total['last_time']
+        to_update.append(summary)
+
+    TransactionSummary.objects.bulk_create(to_create)
+    TransactionSummary.objects.bulk_update(to_update, ['count', 'quantity', 'amount', 'cost', 'last_time'])
+
+
+def archived_totals(**filters):
+    """
+    Returns the archived totals per transaction type for the given filters.
+
+    :param filters: Lookups applied to :class:`TransactionSummary` (e.g. ``client=client``).
+    :return: ``{'Vente': {...}, 'Achat': {...}}`` with ``count``, ``quantity`` and
+        ``amount`` keys, zero when nothing was archived.
+    :rtype: dict[str, dict]
+    """
+    totals = {type_: {'count': 0, 'quantity': 0, 'amount': Decimal('0')} for type_ in ('Vente', 'Achat')}
+    rows = (
+        TransactionSummary.objects.filter(**filters)
+        .values('type')
+        .annotate(count=Sum('count'), quantity=Sum('quantity'), amount=Sum('amount'))
+    )
+    for row in rows:
+        totals[row['type']] = {
+            'count': row['count'] or 0,
+            'quantity': row['quantity'] or 0,
+            'amount': row['amount'] or Decimal('0'),
+        }
+    return totals
+
+
+def archived_client_sum(field, **filters):
+    """
+    Builds a correlated subquery summing a summary column for the outer client.
+
+    Meant to be added to the annotations computed on the hot table, e.g.
+    ``Count('transaction') + archived_client_sum('count')``.
+
+    :param field: Column of :class:`TransactionSummary` to sum (``count``, ``quantity`` or ``amount``).
+    :type field: str
+    :param filters: Additional lookups (e.g. ``type='Vente'``).
+    :return: An expression evaluating to 0 when nothing was archived.
+    :rtype: Coalesce
+    """
+    output_field = DecimalField(max_digits=14, decimal_places=2) if field == 'amount' else IntegerField()
+    subquery = (
+        TransactionSummary.objects.filter(client=OuterRef('pk'), **filters)
+        .values('client')
+        .annotate(total=Sum(field))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery, output_field=output_field), Value(0), output_field=output_field)
+
+
+def archived_product_totals(**filters):
+    """
+    Returns the archived quantity and margin per product for the given filters.
+
+    :param filters: Lookups applied to :class:`TransactionSummary`.
+    :return: Rows with ``produit__produit``, ``quantity`` and ``margin`` keys, where the
+        margin is the archived amount minus the archived cost.
+    :rtype: QuerySet
+    """
+    return (
+        TransactionSummary.objects.filter(**filters)
+        .values('produit__produit')
+        .annotate(
+            # La marge d'abord : une fois annoté, "quantity" désignerait la somme et non la colonne
+            margin=Sum(F('amount') - F('cost'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            quantity=Sum('quantity'),
+        )
+    )
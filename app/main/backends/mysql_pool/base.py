@@ -0,0 +1,135 @@
+"""
+MySQL / MariaDB backend keeping its connections in a mysql-connector pool.
+
+It behaves exactly like ``mysql.connector.django`` except that opening a
+connection checks one out of a per-process :class:`MySQLConnectionPool` and
+closing it (at the end of every request when ``CONN_MAX_AGE`` is 0) hands it
+back to the pool instead of tearing down the TCP session. Autocommit is
+set on the pooled session itself, not on the wrapper handed out by the
+pool. The pool is configured through ``OPTIONS['POOL']``::
+
+    'OPTIONS': {
+        'POOL': {
+            'size': 5,                 # connexions ouvertes par worker
+            'max_lifetime': 1800,      # secondes avant recyclage d'une connexion
+            'checkout_timeout': 10,    # attente max. quand le pool est épuisé
+            'reset_session': True,     # COM_RESET_CONNECTION au retour dans le pool
+        },
+    }
+"""
+import os
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from mysql.connector.django.base import DatabaseWrapper as MySQLDatabaseWrapper, DjangoMySQLConverter
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool, CNX_POOL_MAXSIZE
+
+POOL_DEFAULTS = {
+    'size': 5,
+    'max_lifetime': 1800,
+    'checkout_timeout': 10,
+    'reset_session': True,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, options):
+    """
+    Returns the pool of the current process for a database alias, creating it on first use.
+
+    Pools are keyed by process id as well so that a worker forked after the
+    pool was created never shares sockets with its parent.
+
+    :param alias: Alias of the database in ``settings.DATABASES``.
+    :type alias: str
+    :param conn_params: Connection arguments given to ``mysql.connector.connect``.
+    :type conn_params: dict
+    :param options: Pool options merged with :data:`POOL_DEFAULTS`.
+    :type options: dict
+    :return: The connection pool.
+    :rtype: MySQLConnectionPool
+    """
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = MySQLConnectionPool(
+                    pool_name=f"logisticam_{alias}_{os.getpid()}",
+                    pool_size=options['size'],
+                    pool_reset_session=options['reset_session'],
+                    **conn_params,
+                )
+                _pools[key] = pool
+    return pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    """
+    Database wrapper borrowing its connections from a mysql-connector pool.
+
+    Health check on checkout is done by the pool itself, which pings every
+    connection it hands out and reconnects it when the server dropped it.
+    On top of that, connections older than ``max_lifetime`` are reconnected
+    before being used so that none outlives the server ``wait_timeout`` or a
+    failover of the database host.
+    """
+
+    @property
+    def pool_options(self):
+        options = {**POOL_DEFAULTS, **self.settings_dict.get('OPTIONS', {}).get('POOL', {})}
+        if not 0 < options['size'] <= CNX_POOL_MAXSIZE:
+            raise ImproperlyConfigured(
+                f"OPTIONS['POOL']['size'] must be between 1 and {CNX_POOL_MAXSIZE}."
+            )
+        return options
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Les options du pool ne sont pas des arguments de connexion MySQL
+        params.pop('POOL', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn_params.setdefault('converter_class', DjangoMySQLConverter)
+        options = self.pool_options
+        pool = get_pool(self.alias, conn_params, options)
+
+        deadline = time.monotonic() + options['checkout_timeout']
+        while True:
+            try:
+                pooled = pool.get_connection()
+                break
+            except PoolError:
+                # Pool épuisé : on attend qu'un autre thread rende sa connexion
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.005)
+
+        # Recyclage des connexions trop anciennes
+        cnx = pooled._cnx
+        now = time.monotonic()
+        opened_at = getattr(cnx, 'logisticam_opened_at', None)
+        if opened_at is None:
+            cnx.logisticam_opened_at = now
+        elif options['max_lifetime'] and now - opened_at > options['max_lifetime']:
+            try:
+                cnx.reconnect()
+            except Exception:
+                # Rendue telle quelle : le pool la reconnectera au prochain emprunt
+                pool.add_connection(cnx)
+                raise
+            cnx.logisticam_opened_at = now
+
+        return pooled
+
+    def _set_autocommit(self, autocommit):
+        # PooledMySQLConnection ne relaie que les lectures d'attributs : une affectation sur le wrapper
+        # laisserait la session en autocommit=False, et le reset du pool annulerait les écritures
+        with self.wrap_database_errors:
+            self.connection._cnx.autocommit = autocommit
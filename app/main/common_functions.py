@@ -2,6 +2,9 @@ from datetime import datetime, timedelta
 
 from django.utils import timezone
 
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_MAX_LIMIT = 50
+
 
 def get_dates(request):
     """
@@ -97,3 +100,19 @@ def filter_transactions(transactions, request):
         transactions = transactions.filter(time__lte=end_date)
 
     return transactions
+
+
+def get_autocomplete_limit(request):
+    """
+    Reads the number of results asked from an autocomplete endpoint.
+
+    :param request: A Django HttpRequest object with an optional `limit` parameter.
+    :type request: HttpRequest
+    :return: The limit, clamped between 1 and ``AUTOCOMPLETE_MAX_LIMIT`` (``AUTOCOMPLETE_LIMIT`` when invalid).
+    :rtype: int
+    """
+    try:
+        limit = int(request.GET.get('limit', AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        return AUTOCOMPLETE_LIMIT
+    return max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
@@ -0,0 +1,155 @@
+"""
+Brotli and gzip helpers shared by the static files storage and the response
+compression middleware.
+
+The encodings are listed by preference: Brotli gives smaller text assets
+than gzip at the same decompression cost, gzip is accepted by every client.
+"""
+import gzip
+import zlib
+
+import brotli
+
+# Encodage HTTP -> extension des variantes pré-compressées
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+# Types dont la compression vaut la peine (PDF, PNG, ZIP... sont déjà compressés)
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+
+def accepted_encodings(header):
+    """
+    Parses an ``Accept-Encoding`` header.
+
+    :param header: Value of the header, possibly empty.
+    :type header: str
+    :return: The codings the client accepts (those with a ``q`` value above 0).
+    :rtype: set[str]
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    if '*' in accepted:
+        accepted.update(ENCODINGS)
+    return accepted
+
+
+def negotiate(header, available=ENCODINGS):
+    """
+    Returns the preferred encoding among ``available`` that the client accepts.
+
+    :param header: Value of the ``Accept-Encoding`` header.
+    :type header: str
+    :param available: The candidate encodings, in order of preference.
+    :type available: Iterable[str]
+    :return: The chosen encoding, or ``None`` to send the identity.
+    :rtype: str or None
+    """
+    accepted = accepted_encodings(header)
+    return next((encoding for encoding in available if encoding in accepted), None)
+
+
+def compress(data, encoding, level=None):
+    """
+    Compresses a whole payload.
+
+    :param data: The payload.
+    :type data: bytes
+    :param encoding: ``"br"`` or ``"gzip"``.
+    :type encoding: str
+    :param level: Brotli quality (0-11) or gzip level (1-9), the maximum by default.
+    :type level: int or None
+    :rtype: bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    if encoding == 'gzip':
+        # mtime fixe : même entrée, même sortie (ETag et caches stables)
+        return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class StreamCompressor:
+    """
+    Compresses a body chunk by chunk.
+
+    Every compressed chunk is flushed, so that the client can decode what it
+    received without waiting for the end of the body.
+
+    :param encoding: ``"br"`` or ``"gzip"``.
+    :type encoding: str
+    :param level: Brotli quality (0-11) or gzip level (1-9).
+    :type level: int
+    """
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=level)
+        elif encoding == 'gzip':
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # Enveloppe gzip
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk):
+        if not chunk:
+            return b''
+        if self.encoding == 'br':
+            return self._brotli.process(chunk) + self._brotli.flush()
+        return self._zlib.compress(chunk) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compresses an iterable of chunks lazily.
+
+    :param chunks: The chunks of the body.
+    :type chunks: Iterable[bytes]
+    :rtype: Iterator[bytes]
+    """
+    compressor = StreamCompressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding, level):
+    """
+    Asynchronous version of :func:`compress_stream`.
+
+    :param chunks: The chunks of the body.
+    :type chunks: AsyncIterable[bytes]
+    :rtype: AsyncIterator[bytes]
+    """
+    compressor = StreamCompressor(encoding, level)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
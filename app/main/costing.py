@@ -0,0 +1,199 @@
+"""
+Weighted average cost of the goods sold.
+
+Every product carries the average unit cost of its units in stock
+(``Stock.average_cost``). A purchase blends its units in at its unit cost; a
+sale takes its units out at the average and records their cost on the
+transaction (``Transaction.cogs``), so that margins are plain sums of
+``price - cogs`` over the sales.
+
+The state is updated by the write path (``page_add_transaction``), under the
+lock of the stock row. :func:`rebuild_costs` replays the whole history, hot
+and archived, in one ordered pass per product: after a data fix, or to
+value the sales recorded before the engine existed.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, transaction as db_transaction
+
+from .ledger import product_ranges, update_column
+from .models import Stock, Transaction, ArchivedTransaction, TransactionSummary
+
+AVERAGE_QUANTUM = Decimal('0.0001')
+AMOUNT_QUANTUM = Decimal('0.01')
+REBUILD_FETCH_SIZE = 2000
+REBUILD_BATCH_SIZE = 1000
+
+# Historique d'une plage de produits, lu dans l'ordre du grand livre : source 0 = table chaude, 1 = archive
+_HISTORY_SQL = """
+    SELECT produit_id, id, source, type, quantity, stock_quantity, unit_cost, cogs, client_id FROM (
+        SELECT produit_id, id, 0 AS source, type, quantity, stock_quantity, unit_cost, cogs, client_id
+        FROM transactions WHERE produit_id BETWEEN %s AND %s
+        UNION ALL
+        SELECT produit_id, id, 1 AS source, type, quantity, stock_quantity, unit_cost, cogs, client_id
+        FROM transactions_archive WHERE produit_id BETWEEN %s AND %s
+    ) history
+    ORDER BY produit_id, id
+"""
+
+
+class WeightedAverage:
+    """
+    Cost state of one product.
+
+    :ivar quantity: Units in stock.
+    :type quantity: int
+    :ivar average: Average unit cost of these units.
+    :type average: Decimal
+    """
+
+    def __init__(self, quantity, average):
+        self.quantity = quantity
+        self.average = _decimal(average)
+
+    @classmethod
+    def of(cls, stock):
+        """
+        Returns the state of a stock item, valued at its purchase price if it never was.
+
+        :type stock: Stock
+        :rtype: WeightedAverage
+        """
+        average = stock.average_cost if stock.average_cost is not None else stock.prix_achat
+        return cls(stock.quantity, average)
+
+    def purchase(self, quantity, unit_cost):
+        """Blends ``quantity`` units bought at ``unit_cost`` into the average."""
+        on_hand = max(self.quantity, 0)  # Un stock négatif n'a pas de coût à pondérer
+        total = on_hand + quantity
+        if total > 0:
+            self.average = ((on_hand * self.average + quantity * _decimal(unit_cost)) / total).quantize(
+                AVERAGE_QUANTUM)
+        self.quantity += quantity
+
+    def sale(self, quantity):
+        """
+        Takes ``quantity`` units out of the stock.
+
+        :return: Their cost at the average.
+        :rtype: Decimal
+        """
+        self.quantity -= quantity
+        return (quantity * self.average).quantize(AMOUNT_QUANTUM)
+
+    def apply(self, type_, quantity, unit_cost):
+        """
+        Applies a transaction.
+
+        :return: The cost of the goods sold, 0 for a purchase.
+        :rtype: Decimal
+        """
+        if type_ == 'Vente':
+            return self.sale(quantity)
+        self.purchase(quantity, unit_cost)
+        return Decimal('0.00')
+
+
+def record_transaction(stock, transaction):
+    """
+    Values a new transaction and updates the cost state of its product.
+
+    Must be called with the stock row locked, before ``stock.quantity`` is
+    changed; neither object is saved.
+
+    :param stock: The stock item of the transaction.
+    :type stock: Stock
+    :param transaction: The transaction, with its ``unit_cost`` set.
+    :type transaction: Transaction
+    """
+    state = WeightedAverage.of(stock)
+    transaction.cogs = state.apply(transaction.type, transaction.quantity, transaction.unit_cost)
+    stock.average_cost = state.average
+
+
+def rebuild_costs(range_size=500, on_range=None):
+    """
+    Replays the history of every product and rewrites the costs of its sales.
+
+    The opening stock of a product (the one before its first transaction)
+    is valued at the unit cost of that first transaction. The stock rows of a
+    range are locked while it is replayed, so that no transaction is
+    recorded in between.
+
+    :param range_size: Number of products replayed per database transaction.
+    :type range_size: int
+    :param on_range: Optional callback receiving ``(ranges done, ranges total)``.
+    :type on_range: Callable[[int, int], None] or None
+    :return: The number of products replayed and of sales whose cost changed.
+    :rtype: tuple[int, int]
+    """
+    ranges = product_ranges(range_size)
+    products = changed = 0
+    for done, (first, last) in enumerate(ranges, start=1):
+        with db_transaction.atomic():
+            stocks = {stock.pk: stock for stock in Stock.objects.filter(pk__range=(first, last)).select_for_update()}
+            range_products, range_changed = _replay_range(first, last, stocks)
+        products += range_products
+        changed += range_changed
+        if on_range:
+            on_range(done, len(ranges))
+    return products, changed
+
+
+def _replay_range(first, last, stocks):
+    """Replays the history of a range of products, inside the caller's transaction."""
+    # Écritures différées : le curseur en flux doit être lu jusqu'au bout avant toute autre requête
+    updates = {0: [], 1: []}
+    archived_costs = defaultdict(Decimal)  # (produit, client) -> coût des ventes archivées
+    averages = {}
+    changed = 0
+    state, current = None, None
+
+    for produit_id, pk, source, type_, quantity, recorded_qt, unit_cost, cogs, client_id in _history(first, last):
+        if produit_id != current:
+            if current is not None:
+                averages[current] = state.average
+            current = produit_id
+            delta = quantity if type_ == 'Achat' else -quantity
+            state = WeightedAverage(recorded_qt - delta, unit_cost)
+
+        cost = state.apply(type_, quantity, unit_cost)
+        if type_ != 'Vente':
+            continue
+        if source:
+            archived_costs[(produit_id, client_id)] += cost
+        if _decimal(cogs) != cost:
+            updates[source].append((pk, cost))
+    if current is not None:
+        averages[current] = state.average
+
+    for source, model in enumerate((Transaction, ArchivedTransaction)):
+        changed += len(updates[source])
+        update_column(model, 'cogs', updates[source])
+    update_column(Stock, 'average_cost', [
+        (pk, averages[pk]) for pk, stock in stocks.items()
+        if pk in averages and stock.average_cost != averages[pk]
+    ])
+    # Les totaux archivés portent le coût des ventes archivées
+    summaries = list(TransactionSummary.objects.filter(produit_id__in=list(stocks), type='Vente'))
+    for summary in summaries:
+        summary.cost = archived_costs.get((summary.produit_id, summary.client_id), Decimal('0'))
+    TransactionSummary.objects.bulk_update(summaries, ['cost'], batch_size=REBUILD_BATCH_SIZE)
+    return len(averages), changed
+
+
+def _decimal(value):
+    # SQLite renvoie des flottants pour les colonnes décimales
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _history(first, last):
+    """Streams the transactions of a range of products, ordered by product and id."""
+    with connections[Stock.objects.db].cursor() as cursor:
+        cursor.execute(_HISTORY_SQL, [first, last, first, last])
+        while True:
+            rows = cursor.fetchmany(REBUILD_FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
@@ -0,0 +1,246 @@
+"""
+Daily demand forecasts and reorder suggestions, for every product at once.
+
+The daily sales of all the products are read with a single grouped query
+and laid out in one ``products x days`` array; every statistic is then an
+operation on the whole array (a matrix-vector product for the exponential
+smoothing, reductions along the days for the moving average and the
+deviation), without a Python loop over the products.
+
+Forecasts are computed from the complete days up to yesterday, so they only
+depend on the day: they are cached per day, and a sale does not have the
+forecast recomputed, which would happen on nearly every page at peak hours.
+The sales of today enter the history tomorrow. A data version
+stamp stored in the shared cache is bumped by the paths rewriting past
+sales (archiving). Stock quantities move more often: they are joined at
+request time by :func:`reorder_suggestions`.
+"""
+import math
+from datetime import date, datetime, time, timedelta
+from operator import itemgetter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import metrics, versioning
+from .models import Stock, Transaction
+
+VERSION_KEY = 'forecast:data_version'
+
+
+class Forecast:
+    """
+    Demand statistics of every product, aligned on ``pks``.
+
+    :ivar pks: Primary keys of the products, sorted.
+    :type pks: numpy.ndarray
+    :ivar smoothed: Exponentially smoothed daily demand, used as the forecast.
+    :type smoothed: numpy.ndarray
+    :ivar average: Mean daily demand over the last ``window`` days.
+    :type average: numpy.ndarray
+    :ivar deviation: Standard deviation of the daily demand over the same days.
+    :type deviation: numpy.ndarray
+    """
+
+    def __init__(self, pks, smoothed, average, deviation):
+        self.pks = pks
+        self.smoothed = smoothed
+        self.average = average
+        self.deviation = deviation
+
+
+def data_version():
+    """
+    Returns the current version stamp of the sales data.
+
+    :rtype: int
+    """
+    return versioning.current(VERSION_KEY)
+
+
+def bump_data_version():
+    """Invalidates the cached forecasts, after past sales were archived or rewritten."""
+    versioning.bump(VERSION_KEY)
+
+
+def daily_sales_rows(start, end):
+    """
+    Returns the quantity sold per product and day between ``start`` and ``end``, in one query.
+
+    :param start: First instant of the history.
+    :type start: datetime
+    :param end: End of the history, excluded.
+    :type end: datetime
+    :return: ``(produit_id, day, quantity)`` rows.
+    :rtype: QuerySet
+    """
+    return (
+        Transaction.objects.filter(type='Vente', time__gte=start, time__lt=end)
+        .annotate(day=TruncDate('time'))
+        .values('produit_id', 'day')
+        .annotate(total=Sum('quantity'))
+        .values_list('produit_id', 'day', 'total')
+        .order_by()
+    )
+
+
+def sales_matrix(rows, pks, first_day, days):
+    """
+    Lays quantity rows out in a ``len(pks) x days`` array.
+
+    :param rows: ``(produit_id, day, quantity)`` rows, in any order; rows of an
+        unknown product or outside the period are ignored.
+    :type rows: Iterable[tuple[int, date, int]]
+    :param pks: Primary keys of the products, sorted.
+    :type pks: numpy.ndarray
+    :param first_day: Day of the first column.
+    :type first_day: date
+    :param days: Number of columns.
+    :type days: int
+    :rtype: numpy.ndarray
+    """
+    rows = list(rows)
+    matrix = np.zeros((len(pks), days), dtype=np.float32)
+    if not rows or not len(pks):
+        return matrix
+    ids = np.fromiter(map(itemgetter(0), rows), dtype=np.int64, count=len(rows))
+    # Numéros de jour : bien plus rapide que la conversion des objets date en datetime64
+    columns = np.fromiter(map(date.toordinal, map(itemgetter(1), rows)), dtype=np.int64,
+                          count=len(rows)) - first_day.toordinal()
+    quantities = np.fromiter(map(itemgetter(2), rows), dtype=np.float64, count=len(rows))
+    positions = np.minimum(np.searchsorted(pks, ids), len(pks) - 1)
+    valid = (pks[positions] == ids) & (columns >= 0) & (columns < days)
+    # bincount additionne les éventuels doublons (jour découpé par le fuseau horaire)
+    flat = np.bincount(positions[valid] * days + columns[valid],
+                       weights=quantities[valid],
+                       minlength=len(pks) * days)
+    return flat.reshape(len(pks), days).astype(np.float32)
+
+
+def smoothing_weights(days, alpha):
+    """
+    Returns the weights of the simple exponential smoothing of ``days`` values.
+
+    The level after the last day, ``l(t) = alpha * x(t) + (1 - alpha) * l(t - 1)``
+    started at ``l(0) = x(0)``, is the dot product of the series with these weights.
+
+    :rtype: numpy.ndarray
+    """
+    ages = np.arange(days - 1, -1, -1, dtype=np.float64)
+    weights = alpha * (1 - alpha) ** ages
+    weights[0] = (1 - alpha) ** (days - 1)
+    return weights.astype(np.float32)
+
+
+def compute_forecast(matrix, pks, alpha, window):
+    """
+    Computes the demand statistics of every row of a sales matrix.
+
+    :param matrix: Daily sales, one row per product, oldest day first.
+    :type matrix: numpy.ndarray
+    :param pks: Primary keys of the rows.
+    :type pks: numpy.ndarray
+    :param alpha: Smoothing factor, between 0 and 1.
+    :type alpha: float
+    :param window: Days of the moving average and of the deviation.
+    :type window: int
+    :rtype: Forecast
+    """
+    recent = matrix[:, -window:]
+    return Forecast(
+        pks=pks,
+        smoothed=matrix @ smoothing_weights(matrix.shape[1], alpha),
+        average=recent.mean(axis=1),
+        deviation=recent.std(axis=1),
+    )
+
+
+def current_forecast(now=None):
+    """
+    Returns the forecast of every product from the sales history, cached per data version.
+
+    The history covers the ``settings.FORECAST_HISTORY_DAYS`` days up to yesterday:
+    the sales of today, still partial, would read as a drop in demand.
+
+    :param now: Reference time, now by default.
+    :type now: datetime or None
+    :rtype: Forecast
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    days, alpha, window = settings.FORECAST_HISTORY_DAYS, settings.FORECAST_ALPHA, settings.FORECAST_WINDOW_DAYS
+    key = f"forecast:{data_version()}:{today}:{days}:{alpha}:{window}"
+    forecast = cache.get(key)
+    metrics.record_cache_lookup('forecast', forecast is not None)
+    if forecast is None:
+        first_day = today - timedelta(days=days)
+        start = timezone.make_aware(datetime.combine(first_day, time.min))
+        end = timezone.make_aware(datetime.combine(today, time.min))
+        pks = np.fromiter(Stock.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+        matrix = sales_matrix(daily_sales_rows(start, end), pks, first_day, days)
+        forecast = compute_forecast(matrix, pks, alpha, min(window, days))
+        cache.set(key, forecast, settings.FORECAST_CACHE_TIMEOUT)
+    return forecast
+
+
+def stock_levels():
+    """
+    Returns the primary key and current quantity of every product, in one query.
+
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    rows = list(Stock.objects.order_by('pk').values_list('pk', 'quantity'))
+    pks = np.fromiter((pk for pk, _ in rows), dtype=np.int64, count=len(rows))
+    quantities = np.fromiter((quantity for _, quantity in rows), dtype=np.int64, count=len(rows))
+    return pks, quantities
+
+
+def reorder_suggestions(forecast, pks, quantities, lead_days=None, cover_days=None, service_z=None):
+    """
+    Computes the reorder point and the quantity to order of every product.
+
+    The safety stock covers ``service_z`` deviations of the demand over the
+    lead time; an order is suggested when the stock is at or below the
+    reorder point, for enough units to last the lead time plus ``cover_days``.
+
+    :param forecast: The demand forecast.
+    :type forecast: Forecast
+    :param pks: Primary keys of the products to evaluate.
+    :type pks: numpy.ndarray
+    :param quantities: Their current stock quantity.
+    :type quantities: numpy.ndarray
+    :return: Arrays aligned on ``pks``: ``demand``, ``average``, ``reorder_point``,
+        ``cover`` (days of stock left, ``inf`` without demand) and ``order``.
+    :rtype: dict[str, numpy.ndarray]
+    """
+    lead_days = settings.REORDER_LEAD_DAYS if lead_days is None else lead_days
+    cover_days = settings.REORDER_COVER_DAYS if cover_days is None else cover_days
+    service_z = settings.REORDER_SERVICE_Z if service_z is None else service_z
+
+    # Produits créés après le calcul de la prévision : pas de demande connue (case ajoutée à zéro)
+    positions = np.searchsorted(forecast.pks, pks)
+    known = positions < len(forecast.pks)
+    known[known] = forecast.pks[positions[known]] == pks[known]
+    positions = np.where(known, positions, len(forecast.pks))
+    demand, average, deviation = (
+        np.append(values, 0).astype(np.float64)[positions]
+        for values in (forecast.smoothed, forecast.average, forecast.deviation)
+    )
+
+    safety = service_z * deviation * math.sqrt(lead_days)
+    reorder_point = demand * lead_days + safety
+    target = demand * (lead_days + cover_days) + safety
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(demand > 0, quantities / demand, np.inf)
+    order = np.where((demand > 0) & (quantities <= reorder_point), np.ceil(np.maximum(target - quantities, 0)), 0)
+    return {
+        'demand': demand,
+        'average': average,
+        'reorder_point': reorder_point,
+        'cover': cover,
+        'order': order.astype(np.int64),
+    }
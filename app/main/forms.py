@@ -1,6 +1,8 @@
 from django import forms
+from django.urls import reverse_lazy
 
 from .models import Stock, Transaction, Client
+from .widgets import AutocompleteSelect
 
 
 class StockForm(forms.ModelForm):
@@ -42,6 +44,11 @@ class TransactionForm(forms.ModelForm):
     class Meta:
         model = Transaction
         fields = ['type', 'produit', 'quantity', 'client']
+        # Choix chargés à la demande : pas de <option> pour chaque produit / client
+        widgets = {
+            'produit': AutocompleteSelect(url=reverse_lazy('main:autocomplete_stock')),
+            'client': AutocompleteSelect(url=reverse_lazy('main:autocomplete_client')),
+        }
 
 
 class ClientForm(forms.ModelForm):
@@ -61,3 +68,20 @@ class ClientForm(forms.ModelForm):
     class Meta:
         model = Client
         fields = ['name', 'surname', 'type']
+
+
+class StockImportForm(forms.Form):
+    """
+    Represents the upload form of a supplier catalog.
+
+    The uploaded CSV file is upserted into the Stock table by
+    :func:`main.stock_import.import_stock_csv`.
+
+    :ivar fichier: The CSV file, with a header containing at least ``produit``.
+    :type fichier: UploadedFile
+    """
+    fichier = forms.FileField(
+        label="Fichier CSV",
+        help_text="Colonnes : produit, quantity, prix_vente, prix_achat. "
+                  "La quantité n'est reprise que pour les nouveaux produits.",
+    )
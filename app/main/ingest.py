@@ -0,0 +1,218 @@
+"""
+Write path of the transactions.
+
+:func:`save_transaction` records one transaction in its own database
+transaction, the stock row locked while it is applied.
+
+With ``settings.INGEST_GROUP_COMMIT``, sales are handed to the
+:class:`GroupCommitter` of the process instead: the sales queued by all the
+requests of the worker are flushed every ``INGEST_FLUSH_MS`` milliseconds (or
+``INGEST_BATCH_SIZE`` sales) as one database transaction. The stock rows of
+the batch are locked once, the transactions are inserted with one
+``bulk_create`` and the stock rows updated with one statement per column. The
+caller blocks until its batch is committed, so its acknowledgement is as
+durable as with the direct path; it stops waiting after
+``INGEST_SUBMIT_TIMEOUT`` seconds, should the flushing thread be stuck.
+
+``bulk_create`` sends no ``post_save`` signal: the hooks of
+:mod:`main.signals` (leaderboards, live dashboard) are called explicitly
+once the batch is committed.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+
+from . import costing, leaderboards, live, metrics
+from .ledger import update_column
+from .models import Stock, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def apply_to_stock(stock, transaction):
+    """
+    Prices a transaction at the current prices of its product and applies it to the stock.
+
+    Must be called with the stock row locked; neither object is saved.
+
+    :param stock: The stock item of the transaction.
+    :type stock: Stock
+    :param transaction: The new transaction.
+    :type transaction: Transaction
+    :raises ValueError: When a sale exceeds the quantity in stock; nothing is changed then.
+    """
+    if transaction.type == 'Vente' and stock.quantity < transaction.quantity:
+        raise ValueError("Stock insuffisant !")
+    transaction.produit = stock
+
+    # Record the prices of the moment: later price changes do not alter past totals
+    transaction.unit_price = stock.prix_vente
+    transaction.unit_cost = stock.prix_achat
+    # Cost of the goods sold at the weighted average, before the quantity changes
+    costing.record_transaction(stock, transaction)
+
+    if transaction.type == 'Vente':
+        transaction.price = transaction.unit_price * transaction.quantity
+        stock.quantity -= transaction.quantity
+    else:  # Achat
+        transaction.price = transaction.unit_cost * transaction.quantity
+        stock.quantity += transaction.quantity
+    transaction.new_stock_qt = stock.quantity
+
+
+def save_transaction(transaction):
+    """
+    Records a transaction and updates its stock item, in one database transaction.
+
+    :param transaction: The new, unsaved transaction.
+    :type transaction: Transaction
+    :return: The saved transaction.
+    :rtype: Transaction
+    :raises ValueError: When a sale exceeds the quantity in stock.
+    """
+    with db_transaction.atomic():
+        # Verrou de la ligne de stock : les écritures concurrentes se suivent
+        stock = Stock.objects.select_for_update().get(pk=transaction.produit_id)
+        apply_to_stock(stock, transaction)
+        stock.save()
+        transaction.save()
+    metrics.TRANSACTIONS_WRITTEN.inc(type=transaction.type)
+    return transaction
+
+
+class GroupCommitter:
+    """
+    Queues transactions from any thread and commits them by batches, from one flushing thread.
+
+    :ivar batch_size: Maximum number of transactions per database transaction.
+    :type batch_size: int
+    :ivar flush_interval: Longest wait, in seconds, between the first queued transaction and its flush.
+        Only waited under load: after a batch of one, the next transaction is flushed with whatever
+        is already queued, so that a lone till pays no delay.
+    :type flush_interval: float
+    :ivar submit_timeout: Longest wait, in seconds, of a caller for the commit of its transaction.
+    :type submit_timeout: float
+    """
+
+    def __init__(self, batch_size, flush_interval, submit_timeout):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._grouping = False
+
+    def submit(self, transaction):
+        """
+        Queues a transaction and waits until its batch is committed.
+
+        :param transaction: The new, unsaved transaction.
+        :type transaction: Transaction
+        :return: The saved transaction (its ``pk`` is only set on backends returning
+            the ids of ``bulk_create``).
+        :rtype: Transaction
+        :raises ValueError: When a sale exceeds the quantity in stock.
+        :raises TimeoutError: When the batch was not committed within ``submit_timeout`` seconds;
+            the transaction may still be committed later.
+        """
+        future = Future()
+        self._start()
+        self._queue.put((transaction, future))
+        try:
+            return future.result(timeout=self.submit_timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Transaction non écrite après {self.submit_timeout} s") from None
+
+    def _start(self):
+        # Thread créé à la première écriture : après le fork des workers
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                deadline = time.monotonic() + (self.flush_interval if self._grouping else 0)
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        # Ventes déjà en file toujours prises, attente seulement jusqu'à l'échéance
+                        batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._grouping = len(batch) > 1
+                self._flush(batch)
+            except Exception as error:
+                # Le thread doit survivre : sans lui, tous les appelants suivants attendraient en vain
+                logger.exception("Écriture groupée interrompue")
+                for _transaction, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _flush(self, batch):
+        close_old_connections()
+        try:
+            accepted, rejected = self._commit(batch)
+        except Exception as error:  # Lot annulé : chaque appelant reçoit l'erreur
+            for _transaction, future in batch:
+                future.set_exception(error)
+            return
+
+        # Ventes écrites : les appelants sont servis avant les effets secondaires, qui ne peuvent plus les annuler
+        for future, error in rejected:
+            future.set_exception(error)
+        for transaction, future in accepted:
+            future.set_result(transaction)
+        if not accepted:
+            return
+        try:
+            metrics.TRANSACTIONS_WRITTEN.inc(len(accepted), type='Vente')
+            leaderboards.record(
+                entry for transaction, _future in accepted for entry in leaderboards.transaction_entries(transaction)
+            )
+            for transaction, _future in accepted:
+                live.broadcaster.publish(live.transaction_event(transaction))
+        except Exception:
+            logger.exception("Classements ou flux en direct non mis à jour après l'écriture de %d vente(s)", len(accepted))
+
+    @staticmethod
+    def _commit(batch):
+        accepted, rejected = [], []
+        with db_transaction.atomic():
+            # Verrous pris dans l'ordre des clés : pas d'interblocage avec les autres écritures
+            stocks = {
+                stock.pk: stock for stock in
+                Stock.objects.filter(pk__in={transaction.produit_id for transaction, _future in batch})
+                .order_by('pk').select_for_update()
+            }
+            for transaction, future in batch:
+                stock = stocks.get(transaction.produit_id)
+                try:
+                    if stock is None:
+                        raise Stock.DoesNotExist(f"Produit {transaction.produit_id} introuvable")
+                    apply_to_stock(stock, transaction)
+                except (ValueError, Stock.DoesNotExist) as error:
+                    rejected.append((future, error))
+                else:
+                    accepted.append((transaction, future))
+
+            if accepted:
+                Transaction.objects.bulk_create([transaction for transaction, _future in accepted])
+                touched = [stocks[pk] for pk in sorted({transaction.produit_id for transaction, _future in accepted})]
+                update_column(Stock, 'quantity', [(stock.pk, stock.quantity) for stock in touched])
+                update_column(Stock, 'average_cost', [(stock.pk, stock.average_cost) for stock in touched])
+        return accepted, rejected
+
+
+committer = GroupCommitter(
+    settings.INGEST_BATCH_SIZE, settings.INGEST_FLUSH_MS / 1000, settings.INGEST_SUBMIT_TIMEOUT,
+)
@@ -0,0 +1,284 @@
+"""
+Rolling leaderboards of the dashboard: most sold and most bought products, best clients.
+
+Each leaderboard is kept in the shared cache as one bucket per day, mapping
+a product (or client) to its label and its total of the day. A committed
+transaction is added to the bucket of its day (:func:`record`), and buckets
+older than ``settings.LEADERBOARD_RETENTION_DAYS`` simply expire. The top of
+a window of any length up to the retention is merged from the buckets
+without a query, then cached until the next write, so that a page reads it
+with two cache lookups. The past days of a window only change once a day:
+they are merged once, and a write only costs the next reader a pass over
+the bucket of the day and the first ``limit`` past leaders.
+
+A bucket missing from the cache (cold start, cache cleared) is read from the
+database, in one grouped query for all the missing days. A past day is read
+once more after it is over ("sealed"): writes racing with the first read of
+a bucket can only be missed until then. Deleting a product or a client bumps
+a version stamp, which drops every bucket; ``manage.py rebuild_leaderboards``
+does the same and rebuilds them at once.
+"""
+import heapq
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import versioning
+from .models import Transaction
+
+VERSION_KEY = 'leaderboards:data_version'
+LOCK_TIMEOUT = 5  # Secondes avant qu'un verrou abandonné (worker tué) ne se libère
+LOCK_WAIT = 1.0
+
+Board = namedtuple('Board', 'type member labels value')
+Leader = namedtuple('Leader', 'id label total')
+
+BOARDS = {
+    'sold': Board('Vente', 'produit_id', ('produit__produit',), F('quantity')),
+    'bought': Board('Achat', 'produit_id', ('produit__produit',), F('quantity')),
+    'clients': Board('Vente', 'client_id', ('client__name', 'client__surname'), ExpressionWrapper(
+        F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2))),
+}
+
+
+def data_version():
+    """
+    Returns the current version stamp of the buckets.
+
+    :rtype: int
+    """
+    return versioning.current(VERSION_KEY)
+
+
+def bump_data_version():
+    """Drops every bucket, after a product or a client was deleted."""
+    versioning.bump(VERSION_KEY)
+
+
+def transaction_entries(transaction):
+    """
+    Returns the contributions of a new transaction to the leaderboards.
+
+    Only reads the transaction, its product and its client, already loaded by the write path.
+
+    :param transaction: The saved transaction.
+    :type transaction: Transaction
+    :return: ``(board, day, member, label, value, transaction id)`` tuples.
+    :rtype: list[tuple]
+    """
+    day = timezone.localtime(transaction.time).date()
+    entries = []
+    for name, board in BOARDS.items():
+        if board.type != transaction.type:
+            continue
+        if board.member == 'client_id':
+            if transaction.client_id is None:
+                continue
+            client = transaction.client
+            label, value = f"{client.name} {client.surname}", transaction.quantity * transaction.unit_price
+        else:
+            label, value = transaction.produit.produit, transaction.quantity
+        entries.append((name, day, getattr(transaction, board.member), label, value, transaction.pk))
+    return entries
+
+
+def record(entries):
+    """
+    Adds committed transactions to the buckets of their day.
+
+    A bucket that is not in the cache is left alone: its first read gets the
+    transactions from the database.
+
+    :param entries: As returned by :func:`transaction_entries`.
+    :type entries: Iterable[tuple]
+    """
+    version = data_version()
+    by_bucket = {}
+    for name, day, member, label, value, pk in entries:
+        by_bucket.setdefault((name, day), []).append((member, label, value, pk))
+
+    for (name, day), additions in by_bucket.items():
+        key = _bucket_key(version, name, day)
+        with _locked(key):
+            bucket = cache.get(key)
+            if bucket is None:
+                continue
+            for member, label, value, pk in additions:
+                # Sans id (bulk_create sans RETURNING) : forcément postérieure à la lecture du seau
+                if pk is not None and pk <= bucket['last_id']:
+                    continue
+                totals = bucket['totals'].setdefault(member, [label, 0])
+                totals[0] = label  # Libellé le plus récent (produit ou client renommé)
+                totals[1] += value
+            cache.set(key, bucket, timeout=_bucket_timeout())
+        versioning.bump(_stamp_key(version, name))
+
+
+def top(name, days=None, limit=5):
+    """
+    Returns the leaders of a board over the last ``days`` days, today included.
+
+    :param name: The board: ``"sold"``, ``"bought"`` or ``"clients"``.
+    :type name: str
+    :param days: Length of the window, ``settings.LEADERBOARD_WINDOW_DAYS`` by default.
+    :type days: int or None
+    :param limit: Number of leaders.
+    :type limit: int
+    :return: The leaders, best first.
+    :rtype: list[Leader]
+    :raises ValueError: When the window exceeds ``settings.LEADERBOARD_RETENTION_DAYS``.
+    """
+    days = days or settings.LEADERBOARD_WINDOW_DAYS
+    if not 0 < days <= settings.LEADERBOARD_RETENTION_DAYS:
+        raise ValueError(f"Fenêtre de {days} jour(s) hors de la rétention des classements")
+    version, today = data_version(), timezone.localdate()
+    stamp_key, top_key = _stamp_key(version, name), f"leaderboards:{version}:{name}:top:{today}:{days}:{limit}"
+    # Numéro d'écriture lu avant les seaux : une écriture pendant la fusion invalide le résultat
+    cached = cache.get_many([stamp_key, top_key])
+    if stamp_key not in cached:
+        cached[stamp_key] = versioning.current(stamp_key)
+    stamp = cached[stamp_key]
+    if top_key in cached and cached[top_key][0] == stamp:
+        return cached[top_key][1]
+
+    # Seul le seau du jour change dans la journée : les jours passés sont fusionnés une fois par jour
+    past = _past_totals(version, name, days, today)
+    today_totals = _buckets(version, name, [today], today)[0]['totals']
+    candidates = {
+        member: (label, past['totals'].get(member, (label, 0))[1] + value)
+        for member, (label, value) in today_totals.items()
+    }
+    # Sans vente du jour, le rang d'un membre est celui des jours passés : les premiers suffisent
+    remaining = limit
+    for member in past['ranking']:
+        if remaining == 0:
+            break
+        if member not in candidates:
+            candidates[member] = past['totals'][member]
+            remaining -= 1
+    leaders = [
+        Leader(member, label, value)
+        for member, (label, value) in heapq.nlargest(limit, candidates.items(), key=lambda item: item[1][1])
+    ]
+    cache.set(top_key, (stamp, leaders), timeout=86400)
+    return leaders
+
+
+def window_start(days=None):
+    """
+    Returns midnight of the first day of the window of :func:`top`, today being its last day.
+
+    :param days: Length of the window, ``settings.LEADERBOARD_WINDOW_DAYS`` by default.
+    :type days: int or None
+    :rtype: datetime
+    """
+    first_day = timezone.localdate() - timedelta(days=(days or settings.LEADERBOARD_WINDOW_DAYS) - 1)
+    return timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+
+
+def rebuild(days=None):
+    """
+    Drops every bucket and reads them again from the database.
+
+    :param days: Number of days rebuilt, ``settings.LEADERBOARD_RETENTION_DAYS`` by default.
+    :type days: int or None
+    :return: The number of buckets written.
+    :rtype: int
+    """
+    bump_data_version()
+    version, today = data_version(), timezone.localdate()
+    dates = [today - timedelta(days=offset) for offset in range(days or settings.LEADERBOARD_RETENTION_DAYS)]
+    return sum(len(_buckets(version, name, dates, today)) for name in BOARDS)
+
+
+def _past_totals(version, name, days, today):
+    key = f"leaderboards:{version}:{name}:past:{today}:{days}"
+    past = cache.get(key)
+    if past is None:
+        totals = {}
+        for bucket in _buckets(version, name, [today - timedelta(days=offset) for offset in range(1, days)], today):
+            for member, (label, value) in bucket['totals'].items():
+                merged = totals.setdefault(member, [label, 0])
+                merged[1] += value
+        ranking = sorted(totals, key=lambda member: totals[member][1], reverse=True)
+        past = {'totals': totals, 'ranking': ranking}
+        cache.set(key, past, timeout=86400)
+    return past
+
+
+def _buckets(version, name, dates, today):
+    keys = {_bucket_key(version, name, day): day for day in dates}
+    found = cache.get_many(list(keys))
+    # Seau absent, ou écrit avant la fin de sa journée : relu en base
+    missing = [day for key, day in keys.items() if key not in found or (day < today and not found[key]['sealed'])]
+    if missing:
+        for day, bucket in _read_buckets(name, min(missing), max(missing), today).items():
+            if day in missing:
+                key = _bucket_key(version, name, day)
+                with _locked(key):
+                    cache.set(key, bucket, timeout=_bucket_timeout())
+                found[key] = bucket
+    return [found[key] for key in keys]
+
+
+def _read_buckets(name, first_day, last_day, today):
+    board = BOARDS[name]
+    last_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+    start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), datetime.min.time()))
+    rows = (
+        Transaction.objects
+        .filter(type=board.type, time__gte=start, time__lt=end, id__lte=last_id, **{f'{board.member}__isnull': False})
+        .annotate(day=TruncDate('time'))
+        .values('day', board.member, *board.labels)
+        .annotate(total=Sum(board.value))
+        .values_list('day', board.member, *board.labels, 'total')
+        .order_by()
+    )
+    buckets = {
+        first_day + timedelta(days=offset): {'last_id': last_id, 'sealed': first_day + timedelta(days=offset) < today,
+                                             'totals': {}}
+        for offset in range((last_day - first_day).days + 1)
+    }
+    for day, member, *labels, total in rows:
+        if board.member == 'client_id':
+            # SQLite renvoie des flottants pour les colonnes décimales
+            total = total if isinstance(total, Decimal) else Decimal(str(total))
+        buckets[day]['totals'][member] = [' '.join(labels), total]
+    return buckets
+
+
+@contextmanager
+def _locked(key):
+    lock_key, deadline = f"{key}:lock", time.monotonic() + LOCK_WAIT
+    acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.002)
+        acquired = cache.add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    try:
+        yield  # Verrou non obtenu à temps : on écrit quand même, le seau sera relu une fois scellé
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def _bucket_key(version, name, day):
+    return f"leaderboards:{version}:{name}:{day.isoformat()}"
+
+
+def _bucket_timeout():
+    # Un seau sert tant qu'il entre dans la plus longue fenêtre, plus un jour de marge
+    return (settings.LEADERBOARD_RETENTION_DAYS + 1) * 86400
+
+
+def _stamp_key(version, name):
+    return f"leaderboards:{version}:{name}:stamp"
+
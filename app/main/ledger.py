@@ -0,0 +1,335 @@
+"""
+Stock ledger: verification of the ``new_stock_qt`` chain and snapshots.
+
+The transactions of a product, hot and archived, ordered by primary key,
+form its ledger: the ``new_stock_qt`` of a transaction must be the one of the
+previous transaction plus the quantity of a purchase, or minus the quantity
+of a sale, and ``Stock.quantity`` must be the last value of the chain. A
+hand edit of the quantity or a deleted transaction breaks this, which
+:func:`reconcile` detects with window functions evaluated by the database,
+one range of products at a time, several ranges in parallel.
+
+Once the ledger of a product is verified, a :class:`~main.models.StockSnapshot`
+records its last transaction and quantity: the next runs start from it and
+only read the transactions recorded since.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.db import connections, transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Stock, Transaction, ArchivedTransaction, StockSnapshot
+
+MAX_REPORTED_BREAKS = 5  # Ruptures gardées par produit pour le rapport, les autres sont seulement comptées
+REPAIR_BATCH_SIZE = 1000
+
+# Une ligne par transaction du grand livre : source 0 = table chaude, 1 = archive
+_LEDGER_SQL = """
+    SELECT t.id, t.produit_id, {source} AS source, t.stock_quantity,
+           CASE WHEN t.type = %s THEN t.quantity ELSE -t.quantity END AS delta,
+           s.quantity AS opening
+    FROM {table} t
+    LEFT JOIN ({snapshots}) s ON s.produit_id = t.produit_id
+    WHERE t.produit_id BETWEEN %s AND %s
+      AND (s.last_transaction_id IS NULL OR t.id > s.last_transaction_id)
+"""
+
+# Dernier instantané de chaque produit ; la table dérivée groupée est matérialisée une seule fois
+_SNAPSHOTS_SQL = """
+    SELECT s.produit_id, s.last_transaction_id, s.quantity FROM stock_snapshots s
+    JOIN (SELECT MAX(id) AS id FROM stock_snapshots WHERE produit_id BETWEEN %s AND %s GROUP BY produit_id) latest
+      ON latest.id = s.id
+"""
+
+_NO_SNAPSHOTS_SQL = "SELECT produit_id, last_transaction_id, quantity FROM stock_snapshots WHERE 1 = 0"
+
+# Sans instantané, le solde d'ouverture est celui qui précède la première transaction
+_CHAIN_SQL = """
+    SELECT produit_id, id, source, stock_quantity, previous, delta, running, next_id
+    FROM (
+        SELECT l.produit_id, l.id, l.source, l.stock_quantity, l.delta,
+               COALESCE(LAG(l.stock_quantity) OVER (PARTITION BY l.produit_id ORDER BY l.id), l.opening)
+                   AS previous,
+               COALESCE(l.opening, FIRST_VALUE(l.stock_quantity - l.delta)
+                                       OVER (PARTITION BY l.produit_id ORDER BY l.id))
+                   + SUM(l.delta) OVER (PARTITION BY l.produit_id ORDER BY l.id ROWS UNBOUNDED PRECEDING)
+                   AS running,
+               LEAD(l.id) OVER (PARTITION BY l.produit_id ORDER BY l.id) AS next_id
+        FROM ({hot} UNION ALL {archive}) l
+    ) chain
+    WHERE previous + delta <> stock_quantity OR next_id IS NULL{repair}
+"""
+
+
+class ProductLedger:
+    """
+    Result of the verification of the ledger of one product.
+
+    :ivar produit_id: Primary key of the stock item.
+    :type produit_id: int
+    :ivar stock_quantity: ``Stock.quantity`` at the time of the verification.
+    :type stock_quantity: int
+    :ivar ledger_quantity: Quantity obtained by replaying the transactions, ``None``
+        when the product has neither transaction nor snapshot.
+    :type ledger_quantity: int or None
+    :ivar last_transaction_id: Last transaction read, ``None`` when none was
+        recorded since the snapshot.
+    :type last_transaction_id: int or None
+    :ivar break_count: Number of transactions whose ``new_stock_qt`` does not follow
+        from the previous one.
+    :type break_count: int
+    :ivar breaks: The first breaks, as ``(transaction id, recorded, expected)``.
+    :type breaks: list[tuple[int, int, int]]
+    :ivar corrections: With ``repair``, the ``(source, transaction id, quantity)`` to
+        write, source being 0 for the hot table and 1 for the archive.
+    :type corrections: list[tuple[int, int, int]]
+    :ivar negative: The replayed quantity drops below zero at some point.
+    :type negative: bool
+    :ivar repaired: The ledger and the stock quantity were rewritten.
+    :type repaired: bool
+    """
+
+    def __init__(self, produit_id, stock_quantity):
+        self.produit_id = produit_id
+        self.stock_quantity = stock_quantity
+        self.ledger_quantity = None
+        self.last_transaction_id = None
+        self.break_count = 0
+        self.breaks = []
+        self.corrections = []
+        self.negative = False
+        self.repaired = False
+
+    @property
+    def diverges(self):
+        return bool(self.break_count) or (
+            self.ledger_quantity is not None and self.ledger_quantity != self.stock_quantity
+        )
+
+    @property
+    def repairable(self):
+        return not self.negative and (self.ledger_quantity or 0) >= 0
+
+
+def product_ranges(range_size):
+    """
+    Splits the products into ranges of consecutive primary keys.
+
+    :param range_size: Number of products per range.
+    :type range_size: int
+    :return: ``(first pk, last pk)`` bounds, inclusive.
+    :rtype: list[tuple[int, int]]
+    """
+    pks = list(Stock.objects.order_by('pk').values_list('pk', flat=True))
+    return [(chunk[0], chunk[-1]) for chunk in (pks[i:i + range_size] for i in range(0, len(pks), range_size))]
+
+
+def check_range(first, last, full=False, repair=False, snapshot=False, keep_days=90):
+    """
+    Verifies the ledger of the products of a range, in the current thread.
+
+    With ``repair``, the stock rows of the range are locked for the duration
+    of the verification and the ledger is taken as the reference: every
+    ``new_stock_qt`` after a break is rewritten with the replayed quantity,
+    and so is ``Stock.quantity``. Products whose replayed quantity drops
+    below zero (a purchase is missing) are left untouched.
+
+    :param first: First primary key of the range.
+    :type first: int
+    :param last: Last primary key of the range.
+    :type last: int
+    :param full: Ignore the snapshots and replay the whole history.
+    :type full: bool
+    :param repair: Rewrite the divergent ledgers.
+    :type repair: bool
+    :param snapshot: Record a snapshot of the products whose ledger is consistent.
+    :type snapshot: bool
+    :param keep_days: Age beyond which the older snapshots of a product just
+        snapshotted are deleted.
+    :type keep_days: int
+    :return: The ledger of every product of the range that has one.
+    :rtype: list[ProductLedger]
+    """
+    with db_transaction.atomic():
+        stocks = Stock.objects.filter(pk__range=(first, last)).order_by('pk')
+        if repair:
+            stocks = stocks.select_for_update()
+        ledgers = {pk: ProductLedger(pk, quantity) for pk, quantity in stocks.values_list('pk', 'quantity')}
+        snapshots = {} if full else _latest_snapshots(first, last)
+        for pk, snapshot_row in snapshots.items():
+            if pk in ledgers:
+                ledgers[pk].ledger_quantity = snapshot_row[1]
+
+        for produit_id, pk, source, recorded, previous, delta, running, next_id in _chain(first, last, full, repair):
+            ledger = ledgers.get(produit_id)
+            if ledger is None:  # Produit supprimé pendant la lecture
+                continue
+            if previous is not None and previous + delta != recorded:
+                ledger.break_count += 1
+                if len(ledger.breaks) < MAX_REPORTED_BREAKS:
+                    ledger.breaks.append((pk, recorded, previous + delta))
+            if running < 0:
+                ledger.negative = True
+            if repair and running != recorded:
+                ledger.corrections.append((source, pk, running))
+            if next_id is None:
+                ledger.last_transaction_id = pk
+                ledger.ledger_quantity = running
+
+        if repair:
+            _repair([ledger for ledger in ledgers.values() if ledger.diverges and ledger.repairable])
+
+    if snapshot:
+        _snapshot(ledgers.values(), keep_days)
+    return [ledger for ledger in ledgers.values() if ledger.ledger_quantity is not None]
+
+
+def reconcile(workers=4, range_size=500, full=False, repair=False, snapshot=False, keep_days=90, on_range=None):
+    """
+    Verifies the ledger of every product, several ranges of products in parallel.
+
+    Each range runs in a thread of its own, on its own database connection:
+    the work is done by the database, the threads only wait for it.
+
+    :param workers: Number of ranges verified at the same time.
+    :type workers: int
+    :param range_size: Number of products per range.
+    :type range_size: int
+    :param on_range: Optional callback receiving ``(ranges done, ranges total)``.
+    :type on_range: Callable[[int, int], None] or None
+    :return: The number of products verified and the divergent ledgers, by product.
+    :rtype: tuple[int, list[ProductLedger]]
+
+    The other parameters are those of :func:`check_range`.
+    """
+    ranges = product_ranges(range_size)
+    checked, divergent = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ledger') as executor:
+        futures = [
+            executor.submit(_check_range_in_thread, first, last, full, repair, snapshot, keep_days)
+            for first, last in ranges
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            ledgers = future.result()
+            checked += len(ledgers)
+            divergent.extend(ledger for ledger in ledgers if ledger.diverges or ledger.repaired)
+            if on_range:
+                on_range(done, len(ranges))
+    divergent.sort(key=lambda ledger: ledger.produit_id)
+    return checked, divergent
+
+
+def update_column(model, field, values):
+    """
+    Writes one column of many rows, a batch of rows per ``UPDATE ... CASE`` statement.
+
+    Much cheaper than ``bulk_update`` for hundreds of thousands of rows: the
+    statement is built as plain SQL instead of one expression per object.
+    Must be called inside a transaction.
+
+    :param model: The model of the rows.
+    :type model: type[Model]
+    :param field: Name of the field to write.
+    :type field: str
+    :param values: ``(primary key, value)`` pairs.
+    :type values: list[tuple[int, object]]
+    """
+    connection = connections[model.objects.db]
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field)
+    pk_column = quote(model._meta.pk.column)
+    # Trois paramètres par ligne, dans la limite du moteur (999 pour SQLite)
+    batch_size = min(REPAIR_BATCH_SIZE, (connection.features.max_query_params or 3 * REPAIR_BATCH_SIZE) // 3)
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            params = []
+            for pk, value in batch:
+                params += [pk, column.get_db_prep_save(value, connection)]
+            params += [pk for pk, _value in batch]
+            cursor.execute(
+                f"UPDATE {quote(model._meta.db_table)} SET {quote(column.column)} = CASE {pk_column} "
+                f"{'WHEN %s THEN %s ' * len(batch)}END "
+                f"WHERE {pk_column} IN ({', '.join(['%s'] * len(batch))})",
+                params,
+            )
+
+
+def _check_range_in_thread(*args):
+    try:
+        return check_range(*args)
+    finally:
+        # Le pool de connexions récupère la connexion du thread
+        connections.close_all()
+
+
+def _latest_snapshots(first, last):
+    """Returns ``{produit_id: (last_transaction_id, quantity)}`` for the latest snapshot of each product."""
+    latest = (
+        StockSnapshot.objects.filter(produit_id__gte=first, produit_id__lte=last)
+        .values('produit_id').annotate(last_id=Max('id')).values('last_id')
+    )
+    return {
+        produit_id: (last_transaction_id, quantity)
+        for produit_id, last_transaction_id, quantity in StockSnapshot.objects.filter(id__in=latest)
+        .values_list('produit_id', 'last_transaction_id', 'quantity')
+    }
+
+
+def _chain(first, last, full, repair):
+    """Runs the window query over the ledger of a range and yields its rows."""
+    connection = connections[Stock.objects.db]
+    snapshots = _NO_SNAPSHOTS_SQL if full else _SNAPSHOTS_SQL
+    snapshot_params = [] if full else [first, last]
+    branches, params = [], []
+    for source, model in enumerate((Transaction, ArchivedTransaction)):
+        branches.append(_LEDGER_SQL.format(source=source, table=model._meta.db_table, snapshots=snapshots))
+        params += ['Achat', *snapshot_params, first, last]
+    sql = _CHAIN_SQL.format(
+        hot=branches[0], archive=branches[1],
+        # En réparation, toutes les transactions dont la quantité diffère de la quantité rejouée
+        repair=' OR running <> stock_quantity' if repair else '',
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(REPAIR_BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def _repair(ledgers):
+    """Writes the replayed quantities of divergent ledgers, inside the caller's transaction."""
+    by_source = {0: [], 1: []}
+    stocks = []
+    for ledger in ledgers:
+        for source, pk, quantity in ledger.corrections:
+            by_source[source].append((pk, quantity))
+        if ledger.ledger_quantity != ledger.stock_quantity:
+            stocks.append((ledger.produit_id, ledger.ledger_quantity))
+        ledger.repaired = True
+    update_column(Transaction, 'new_stock_qt', by_source[0])
+    update_column(ArchivedTransaction, 'new_stock_qt', by_source[1])
+    update_column(Stock, 'quantity', stocks)
+
+
+def _snapshot(ledgers, keep_days):
+    """Records a snapshot of the consistent ledgers that moved since their last snapshot."""
+    snapshots = [
+        StockSnapshot(produit_id=ledger.produit_id, last_transaction_id=ledger.last_transaction_id,
+                      quantity=ledger.ledger_quantity)
+        for ledger in ledgers
+        if ledger.last_transaction_id is not None and (ledger.repaired or not ledger.diverges)
+    ]
+    if not snapshots:
+        return
+    with db_transaction.atomic():
+        StockSnapshot.objects.bulk_create(snapshots)
+        # Le nouvel instantané est récent : au moins un reste toujours par produit
+        StockSnapshot.objects.filter(
+            produit_id__in=[snapshot.produit_id for snapshot in snapshots],
+            taken_at__lt=timezone.now() - timedelta(days=keep_days),
+        ).delete()
@@ -0,0 +1,339 @@
+"""
+Live updates of the dashboard, pushed over Server-Sent Events.
+
+Every committed transaction becomes an event holding its contribution to the
+KPIs of the dashboard (:func:`transaction_event`). Each worker keeps the KPIs
+of the last 30 days in memory (:class:`DashboardState`): they are loaded once
+from the database, then updated from the events alone, and the new figures
+are fanned out to the open streams of the worker by the :class:`Broadcaster`.
+The message is serialized once per event, whatever the number of streams.
+
+With several workers, an event must reach the streams of all of them: when
+``settings.LIVE_EVENTS_DB`` is set, events are appended to that SQLite file
+instead of being dispatched directly, and every worker polls it.
+
+The top products cover the same calendar days as the leaderboards rendered
+with the page (``settings.LEADERBOARD_WINDOW_DAYS``, see
+:func:`main.leaderboards.window_start`), so that the first message does not
+replace them with figures over another window.
+
+The state is reloaded every ``settings.LIVE_RESYNC_SECONDS`` and when the
+day changes: transactions leaving the windows and price changes are only
+picked up then.
+Streams only run under ASGI and are closed after
+``settings.LIVE_STREAM_SECONDS``; the browser reconnects on its own.
+"""
+import asyncio
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Sum
+from django.utils import timezone
+
+from . import leaderboards
+from .models import Stock, Transaction
+
+WINDOW_DAYS = 30  # KPIs : 30 jours glissants, comme le rendu de la page
+TOP_PRODUCTS = 5
+QUEUE_SIZE = 16  # Messages en attente par flux : chacun porte les totaux complets, les plus anciens sont jetés
+RECONNECT_DELAY = 5000  # Millisecondes, champ "retry" du flux
+EVENTS_FETCH_SIZE = 1000
+EVENTS_RETENTION = 300  # Secondes de journal conservées dans le fichier partagé
+
+_EVENTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS live_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        payload TEXT NOT NULL
+    )
+"""
+
+
+def transaction_event(transaction):
+    """
+    Returns the contribution of a new transaction to the KPIs of the dashboard.
+
+    Only reads the transaction (and its product, already loaded by the write path).
+
+    :param transaction: The saved transaction.
+    :type transaction: Transaction
+    :rtype: dict
+    """
+    amount = transaction.quantity * transaction.unit_price
+    sale = transaction.type == 'Vente'
+    return {
+        'id': transaction.pk,
+        'type': transaction.type,
+        'produit_id': transaction.produit_id,
+        'produit': transaction.produit.produit,
+        'quantity': transaction.quantity,
+        'revenue': str(amount if sale else 0),
+        'cost': str(transaction.cogs if sale else 0),
+        # Stock valorisé au prix de vente : la transaction le déplace au prix enregistré
+        'stock_value': str(-amount if sale else amount),
+    }
+
+
+class DashboardState:
+    """
+    KPIs of the last 30 days and top products of the leaderboard window, kept up to date from the transaction events.
+
+    :ivar last_id: Highest transaction id counted by the last load; older events are ignored.
+    :type last_id: int
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.sales = 0
+        self.revenue = self.cost = self.stock_value = Decimal('0')
+        self.sold = {}  # produit_id -> [nom, quantité]
+        self.bought = {}
+        self._loaded_at = None
+        self._loaded_day = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def stale(self):
+        """Tells whether the state was never loaded, is older than ``settings.LIVE_RESYNC_SECONDS`` or from another day."""
+        loaded_at = self._loaded_at
+        return (
+            loaded_at is None or time.monotonic() - loaded_at > settings.LIVE_RESYNC_SECONDS
+            # Nouveau jour : la fenêtre des classements a avancé
+            or self._loaded_day != timezone.localdate()
+        )
+
+    def load(self):
+        """Reads the KPIs from the database, unless another thread just did."""
+        with self._load_lock:
+            if not self.stale():
+                return
+            try:
+                self._load()
+            finally:
+                connections.close_all()  # Thread de sync_to_async : la connexion est rendue tout de suite
+
+    def _load(self):
+        today = timezone.localdate()
+        last_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+        recent = Transaction.objects.filter(time__gte=timezone.now() - timedelta(days=WINDOW_DAYS), id__lte=last_id)
+        sales = recent.filter(type='Vente')
+        totals = sales.aggregate(count=Count('id'), revenue=Sum(_amount('unit_price')), cost=Sum('cogs'))
+        ranked = Transaction.objects.filter(time__gte=leaderboards.window_start(), id__lte=last_id)
+        sold, bought = (
+            {
+                pk: [name, quantity]
+                for pk, name, quantity in ranked.filter(type=type_).values('produit_id', 'produit__produit')
+                .annotate(total=Sum('quantity')).values_list('produit_id', 'produit__produit', 'total').order_by()
+            }
+            for type_ in ('Vente', 'Achat')
+        )
+        stock_value = Stock.objects.aggregate(value=Sum(_amount('prix_vente')))['value']
+
+        with self._lock:
+            self.last_id = last_id
+            self.sales = totals['count']
+            self.revenue = _decimal(totals['revenue'])
+            self.cost = _decimal(totals['cost'])
+            self.stock_value = _decimal(stock_value)
+            self.sold, self.bought = sold, bought
+            self._loaded_at = time.monotonic()
+            self._loaded_day = today
+
+    def apply(self, event):
+        """
+        Adds a transaction event to the KPIs.
+
+        :return: Whether the event changed the state (not loaded yet, or already counted, otherwise).
+        :rtype: bool
+        """
+        with self._lock:
+            # Sans id (bulk_create sans RETURNING) : l'événement est forcément postérieur au chargement
+            if self._loaded_at is None or (event['id'] is not None and event['id'] <= self.last_id):
+                return False
+            products = self.sold if event['type'] == 'Vente' else self.bought
+            product = products.setdefault(event['produit_id'], [event['produit'], 0])
+            product[1] += event['quantity']
+            if event['type'] == 'Vente':
+                self.sales += 1
+                self.revenue += Decimal(event['revenue'])
+                self.cost += Decimal(event['cost'])
+            self.stock_value += Decimal(event['stock_value'])
+            return True
+
+    def message(self, deltas=()):
+        """
+        Formats the current KPIs, with the events that led to them, as a Server-Sent Event.
+
+        :rtype: str
+        """
+        with self._lock:
+            data = {
+                'nb_ventes': self.sales,
+                'chiffre_affaires': float(self.revenue),
+                'benefice': float(self.revenue - self.cost),
+                'valeur_stock': float(self.stock_value),
+                'most_sold': _top(self.sold),
+                'most_bought': _top(self.bought),
+                'deltas': list(deltas),
+            }
+        return f"event: kpi\ndata: {json.dumps(data)}\n\n"
+
+
+class Broadcaster:
+    """Fans the dashboard messages out to the streams open in this process."""
+
+    def __init__(self, state):
+        self.state = state
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._poller = None
+        self._published = 0
+
+    def subscribe(self):
+        """
+        Registers a stream of the running event loop.
+
+        :return: The subscription, to pass to :meth:`unsubscribe`; its queue receives the messages.
+        :rtype: tuple[asyncio.AbstractEventLoop, asyncio.Queue]
+        """
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.add(subscription)
+            if settings.LIVE_EVENTS_DB and self._poller is None:
+                # Le curseur du journal est placé avant le chargement de l'état : aucun événement perdu
+                self._poller = threading.Thread(target=self._poll, args=(self._last_event_id(),),
+                                                name='live-events', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """
+        Sends a transaction event to the streams of every worker.
+
+        :param event: As returned by :func:`transaction_event`.
+        :type event: dict
+        """
+        if settings.LIVE_EVENTS_DB:
+            self._append(event)
+        else:
+            self.dispatch([event])
+
+    def dispatch(self, events):
+        """Applies events to the state of this process and sends the new KPIs to its streams."""
+        applied = [event for event in events if self.state.apply(event)]
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not applied or not subscribers:
+            return
+        message = self.state.message(applied)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:  # Boucle fermée
+                self.unsubscribe((loop, queue))
+
+    # Journal partagé entre les workers
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(settings.LIVE_EVENTS_DB, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_EVENTS_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _append(self, event):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('INSERT INTO live_events (created, payload) VALUES (?, ?)', (now, json.dumps(event)))
+        self._published += 1
+        if self._published % 100 == 0:
+            connection.execute('DELETE FROM live_events WHERE created < ?', (now - EVENTS_RETENTION,))
+
+    def _last_event_id(self):
+        return self._connection().execute('SELECT COALESCE(MAX(id), 0) FROM live_events').fetchone()[0]
+
+    def _poll(self, last_id):
+        while True:
+            time.sleep(settings.LIVE_POLL_INTERVAL)
+            try:
+                rows = self._connection().execute(
+                    'SELECT id, payload FROM live_events WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, EVENTS_FETCH_SIZE),
+                ).fetchall()
+            except sqlite3.Error:
+                continue  # Fichier verrouillé ou recréé : nouvel essai au prochain tour
+            if rows:
+                last_id = rows[-1][0]
+                self.dispatch([json.loads(payload) for _id, payload in rows])
+
+
+state = DashboardState()
+broadcaster = Broadcaster(state)
+
+
+async def stream():
+    """
+    Yields the Server-Sent Events of one dashboard: the current KPIs, then their updates.
+
+    A comment is sent every ``settings.LIVE_HEARTBEAT_SECONDS`` to keep proxies
+    from closing the connection; the state is reloaded then if it is stale.
+    """
+    subscription = broadcaster.subscribe()
+    loop, queue = subscription
+    try:
+        if state.stale():
+            await sync_to_async(state.load, thread_sensitive=False)()
+        yield f"retry: {RECONNECT_DELAY}\n" + state.message()
+
+        deadline = loop.time() + settings.LIVE_STREAM_SECONDS
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=min(settings.LIVE_HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                if state.stale():
+                    await sync_to_async(state.load, thread_sensitive=False)()
+                    yield state.message()
+                else:
+                    yield ": ping\n\n"
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def _offer(queue, message):
+    # Flux en retard : seul le dernier état compte, on jette le plus ancien message
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+def _top(products):
+    return [
+        {'produit': name, 'total_qty': quantity}
+        for name, quantity in heapq.nlargest(TOP_PRODUCTS, products.values(), key=lambda product: product[1])
+    ]
+
+
+def _amount(price_field):
+    return ExpressionWrapper(F('quantity') * F(price_field), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _decimal(value):
+    # SQLite renvoie des flottants pour les colonnes décimales
+    if value is None:
+        return Decimal('0')
+    return value if isinstance(value, Decimal) else Decimal(str(value))
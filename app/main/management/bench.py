@@ -0,0 +1,188 @@
+"""
+Small helpers shared by the ``bench_*`` management commands.
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import Client
+
+
+def summarize(durations):
+    """
+    Summarizes a list of durations expressed in seconds.
+
+    :param durations: Measured durations.
+    :type durations: list[float]
+    :return: Mean, median, 95th percentile and max, in milliseconds.
+    :rtype: dict[str, float]
+    """
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'mean': statistics.fmean(ordered) * 1000,
+        'p50': statistics.median(ordered) * 1000,
+        'p95': p95 * 1000,
+        'max': ordered[-1] * 1000,
+    }
+
+
+def format_row(label, summary):
+    return (f"{label:<40} mean {summary['mean']:8.2f} ms | p50 {summary['p50']:8.2f} ms"
+            f" | p95 {summary['p95']:8.2f} ms | max {summary['max']:8.2f} ms")
+
+
+def logged_in_client(username=None):
+    """
+    Returns a test client logged in as the given user, or as the first superuser.
+
+    :param username: Username of the account to use for the requests.
+    :type username: str or None
+    :return: A client carrying a valid session cookie.
+    :rtype: django.test.Client
+    """
+    users = get_user_model().objects
+    user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+    if user is None:
+        raise CommandError("Aucun utilisateur pour le benchmark, utilisez --username.")
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def time_requests(client, url, count, close_connections=True):
+    """
+    Sends ``count`` GET requests to ``url`` and returns their durations.
+
+    The test client keeps database connections open between requests, unlike
+    a real server where ``CONN_MAX_AGE = 0`` closes them when the response is
+    sent. They are closed explicitly after each request, inside the measured
+    time, unless ``close_connections`` is false.
+
+    :param client: Client used to send the requests.
+    :type client: django.test.Client
+    :param url: Path requested.
+    :type url: str
+    :param count: Number of requests.
+    :type count: int
+    :param close_connections: Close the database connections after each request.
+    :type close_connections: bool
+    :return: The duration of every request, in seconds.
+    :rtype: list[float]
+    """
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            for _chunk in response.streaming_content:
+                pass
+        if close_connections:
+            connections.close_all()
+        durations.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise CommandError(f"{url} a répondu {response.status_code}")
+    return durations
+
+
+@contextmanager
+def uvicorn_server(app, port, workers=1, interface='asgi3'):
+    """
+    Runs the project under uvicorn in a subprocess for the duration of the block.
+
+    :param app: Import path of the application (e.g. ``"LogistIcam.asgi:application"``).
+    :type app: str
+    :param port: Local port to listen on.
+    :type port: int
+    :param workers: Number of worker processes.
+    :type workers: int
+    :param interface: ``"asgi3"``, or ``"wsgi"`` to serve the WSGI application.
+    :type interface: str
+    """
+    command = [
+        sys.executable, '-m', 'uvicorn', app, '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--interface', interface, '--no-access-log', '--log-level', 'warning',
+    ]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'LogistIcam.settings')}
+    process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise CommandError(f"uvicorn s'est arrêté (code {process.returncode})")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError(f"uvicorn n'écoute pas sur le port {port}")
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def http_load(port, path, count, concurrency=1, headers=None):
+    """
+    Sends ``count`` GET requests to a local server from ``concurrency`` keep-alive connections.
+
+    :param port: Port of the server.
+    :type port: int
+    :param path: Path requested.
+    :type path: str
+    :param count: Total number of requests.
+    :type count: int
+    :param concurrency: Number of simultaneous clients.
+    :type concurrency: int
+    :param headers: Headers sent with every request (e.g. the session cookie).
+    :type headers: dict or None
+    :return: The duration of every request and the wall time of the run, in seconds.
+    :rtype: tuple[list[float], float]
+    """
+    def worker(requests):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        durations = []
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                durations.append(time.perf_counter() - start)
+                if response.status >= 300:
+                    raise CommandError(f"{path} a répondu {response.status}")
+        finally:
+            connection.close()
+        return durations
+
+    shares = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, shares))
+    return [duration for durations in results for duration in durations], time.perf_counter() - start
+
+
+def session_headers(client):
+    """
+    Returns the headers authenticating a raw HTTP request as the user of a test client.
+
+    :param client: A client returned by :func:`logged_in_client`.
+    :type client: django.test.Client
+    :rtype: dict[str, str]
+    """
+    cookie = client.cookies[settings.SESSION_COOKIE_NAME]
+    return {'Cookie': f"{settings.SESSION_COOKIE_NAME}={cookie.value}"}
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...archive import archive_transactions
+
+
+class Command(BaseCommand):
+    help = ("Déplace les transactions plus anciennes qu'une date limite vers la table d'archive, "
+            "par lots, en reportant leurs totaux par produit et par client.")
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--before', help="Date limite (AAAA-MM-JJ), transactions strictement antérieures")
+        cutoff.add_argument('--older-than-days', type=int, help="Archiver les transactions de plus de N jours")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Transactions déplacées par lot")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError("--before attend une date au format AAAA-MM-JJ")
+        else:
+            cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size doit être positif")
+
+        def progress(total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {total} transactions archivées...")
+
+        archived = archive_transactions(cutoff, batch_size=options['batch_size'], on_batch=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{archived} transaction(s) antérieure(s) au {cutoff:%Y-%m-%d %H:%M} archivée(s)."
+        ))
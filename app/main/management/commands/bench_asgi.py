@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from ..bench import summarize, format_row, logged_in_client, uvicorn_server, http_load, session_headers
+
+
+class Command(BaseCommand):
+    help = ("Compare sous uvicorn, à nombre de workers égal, le tableau de bord et le rapport client "
+            "servis en WSGI (vues synchrones) et en ASGI (vues async aux requêtes parallèles).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Processus uvicorn par serveur")
+        parser.add_argument('--requests', type=int, default=200, help="Requêtes par scénario")
+        parser.add_argument('--concurrency', type=int, default=8, help="Clients simultanés")
+        parser.add_argument('--client-id', type=int, help="Client du rapport PDF (omis : tableau de bord seul)")
+        parser.add_argument('--port', type=int, default=8765, help="Port local utilisé par les serveurs")
+        parser.add_argument('--username', help="Compte utilisé pour les requêtes (superuser par défaut)")
+
+    def handle(self, *args, **options):
+        headers = session_headers(logged_in_client(options['username']))
+        pages = [(reverse('main:home'), reverse('main:home_async'))]
+        if options['client_id']:
+            pages.append((reverse('main:client_pdf_report', args=[options['client_id']]),
+                          reverse('main:client_pdf_report_async', args=[options['client_id']])))
+
+        scenarios = [
+            ('WSGI', 'LogistIcam.wsgi:application', 'wsgi', 0),
+            ('ASGI', 'LogistIcam.asgi:application', 'asgi3', 0),
+            ('ASGI', 'LogistIcam.asgi:application', 'asgi3', 1),
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['workers']} worker(s), {options['concurrency']} client(s) simultané(s)"
+        ))
+        for server, app, interface, page_index in scenarios:
+            with uvicorn_server(app, options['port'], workers=options['workers'], interface=interface):
+                for page in pages:
+                    path = page[page_index]
+                    # Première série hors mesure (connexions, caches de templates)
+                    http_load(options['port'], path, options['concurrency'], options['concurrency'], headers)
+                    durations, wall = http_load(options['port'], path, options['requests'],
+                                                options['concurrency'], headers)
+                    self.stdout.write(f"{format_row(f'{server} {path}', summarize(durations))}"
+                                      f" | {len(durations) / wall:7.1f} req/s")
@@ -0,0 +1,92 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..bench import summarize
+
+BENCH_USERNAME = 'bench-auth'
+
+# Configurations comparées : moteur de session, backend d'authentification
+CONFIGURATIONS = [
+    ("Base (avant)", 'django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+    ("cached_db + permissions en cache", 'django.contrib.sessions.backends.cached_db',
+     'main.permissions.CachedModelBackend'),
+    ("signed_cookies + permissions en cache", 'django.contrib.sessions.backends.signed_cookies',
+     'main.permissions.CachedModelBackend'),
+]
+
+PAGES = ['main:home', 'main:list_stocks', 'main:reorder_stocks', 'main:add_transaction', 'main:add_client']
+
+
+class Command(BaseCommand):
+    help = ("Compte les requêtes SQL et mesure la durée de chaque page pour un utilisateur non "
+            "superutilisateur, avec les sessions en base et les permissions relues à chaque requête, puis "
+            "avec les sessions et permissions en cache. L'utilisateur et son groupe sont créés puis supprimés.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Requêtes mesurées par page et configuration")
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0:
+            raise CommandError("--requests doit être positif")
+        user, group = self._create_user()
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{options['requests']} requête(s) par page, utilisateur du groupe \"{group.name}\""
+            ))
+            baseline = {}
+            for label, session_engine, backend in CONFIGURATIONS:
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                with override_settings(SESSION_ENGINE=session_engine, AUTHENTICATION_BACKENDS=[backend]):
+                    # Client créé sous la configuration : ses middlewares lisent le moteur de session à l'import
+                    client = Client()
+                    client.force_login(user)
+                    for name in PAGES:
+                        queries, durations = self._measure(client, reverse(name), options['requests'])
+                        saved = baseline.setdefault(name, queries) - queries
+                        line = (f"{name:<28} {queries:4d} requête(s) SQL | p50 {summarize(durations)['p50']:8.2f} ms"
+                                + (f" | {saved} de moins" if saved else ""))
+                        self.stdout.write(self.style.SUCCESS(line) if saved > 0 else line)
+        finally:
+            user.delete()
+            group.delete()
+
+    @staticmethod
+    def _create_user():
+        users = get_user_model().objects
+        users.filter(username=BENCH_USERNAME).delete()
+        Group.objects.filter(name=BENCH_USERNAME).delete()
+        # Permissions par un groupe, comme en production : le superutilisateur ne lit aucune permission
+        group = Group.objects.create(name=BENCH_USERNAME)
+        group.permissions.set(Permission.objects.filter(content_type__app_label='main'))
+        user = users.create_user(BENCH_USERNAME)
+        user.groups.add(group)
+        return user, group
+
+    @staticmethod
+    def _measure(client, url, count):
+        """Returns the queries of one request, once the caches are warm, and the duration of ``count`` requests."""
+        client.get(url)
+        durations = []
+        for index in range(count):
+            contexts = [CaptureQueriesContext(connection) for connection in connections.all()]
+            for context in contexts:
+                context.__enter__()
+            started_at = time.perf_counter()
+            try:
+                response = client.get(url)
+            finally:
+                for context in contexts:
+                    context.__exit__(None, None, None)
+            durations.append(time.perf_counter() - started_at)
+            if response.status_code != 200:
+                raise CommandError(f"{url} a répondu {response.status_code}")
+            if index == 0:
+                queries = sum(len(context) for context in contexts)
+        return queries, durations
@@ -0,0 +1,87 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..bench import logged_in_client
+from ...compression import compress
+from ...models import Transaction
+
+
+class Command(BaseCommand):
+    help = ("Mesure, pour les pages les plus lourdes, les octets économisés par la compression des "
+            "réponses (Brotli, gzip) et le temps CPU qu'elle coûte par réponse.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Compressions mesurées par page et encodage")
+        parser.add_argument('--brotli-quality', type=int, default=settings.COMPRESSION_BROTLI_QUALITY,
+                            help="Qualité Brotli (0-11)")
+        parser.add_argument('--gzip-level', type=int, default=settings.COMPRESSION_GZIP_LEVEL,
+                            help="Niveau gzip (1-9)")
+        parser.add_argument('--days', type=int, default=7,
+                            help="Période affichée par la liste des transactions (0 : toutes)")
+        parser.add_argument('--stock-id', type=int, help="Produit de la page de détail (le plus mouvementé par défaut)")
+        parser.add_argument('--username', help="Compte utilisé pour les requêtes (superuser par défaut)")
+
+    def handle(self, *args, **options):
+        client = logged_in_client(options['username'])
+        stock_id = options['stock_id'] or self._busiest_stock()
+        transactions = reverse('main:list_transactions')
+        if options['days']:
+            today = timezone.now().date()
+            transactions += f"?start_date={today - timedelta(days=options['days'])}&end_date={today}"
+        pages = [transactions, reverse('main:list_stocks'), reverse('main:home')]
+        if stock_id:
+            pages.append(reverse('main:details_stock', args=[stock_id]))
+        levels = {'br': options['brotli_quality'], 'gzip': options['gzip_level']}
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Brotli qualité {levels['br']}, gzip niveau {levels['gzip']}, {options['repeat']} compressions par mesure"
+        ))
+        totals = {encoding: [0, 0, 0.0] for encoding in levels}
+        with override_settings(COMPRESSION_BROTLI_QUALITY=levels['br'], COMPRESSION_GZIP_LEVEL=levels['gzip']):
+            for path in pages:
+                body = self._get(client, path, 'identity')[1]
+                for encoding, level in levels.items():
+                    # Taille réellement envoyée par le middleware
+                    content_encoding, sent = self._get(client, path, encoding)
+                    if content_encoding != encoding:
+                        raise CommandError(f"{path} n'a pas été compressé en {encoding} ({content_encoding})")
+                    # Temps CPU du thread : la compression seule, sans le rendu de la page
+                    start = time.thread_time()
+                    for _ in range(options['repeat']):
+                        compress(body, encoding, level)
+                    cpu = (time.thread_time() - start) / options['repeat']
+
+                    totals[encoding][0] += len(body)
+                    totals[encoding][1] += len(sent)
+                    totals[encoding][2] += cpu
+                    self.stdout.write(self._row(f"{path.split('?')[0]} [{encoding}]", len(body), len(sent), cpu))
+
+        for encoding, (raw, sent, cpu) in totals.items():
+            self.stdout.write(self.style.SUCCESS(self._row(f"Total [{encoding}]", raw, sent, cpu / len(pages))))
+
+    @staticmethod
+    def _busiest_stock():
+        row = Transaction.objects.values('produit').annotate(count=Count('id')).order_by('-count').first()
+        return row['produit'] if row else None
+
+    @staticmethod
+    def _get(client, path, encoding):
+        response = client.get(path, HTTP_ACCEPT_ENCODING=encoding)
+        if response.status_code >= 400:
+            raise CommandError(f"{path} a répondu {response.status_code}")
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.get('Content-Encoding'), body
+
+    @staticmethod
+    def _row(label, raw, sent, cpu):
+        saved = raw - sent
+        return (f"{label:<40} {raw / 1024:9.1f} Ko -> {sent / 1024:8.1f} Ko"
+                f" | économisés {saved / 1024:9.1f} Ko ({saved / raw * 100 if raw else 0:5.1f} %)"
+                f" | CPU {cpu * 1000:7.2f} ms/réponse")
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+from django.urls import reverse
+from django.utils import timezone
+
+from ..bench import summarize, format_row, logged_in_client, time_requests
+
+PLAIN_ENGINE = 'mysql.connector.django'
+POOLED_ENGINE = 'main.backends.mysql_pool'
+
+
+class Command(BaseCommand):
+    help = ("Compare la latence de petites vues avec le backend mysql.connector classique "
+            "(une connexion par requête) et avec le backend à pool de connexions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requêtes par vue et par backend")
+        parser.add_argument('--url', action='append', dest='urls',
+                            help="Nom d'URL à mesurer (répétable), par défaut main:add_client et main:list_clients")
+        parser.add_argument('--username', help="Compte utilisé pour les requêtes (superuser par défaut)")
+
+    def handle(self, *args, **options):
+        urls = [reverse(name) for name in (options['urls'] or ['main:add_client', 'main:list_clients'])]
+        base_settings = connections['default'].settings_dict
+        client = logged_in_client(options['username'])
+        original = connections['default']
+
+        try:
+            for engine in (PLAIN_ENGINE, POOLED_ENGINE):
+                settings_dict = {**base_settings, 'ENGINE': engine, 'CONN_MAX_AGE': 0}
+                if engine == PLAIN_ENGINE:
+                    # mysql.connector.django passe OPTIONS tel quel à connect(), qui refuse la clé POOL
+                    settings_dict['OPTIONS'] = {
+                        key: value for key, value in base_settings['OPTIONS'].items() if key != 'POOL'
+                    }
+                connections['default'] = load_backend(engine).DatabaseWrapper(settings_dict, 'default')
+                self.stdout.write(self.style.MIGRATE_HEADING(engine))
+                self._check_durable_write()
+                for url in urls:
+                    # Première requête hors mesure (remplissage du pool, caches de templates)
+                    time_requests(client, url, 1)
+                    durations = time_requests(client, url, options['requests'])
+                    self.stdout.write(format_row(url, summarize(durations)))
+                connections['default'].close()
+        finally:
+            connections['default'] = original
+
+    @staticmethod
+    def _check_durable_write():
+        """Saves a row outside ``atomic()``, closes the connection and reads the row back from a new one."""
+        key = f"bench-db-pool-{time.time_ns()}"
+        Session.objects.using('default').create(
+            session_key=key, session_data='', expire_date=timezone.now() + timedelta(minutes=1),
+        )
+        # Retour au pool : une session restée en autocommit=False y perd ses écritures non validées
+        connections['default'].close()
+        found = Session.objects.using('default').filter(session_key=key).exists()
+        Session.objects.using('default').filter(session_key=key).delete()
+        connections['default'].close()
+        if not found:
+            raise CommandError("Écriture hors transaction perdue à la fermeture de la connexion (autocommit inactif)")
@@ -0,0 +1,123 @@
+import math
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ... import forecast
+
+
+class Command(BaseCommand):
+    help = ("Mesure le calcul des prévisions de demande et des suggestions de réapprovisionnement sur un "
+            "historique synthétique (10 000 produits sur 2 ans par défaut), face à une boucle Python par produit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help="Produits simulés")
+        parser.add_argument('--days', type=int, default=730, help="Jours d'historique simulés")
+        parser.add_argument('--sale-rate', type=float, default=0.3,
+                            help="Part des jours où un produit se vend (densité des lignes lues)")
+        parser.add_argument('--repeat', type=int, default=3, help="Mesures par étape (la meilleure est retenue)")
+        parser.add_argument('--baseline-products', type=int, default=500,
+                            help="Produits calculés par la boucle Python, extrapolée ensuite (0 : pas de comparaison)")
+        parser.add_argument('--database', action='store_true',
+                            help="Mesure aussi la prévision sur la base configurée (requête comprise, puis en cache)")
+        parser.add_argument('--seed', type=int, default=0, help="Graine du générateur")
+
+    def handle(self, *args, **options):
+        products, days = options['products'], options['days']
+        if products <= 0 or days <= 0 or not 0 < options['sale_rate'] <= 1:
+            raise CommandError("--products et --days doivent être positifs, --sale-rate compris dans ]0, 1]")
+        alpha, window = settings.FORECAST_ALPHA, min(settings.FORECAST_WINDOW_DAYS, days)
+
+        first_day = timezone.localdate() - timedelta(days=days - 1)
+        pks, quantities, rows = self._history(products, days, first_day, options['sale_rate'], options['seed'])
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{products} produit(s) x {days} jour(s) : {len(rows)} ligne(s) (produit, jour, quantité), "
+            f"matrice de {products * days * 4 / 2 ** 20:.0f} Mo"
+        ))
+
+        matrix, build = self._best(options['repeat'], lambda: forecast.sales_matrix(rows, pks, first_day, days))
+        result, compute = self._best(options['repeat'], lambda: forecast.compute_forecast(matrix, pks, alpha, window))
+        suggestions, reorder = self._best(options['repeat'],
+                                          lambda: forecast.reorder_suggestions(result, pks, quantities))
+        self.stdout.write(self._row("Matrice des ventes", build))
+        self.stdout.write(self._row("Lissage, moyenne mobile, écart-type", compute))
+        self.stdout.write(self._row("Points de commande", reorder))
+        total = build + compute + reorder
+        self.stdout.write(self.style.SUCCESS(
+            f"{self._row('Total vectorisé', total)} | {int((suggestions['order'] > 0).sum())} produit(s) à commander"
+        ))
+
+        baseline = min(options['baseline_products'], products)
+        if baseline:
+            subset = set(pks[:baseline].tolist())
+            subset_rows = [row for row in rows if row[0] in subset]
+            started_at = time.perf_counter()
+            expected = self._python_loop(subset_rows, pks[:baseline], quantities[:baseline], first_day, days,
+                                         alpha, window)
+            loop = (time.perf_counter() - started_at) * products / baseline
+            self.stdout.write(f"{self._row(f'Boucle Python (extrapolée de {baseline} produits)', loop)}"
+                              f" | x{loop / total:.0f}")
+            if not np.allclose(expected, suggestions['order'][:baseline], atol=1):
+                raise CommandError("Les quantités à commander diffèrent de la boucle Python")
+
+        if options['database']:
+            forecast.bump_data_version()
+            _, cold = self._best(1, forecast.current_forecast)
+            _, warm = self._best(options['repeat'], forecast.current_forecast)
+            self.stdout.write(self._row("Base configurée, requête comprise", cold))
+            self.stdout.write(self._row("Base configurée, depuis le cache", warm))
+
+    @staticmethod
+    def _history(products, days, first_day, sale_rate, seed):
+        """Draws Poisson daily sales, returned as the rows of :func:`forecast.daily_sales_rows`."""
+        generator = np.random.default_rng(seed)
+        pks = np.arange(1, products + 1, dtype=np.int64)
+        rates = generator.lognormal(0, 1, products)
+        sold = generator.random((products, days)) < sale_rate
+        quantities = np.where(sold, generator.poisson(rates[:, None], (products, days)) + 1, 0)
+        product_index, day_index = np.nonzero(quantities)
+        dates = [first_day + timedelta(days=day) for day in range(days)]
+        rows = list(zip(pks[product_index].tolist(), [dates[day] for day in day_index.tolist()],
+                        quantities[product_index, day_index].tolist()))
+        on_hand = generator.integers(0, 200, products)
+        return pks, on_hand, rows
+
+    @staticmethod
+    def _python_loop(rows, pks, quantities, first_day, days, alpha, window):
+        """Reference implementation: one product at a time, in plain Python."""
+        sales = {pk: [0] * days for pk in pks.tolist()}
+        for pk, day, quantity in rows:
+            sales[pk][(day - first_day).days] += quantity
+        orders = []
+        for pk, on_hand in zip(pks.tolist(), quantities.tolist()):
+            series = sales[pk]
+            level = series[0]
+            for value in series[1:]:
+                level = alpha * value + (1 - alpha) * level
+            recent = series[-window:]
+            mean = sum(recent) / window
+            deviation = math.sqrt(sum((value - mean) ** 2 for value in recent) / window)
+            safety = settings.REORDER_SERVICE_Z * deviation * math.sqrt(settings.REORDER_LEAD_DAYS)
+            if level > 0 and on_hand <= level * settings.REORDER_LEAD_DAYS + safety:
+                target = level * (settings.REORDER_LEAD_DAYS + settings.REORDER_COVER_DAYS) + safety
+                orders.append(math.ceil(max(target - on_hand, 0)))
+            else:
+                orders.append(0)
+        return orders
+
+    @staticmethod
+    def _best(repeat, function):
+        best, result = math.inf, None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - started_at)
+        return result, best
+
+    @staticmethod
+    def _row(label, seconds):
+        return f"{label:<48} {seconds * 1000:10.1f} ms"
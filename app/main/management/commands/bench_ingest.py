@@ -0,0 +1,114 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from ..bench import summarize
+from ...ingest import GroupCommitter, save_transaction
+from ...models import Stock, Transaction
+
+BENCH_PREFIX = 'bench-ingest-'
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit des ventes enregistrées une par une (un commit par requête) et par écriture "
+            "groupée (main.ingest), à plusieurs niveaux de concurrence. Les produits du benchmark sont "
+            "créés puis supprimés avec leurs transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16,64', help="Niveaux de concurrence, séparés par des virgules")
+        parser.add_argument('--sales', type=int, default=1000, help="Ventes enregistrées par mesure")
+        parser.add_argument('--products', type=int, default=50, help="Produits vendus (contention des verrous)")
+        parser.add_argument('--batch-size', type=int, default=200, help="Ventes par commit au plus (écriture groupée)")
+        parser.add_argument('--flush-ms', type=float, default=5, help="Attente maximale avant un commit groupé")
+        parser.add_argument('--rtt-ms', type=float, default=0,
+                            help="Latence simulée par requête SQL, pour une base distante (0 : aucune)")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency attend des entiers séparés par des virgules")
+        if options['sales'] <= 0 or options['products'] <= 0 or min(levels) <= 0:
+            raise CommandError("--sales, --products et --concurrency doivent être positifs")
+
+        if options['rtt_ms']:
+            delay = options['rtt_ms'] / 1000
+
+            def remote(execute, sql, params, many, context):
+                time.sleep(delay)
+                return execute(sql, params, many, context)
+
+            def install(sender, connection, **kwargs):
+                # Les wrappers survivent aux reconnexions : une seule installation par connexion
+                if remote not in connection.execute_wrappers:
+                    connection.execute_wrappers.append(remote)
+
+            # Connexions ouvertes par les threads du benchmark et par le thread d'écriture groupée
+            connection_created.connect(install, weak=False, dispatch_uid='bench_ingest_rtt')
+            connections.close_all()
+
+        pks = self._create_products(options['products'])
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{options['sales']} vente(s) par mesure sur {len(pks)} produit(s), "
+                f"lots de {options['batch_size']} / {options['flush_ms']:g} ms, latence simulée {options['rtt_ms']:g} ms"
+            ))
+            for level in levels:
+                committer = GroupCommitter(
+                    options['batch_size'], options['flush_ms'] / 1000, settings.INGEST_SUBMIT_TIMEOUT,
+                )
+                for label, write in (("Un commit par vente", save_transaction), ("Écriture groupée", committer.submit)):
+                    rate, durations, errors = self._run(write, pks, options['sales'], level)
+                    summary = summarize(durations)
+                    line = (f"{label + f' x{level}':<28} {rate:9.1f} ventes/s | p50 {summary['p50']:8.2f} ms"
+                            f" | p95 {summary['p95']:8.2f} ms" + (f" | {errors} erreur(s)" if errors else ""))
+                    self.stdout.write(self.style.SUCCESS(line) if write is not save_transaction else line)
+        finally:
+            connection_created.disconnect(dispatch_uid='bench_ingest_rtt')
+            Stock.objects.filter(pk__in=pks).delete()
+
+    @staticmethod
+    def _create_products(count):
+        Stock.objects.filter(produit__startswith=BENCH_PREFIX).delete()
+        Stock.objects.bulk_create([
+            Stock(produit=f"{BENCH_PREFIX}{index}", quantity=10 ** 9, prix_achat=1, prix_vente=2)
+            for index in range(count)
+        ])
+        return list(Stock.objects.filter(produit__startswith=BENCH_PREFIX).values_list('pk', flat=True))
+
+    @staticmethod
+    def _run(write, pks, sales, concurrency):
+        """Writes ``sales`` sales from ``concurrency`` threads; returns the rate, the latencies and the errors."""
+        durations, errors = [], []
+        lock = threading.Lock()
+
+        def sell(_index):
+            transaction = Transaction(type='Vente', produit_id=random.choice(pks), quantity=1)
+            started_at = time.perf_counter()
+            try:
+                write(transaction)
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+                return
+            with lock:
+                durations.append(time.perf_counter() - started_at)
+
+        def close(_index):
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started_at = time.perf_counter()
+            list(pool.map(sell, range(sales)))
+            wall = time.perf_counter() - started_at
+            # Connexions des threads rendues avant la mesure suivante
+            list(pool.map(close, range(concurrency)))
+        if not durations:
+            raise CommandError(f"Aucune vente enregistrée : {errors[0]!r}")
+        return len(durations) / wall, durations, len(errors)
@@ -0,0 +1,90 @@
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from ...models import Transaction
+from ...read_models import transaction_rows, iter_transaction_rows
+from ...reports.client import transaction_row
+from ...reports.stock_item import recent_row
+
+# Boucle du tableau de page_transactions.html, avant (instances) et après (lignes légères)
+LIST_TEMPLATE = """{% for transaction in transactions %}<tr>
+<td>{{ PRODUIT }}</td><td>{{ transaction.quantity }}</td><td>{{ transaction.type }}</td>
+<td>{{ transaction.new_stock_qt }}</td><td>{{ transaction.client }}</td><td>{{ transaction.time|date:"d/m/Y H:i" }}</td>
+</tr>{% endfor %}"""
+
+
+class _InstanceRow:
+    """Adapts a model instance to the attributes of the report line builders, as they read it before."""
+
+    def __init__(self, trans):
+        self._trans = trans
+
+    def __getattr__(self, name):
+        trans = self._trans
+        if name == 'produit':
+            return trans.produit.produit
+        if name == 'client':
+            return f"{trans.client.name} {trans.client.surname}" if trans.client else None
+        return getattr(trans, name)
+
+
+class Command(BaseCommand):
+    help = ("Compare, pour le rendu de 100 000 transactions (liste HTML, lignes des rapports PDF), les "
+            "instances du modèle aux lignes légères de main.read_models : temps et pic de mémoire allouée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Transactions rendues par scénario")
+        parser.add_argument('--repeat', type=int, default=3, help="Mesures de temps (la meilleure est retenue)")
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0:
+            raise CommandError("--rows doit être positif")
+        queryset = Transaction.objects.order_by('-time', 'id')[:options['rows']]
+        count = queryset.count()
+        if not count:
+            raise CommandError("Aucune transaction à rendre")
+        # Le modèle ne porte plus que les jointures explicites : select_related est déjà le meilleur cas
+        instances = queryset.select_related('produit', 'client')
+        engine = engines['django']
+        instance_template = engine.from_string(LIST_TEMPLATE.replace('PRODUIT', 'transaction.produit.produit'))
+        row_template = engine.from_string(LIST_TEMPLATE.replace('PRODUIT', 'transaction.produit'))
+
+        scenarios = [
+            ("Liste des transactions (HTML)",
+             lambda: instance_template.render({'transactions': list(instances.all())}),
+             lambda: row_template.render({'transactions': transaction_rows(queryset)})),
+            ("Tableau du rapport client (PDF)",
+             lambda: [transaction_row(_InstanceRow(trans)) for trans in instances.iterator(chunk_size=2000)],
+             lambda: [transaction_row(row) for row in iter_transaction_rows(queryset)]),
+            ("Historique du rapport produit (PDF)",
+             lambda: [recent_row(_InstanceRow(trans)) for trans in instances.iterator(chunk_size=2000)],
+             lambda: [recent_row(row) for row in iter_transaction_rows(queryset)]),
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{count} transaction(s) par rendu"))
+        for label, before, after in scenarios:
+            for variant, function in (("instances", before), ("lignes", after)):
+                seconds, peak = self._measure(function, options['repeat'])
+                line = f"{label + ' [' + variant + ']':<52} {seconds * 1000:9.1f} ms | pic alloué {peak / 2 ** 20:7.1f} Mo"
+                self.stdout.write(self.style.SUCCESS(line) if variant == "lignes" else line)
+
+    @staticmethod
+    def _measure(function, repeat):
+        """Returns the best time of a scenario, then the peak of memory allocated by one traced run."""
+        best = float('inf')
+        for _ in range(repeat):
+            gc.collect()
+            started_at = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - started_at)
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            return best, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import ChangeLog
+
+DELETE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ("Supprime du journal des changements les lignes remplacées par une ligne plus récente du même "
+            "produit ou client. Une caisse qui synchronise ne lit que le dernier état de chaque objet : "
+            "elle reçoit les mêmes données, depuis un journal plus court.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE,
+                            help="Lignes supprimées par requête")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size doit être positif")
+
+        started_at = time.perf_counter()
+        # Un seul parcours par séquence décroissante : la première ligne vue d'un objet est la plus récente
+        seen, superseded = set(), []
+        entries = ChangeLog.objects.order_by('-seq').values_list('seq', 'model', 'object_id')
+        for seq, model, object_id in entries.iterator(chunk_size=10000):
+            if (model, object_id) in seen:
+                superseded.append(seq)
+            else:
+                seen.add((model, object_id))
+
+        batch_size = options['batch_size']
+        for start in range(0, len(superseded), batch_size):
+            ChangeLog.objects.filter(seq__in=superseded[start:start + batch_size]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(superseded)} ligne(s) supprimée(s), {len(seen)} objet(s) conservé(s) "
+            f"en {time.perf_counter() - started_at:.1f} s."
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...stock_import import import_stock_csv
+
+
+class Command(BaseCommand):
+    help = ("Importe un catalogue fournisseur (CSV) dans les stocks : les produits inconnus sont créés, "
+            "les produits existants (même nom) sont mis à jour.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help="Fichier CSV avec au moins la colonne 'produit'")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Produits écrits par requête")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Encodage du fichier")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size doit être positif")
+        try:
+            with open(options['csv_path'], encoding=options['encoding'], newline='') as text_file:
+                result = import_stock_csv(text_file, chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f"Impossible de lire {options['csv_path']} : {e}")
+        except UnicodeDecodeError:
+            raise CommandError(f"Le fichier n'est pas encodé en {options['encoding']}, utilisez --encoding.")
+
+        for line, message in result.errors:
+            self.stderr.write(f"Ligne {line} : {message}")
+        if result.rejected > len(result.errors):
+            self.stderr.write(f"... et {result.rejected - len(result.errors)} autre(s) ligne(s) rejetée(s)")
+
+        style = self.style.WARNING if result.rejected else self.style.SUCCESS
+        self.stdout.write(style(str(result)))
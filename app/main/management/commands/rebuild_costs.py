@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...costing import rebuild_costs
+
+
+class Command(BaseCommand):
+    help = ("Rejoue l'historique des transactions (archivées comprises) de chaque produit pour recalculer "
+            "son coût moyen pondéré et le coût des marchandises vendues de chaque vente.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--range-size', type=int, default=500, help="Produits rejoués par transaction")
+
+    def handle(self, *args, **options):
+        if options['range_size'] <= 0:
+            raise CommandError("--range-size doit être positif")
+
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {done}/{total} plages rejouées...")
+
+        started_at = time.perf_counter()
+        products, changed = rebuild_costs(range_size=options['range_size'], on_range=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{products} produit(s) rejoué(s) en {time.perf_counter() - started_at:.1f} s, "
+            f"coût de {changed} vente(s) mis à jour."
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...leaderboards import rebuild
+
+
+class Command(BaseCommand):
+    help = ("Relit en base les totaux par jour des classements du tableau de bord (articles les plus vendus "
+            "et achetés, meilleurs clients) et les écrit dans le cache partagé. À lancer après un vidage du "
+            "cache ou un déploiement, pour que la première page ne les calcule pas elle-même.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LEADERBOARD_RETENTION_DAYS,
+                            help="Jours reconstruits (au plus LEADERBOARD_RETENTION_DAYS)")
+
+    def handle(self, *args, **options):
+        if not 0 < options['days'] <= settings.LEADERBOARD_RETENTION_DAYS:
+            raise CommandError(f"--days doit être compris entre 1 et {settings.LEADERBOARD_RETENTION_DAYS}")
+
+        started_at = time.perf_counter()
+        buckets = rebuild(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{buckets} seau(x) journalier(s) reconstruit(s) en {time.perf_counter() - started_at:.1f} s."
+        ))
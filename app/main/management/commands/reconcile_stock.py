@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...ledger import reconcile
+from ...models import Stock
+
+
+class Command(BaseCommand):
+    help = ("Vérifie, pour chaque produit, la chaîne des quantités après transaction (new_stock_qt) et la "
+            "quantité en stock, par plages de produits traitées en parallèle. Signale les écarts et, avec "
+            "--repair, les corrige en prenant les transactions pour référence. À planifier avec --snapshot "
+            "pour que les passages suivants ne relisent que les nouvelles transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help="Réécrit les quantités divergentes d'après les transactions")
+        parser.add_argument('--snapshot', action='store_true',
+                            help="Enregistre un instantané des produits cohérents")
+        parser.add_argument('--full', action='store_true',
+                            help="Ignore les instantanés et relit tout l'historique")
+        parser.add_argument('--workers', type=int, default=4, help="Plages vérifiées en parallèle")
+        parser.add_argument('--range-size', type=int, default=500, help="Produits par plage")
+        parser.add_argument('--keep-days', type=int, default=90,
+                            help="Durée de conservation des anciens instantanés d'un produit")
+
+    def handle(self, *args, **options):
+        for option in ('workers', 'range_size', 'keep_days'):
+            if options[option] <= 0:
+                raise CommandError(f"--{option.replace('_', '-')} doit être positif")
+
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {done}/{total} plages vérifiées...")
+
+        started_at = time.perf_counter()
+        checked, divergent = reconcile(
+            workers=options['workers'], range_size=options['range_size'], full=options['full'],
+            repair=options['repair'], snapshot=options['snapshot'], keep_days=options['keep_days'],
+            on_range=progress,
+        )
+        elapsed = time.perf_counter() - started_at
+
+        names = dict(Stock.objects.filter(pk__in=[ledger.produit_id for ledger in divergent])
+                     .values_list('pk', 'produit'))
+        for ledger in divergent:
+            self.stdout.write(self._describe(ledger, names.get(ledger.produit_id, '?')))
+
+        summary = f"{checked} produit(s) vérifié(s) en {elapsed:.1f} s, {len(divergent)} écart(s)"
+        if options['repair']:
+            repaired = sum(ledger.repaired for ledger in divergent)
+            summary += f", {repaired} corrigé(s)"
+        if divergent and not all(ledger.repaired for ledger in divergent):
+            self.stdout.write(self.style.WARNING(summary + "."))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary + "."))
+
+    def _describe(self, ledger, name):
+        line = (f"#{ledger.produit_id} {name} : stock {ledger.stock_quantity}, "
+                f"transactions {ledger.ledger_quantity}")
+        if ledger.break_count:
+            first = ", ".join(f"#{pk} ({recorded} au lieu de {expected})" for pk, recorded, expected in ledger.breaks)
+            line += f", {ledger.break_count} rupture(s) de chaîne : {first}"
+            if ledger.break_count > len(ledger.breaks):
+                line += "..."
+        if ledger.repaired:
+            return self.style.SUCCESS(line + " -> corrigé")
+        if ledger.negative or (ledger.ledger_quantity or 0) < 0:
+            return self.style.ERROR(line + " -> stock négatif d'après les transactions, à corriger à la main")
+        return self.style.WARNING(line)
@@ -0,0 +1,360 @@
+"""
+In-process metrics registry exposed in the Prometheus text format.
+
+Every worker process keeps its own counters and histograms in memory. When
+``settings.METRICS_DIR`` is set, each process periodically dumps a snapshot of
+its values to ``<METRICS_DIR>/metrics_<pid>.json`` and the ``/metrics``
+endpoint sums the snapshots of every worker, so a single scrape covers the
+whole deployment without any external collector.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+# Bornes des histogrammes (secondes pour les durées, octets pour les tailles)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+
+    :ivar name: Name of the metric in the exposition.
+    :type name: str
+    :ivar documentation: Help text rendered in the ``# HELP`` line.
+    :type documentation: str
+    :ivar labelnames: Ordered names of the labels accepted by :meth:`inc`.
+    :type labelnames: tuple[str, ...]
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the counter for the given label values.
+
+        :param amount: Value added to the counter, must not be negative.
+        :param labels: One keyword argument per label name.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(into, values):
+        for key, value in values:
+            key = tuple(key)
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values):
+        lines = []
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, optionally split by labels.
+
+    Each label combination stores one count per bucket plus the sum and the
+    count of the observed values, which is enough to aggregate histograms of
+    several processes by simple addition.
+
+    :ivar name: Name of the metric in the exposition.
+    :type name: str
+    :ivar documentation: Help text rendered in the ``# HELP`` line.
+    :type documentation: str
+    :ivar labelnames: Ordered names of the labels accepted by :meth:`observe`.
+    :type labelnames: tuple[str, ...]
+    :ivar buckets: Sorted upper bounds of the buckets, ``+Inf`` excluded.
+    :type buckets: tuple[float, ...]
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        """
+        Records one observation for the given label values.
+
+        :param value: Observed value (seconds, bytes...).
+        :param labels: One keyword argument per label name.
+        """
+        key = self._key(labels)
+        with self._lock:
+            # [compteurs par bucket..., somme, nombre]
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the wall-clock duration of its block.
+
+        :param labels: One keyword argument per label name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self._values.items()]
+
+    @staticmethod
+    def merge(into, values):
+        for key, state in values:
+            key = tuple(key)
+            current = into.get(key)
+            if current is None or len(current) != len(state):
+                into[key] = list(state)
+            else:
+                into[key] = [a + b for a, b in zip(current, state)]
+
+    def render(self, values):
+        lines = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames + ('le',), key + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Collection of the metrics of the process, with multi-worker aggregation.
+
+    :ivar flush_interval: Minimum number of seconds between two snapshots
+        written to the shared metrics directory.
+    :type flush_interval: float
+    """
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """
+        Returns the current values of every metric of this process.
+
+        :return: A JSON-serialisable mapping of metric name to dumped values.
+        :rtype: dict
+        """
+        return {name: metric.dump() for name, metric in self._metrics.items()}
+
+    @staticmethod
+    def directory():
+        metrics_dir = getattr(settings, 'METRICS_DIR', None)
+        return Path(metrics_dir) if metrics_dir else None
+
+    def flush(self, force=False):
+        """
+        Writes the snapshot of this process to the shared metrics directory.
+
+        The file is replaced atomically so that a concurrent scrape never reads
+        a partial snapshot. Does nothing when no directory is configured or
+        when the last flush is more recent than :attr:`flush_interval`.
+
+        :param force: Ignore :attr:`flush_interval` and write immediately.
+        """
+        directory = self.directory()
+        if directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        with self._flush_lock:
+            self._last_flush = now
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"metrics_{os.getpid()}.json"
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp_path, path)
+
+    def collect(self):
+        """
+        Aggregates the values of every worker sharing the metrics directory.
+
+        Without a metrics directory only the values of the current process are
+        returned.
+
+        :return: A mapping of metric name to ``{label values: value}``.
+        :rtype: dict
+        """
+        snapshots = []
+        directory = self.directory()
+        if directory is None:
+            snapshots.append(self.snapshot())
+        else:
+            self.flush(force=True)
+            for path in directory.glob('metrics_*.json'):
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    # Fichier en cours de remplacement ou corrompu : on l'ignore pour ce scrape
+                    continue
+
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is not None:
+                    metric.merge(merged[name], values)
+        return merged
+
+    def render(self):
+        """
+        Renders the aggregated metrics in the Prometheus text exposition format.
+
+        :return: The exposition, ready to be served as ``text/plain``.
+        :rtype: str
+        """
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+registry = Registry()
+# Dernier instantané à l'arrêt du worker pour ne pas perdre l'intervalle en cours
+atexit.register(registry.flush, force=True)
+
+REQUEST_LATENCY = registry.histogram(
+    'logisticam_http_request_duration_seconds',
+    'Durée de traitement des requêtes HTTP par nom d\'URL.',
+    ('view', 'method'),
+)
+REQUEST_DB_TIME = registry.histogram(
+    'logisticam_http_request_db_duration_seconds',
+    'Temps passé en base de données par requête HTTP.',
+    ('view',),
+)
+REQUEST_DB_QUERIES = registry.counter(
+    'logisticam_db_queries_total',
+    'Nombre de requêtes SQL exécutées, par nom d\'URL.',
+    ('view',),
+)
+PDF_RENDER_DURATION = registry.histogram(
+    'logisticam_pdf_render_duration_seconds',
+    'Durée de génération des rapports PDF par type de rapport.',
+    ('report',),
+)
+PDF_SIZE = registry.histogram(
+    'logisticam_pdf_size_bytes',
+    'Taille des rapports PDF générés par type de rapport.',
+    ('report',),
+    buckets=SIZE_BUCKETS,
+)
+CACHE_REQUESTS = registry.counter(
+    'logisticam_cache_requests_total',
+    'Lectures de cache applicatif, par cache et par résultat (hit/miss).',
+    ('cache', 'result'),
+)
+TRANSACTIONS_WRITTEN = registry.counter(
+    'logisticam_transactions_written_total',
+    'Nombre de transactions enregistrées, par type.',
+    ('type',),
+)
+
+
+def record_cache_lookup(cache_name, hit):
+    """
+    Counts one lookup in an application cache, for the hit ratio.
+
+    :param cache_name: Name identifying the cache (e.g. ``"permissions"``).
+    :type cache_name: str
+    :param hit: Whether the value was found in the cache.
+    :type hit: bool
+    """
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def record_pdf(report, started_at, size):
+    """
+    Records the render duration and the size of a generated PDF report.
+
+    :param report: Report type label (e.g. ``"stock_item"``).
+    :type report: str
+    :param started_at: ``time.perf_counter()`` value taken when the render started.
+    :type started_at: float
+    :param size: Size of the generated document in bytes.
+    :type size: int
+    """
+    PDF_RENDER_DURATION.observe(time.perf_counter() - started_at, report=report)
+    PDF_SIZE.observe(size, report=report)
@@ -0,0 +1,232 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import resolve, Resolver404
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+from .compression import COMPRESSIBLE_TYPES, acompress_stream, compress, compress_stream, negotiate
+from .routers import reads_from_replica, is_pinned_to_primary
+
+_query_timer = ContextVar('query_timer', default=None)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and the database time of every request.
+
+    The request is labelled with the name of the URL it resolved to (e.g.
+    ``main:home``) so that the histograms stay bounded whatever the path
+    parameters are. Database time is measured by an execution wrapper
+    installed on every connection, which adds to the timer of the current
+    request: the timer lives in a context variable, so the queries an async
+    view runs in worker threads are counted as well.
+
+    :ivar get_response: The next middleware or view in the chain.
+    :type get_response: Callable
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        db_timer = _QueryTimer()
+        token = _query_timer.set(db_timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self._record(request, time.perf_counter() - start, db_timer)
+        return response
+
+    async def __acall__(self, request):
+        db_timer = _QueryTimer()
+        token = _query_timer.set(db_timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self._record(request, time.perf_counter() - start, db_timer)
+        return response
+
+    @staticmethod
+    def _record(request, duration, db_timer):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else '<unresolved>'
+        metrics.REQUEST_LATENCY.observe(duration, view=view, method=request.method)
+        metrics.REQUEST_DB_TIME.observe(db_timer.duration, view=view)
+        if db_timer.queries:
+            metrics.REQUEST_DB_QUERIES.inc(db_timer.queries, view=view)
+        metrics.registry.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses with Brotli or gzip, depending on ``Accept-Encoding``.
+
+    Only the text types of :data:`~main.compression.COMPRESSIBLE_TYPES` of at
+    least ``settings.COMPRESSION_MIN_SIZE`` bytes are compressed; PDF, images
+    and archives are sent as they are. Streaming responses are compressed
+    chunk by chunk as they are produced, without being buffered. The levels
+    come from ``settings.COMPRESSION_BROTLI_QUALITY`` and
+    ``settings.COMPRESSION_GZIP_LEVEL``.
+
+    Responses that rendered the CSRF token (those setting the CSRF cookie,
+    i.e. the form pages) are sent uncompressed: compressing a secret next to
+    data the attacker controls lets them guess it from the response sizes
+    (BREACH).
+
+    Must come before the middlewares that read or modify the response body,
+    and before ``CsrfViewMiddleware``, which sets the cookie.
+
+    :ivar get_response: The next middleware or view in the chain.
+    :type get_response: Callable
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.levels = {
+            'br': getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4),
+            'gzip': getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6),
+        }
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if not self._is_compressible(response):
+            return response
+        # Variante selon Accept-Encoding, même quand ce client-ci ne compresse pas (caches partagés)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        level = self.levels[encoding]
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding, level)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding, level)
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding, level)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Le contenu envoyé n'est plus identique octet pour octet : ETag faible
+        etag = response.headers.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _is_compressible(self, response):
+        if response.has_header('Content-Encoding') or 'no-transform' in response.get('Cache-Control', ''):
+            return False
+        # get_token() fait renvoyer le cookie : le jeton figure dans la page
+        if settings.CSRF_COOKIE_NAME in response.cookies:
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False
+        if response.streaming:
+            # Taille inconnue en général, sauf pour les fichiers
+            length = response.get('Content-Length')
+            return length is None or int(length) >= self.min_size
+        return len(response.content) >= self.min_size
+
+
+class _QueryTimer:
+    """Sums the time spent in the database by the queries of one request."""
+
+    def __init__(self):
+        self.duration = 0.0
+        self.queries = 0
+        self._lock = threading.Lock()  # Requêtes concurrentes d'une vue async
+
+    def add(self, duration):
+        with self._lock:
+            self.duration += duration
+            self.queries += 1
+
+
+def time_query(execute, sql, params, many, context):
+    """Execution wrapper adding the query to the timer of the current request, if any."""
+    db_timer = _query_timer.get()
+    if db_timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_timer.add(time.perf_counter() - start)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of read-only pages to the replica database.
+
+    A request is served from the replica when it is a ``GET``/``HEAD`` on one
+    of the URL names of ``settings.REPLICA_READ_VIEWS`` and its session is not
+    pinned to the primary by a recent write. Must come after the session
+    middleware.
+
+    :ivar get_response: The next middleware or view in the chain.
+    :type get_response: Callable
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        use_replica = self._is_read_only(request) and not is_pinned_to_primary(request)
+        with reads_from_replica(use_replica):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # La lecture de la session touche la base : hors de la boucle d'événements
+        use_replica = self._is_read_only(request) and not await sync_to_async(is_pinned_to_primary)(request)
+        with reads_from_replica(use_replica):
+            return await self.get_response(request)
+
+    @staticmethod
+    def _is_read_only(request):
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            view_name = None
+        return request.method in ('GET', 'HEAD') and view_name in getattr(settings, 'REPLICA_READ_VIEWS', ())
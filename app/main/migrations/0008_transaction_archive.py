@@ -0,0 +1,47 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_client_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('Achat', 'Achat'), ('Vente', 'Vente')], max_length=16)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_time', models.DateTimeField(null=True)),
+                ('client', models.ForeignKey(blank=True, db_column='client_id', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='transaction_summaries', to='main.client')),
+                ('produit', models.ForeignKey(db_column='produit_id', on_delete=django.db.models.deletion.CASCADE, related_name='transaction_summaries', to='main.stock')),
+            ],
+            options={
+                'db_table': 'transactions_summary',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField(default=1)),
+                ('new_stock_qt', models.IntegerField(db_column='stock_quantity', default=1)),
+                ('time', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10, null=True)),
+                ('type', models.CharField(choices=[('Achat', 'Achat'), ('Vente', 'Vente')], default='Vente', max_length=16)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(blank=True, db_column='client_id', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_transactions', to='main.client')),
+                ('produit', models.ForeignKey(db_column='produit_id', on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='main.stock')),
+            ],
+            options={
+                'db_table': 'transactions_archive',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['name', 'surname'], name='clients_name_surname_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-19 16:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_client_name_surname_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField()),
+                ('quantity', models.IntegerField()),
+                ('taken_at', models.DateTimeField(auto_now_add=True)),
+                ('produit', models.ForeignKey(db_column='produit_id', on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='main.stock')),
+            ],
+            options={
+                'db_table': 'stock_snapshots',
+            },
+        ),
+    ]
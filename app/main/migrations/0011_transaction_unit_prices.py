@@ -0,0 +1,92 @@
+# Generated by Django 4.2.20 on 2026-10-19 16:26
+
+from django.db import migrations, models, transaction
+from django.db.models import Case, F, FloatField, Max, Min, OuterRef, Subquery, When
+from django.db.models.functions import Cast, Coalesce, Round
+
+BATCH_SIZE = 10000
+
+
+def backfill_unit_prices(apps, schema_editor):
+    """
+    Fills the unit price and cost of the existing transactions, by batches of ids.
+
+    ``price`` was the unit price of the time times the quantity: the sale price
+    of a sale and the cost of a purchase are derived from it, the other one
+    falls back to the current price of the product.
+    """
+    db_alias = schema_editor.connection.alias
+    Stock = apps.get_model('main', 'Stock')
+    stock = Stock.objects.using(db_alias).filter(pk=OuterRef('produit_id'))
+    current_price = Subquery(stock.values('prix_vente'))
+    current_cost = Subquery(stock.values('prix_achat'))
+    recorded = Case(
+        When(quantity__gt=0, price__isnull=False,
+             then=Round(Cast('price', FloatField()) / F('quantity'), 2)),
+        default=None,
+    )
+
+    for model_name in ('Transaction', 'ArchivedTransaction'):
+        model = apps.get_model('main', model_name)
+        bounds = model.objects.using(db_alias).aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            continue
+        for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+            # Un lot par transaction : la table reste disponible pendant la migration
+            with transaction.atomic(using=db_alias):
+                batch = model.objects.using(db_alias).filter(id__gte=start, id__lt=start + BATCH_SIZE)
+                batch.filter(type='Vente').update(unit_price=Coalesce(recorded, current_price),
+                                                  unit_cost=current_cost)
+                batch.filter(type='Achat').update(unit_price=current_price,
+                                                  unit_cost=Coalesce(recorded, current_cost))
+
+    # Totaux archivés : le coût valait jusqu'ici la quantité au prix d'achat actuel
+    TransactionSummary = apps.get_model('main', 'TransactionSummary')
+    TransactionSummary.objects.using(db_alias).update(cost=F('quantity') * current_cost)
+
+
+class Migration(migrations.Migration):
+    # Les lots sont validés un par un
+    atomic = False
+
+    dependencies = [
+        ('main', '0010_stock_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='transactionsummary',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+        # Index créés après le remplissage : ils ne sont pas maintenus pendant les mises à jour
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['type', 'time', 'produit', 'client', 'quantity', 'unit_price', 'unit_cost'], name='transactions_amounts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['produit', 'type', 'time', 'quantity', 'unit_price', 'unit_cost'], name='transactions_product_amts_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:02
+
+from django.db import migrations, models, transaction
+from django.db.models import F, Max, Min
+
+BATCH_SIZE = 10000
+
+
+def backfill_cogs(apps, schema_editor):
+    """
+    Values the existing sales at their recorded unit cost, by batches of ids.
+
+    These are the figures the pages showed so far; ``manage.py rebuild_costs``
+    replaces them with the weighted average cost.
+    """
+    db_alias = schema_editor.connection.alias
+    for model_name in ('Transaction', 'ArchivedTransaction'):
+        model = apps.get_model('main', model_name)
+        bounds = model.objects.using(db_alias).aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            continue
+        for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+            with transaction.atomic(using=db_alias):
+                model.objects.using(db_alias).filter(
+                    id__gte=start, id__lt=start + BATCH_SIZE, type='Vente',
+                ).update(cogs=F('quantity') * F('unit_cost'))
+
+
+class Migration(migrations.Migration):
+    # Les lots sont validés un par un
+    atomic = False
+
+    dependencies = [
+        ('main', '0011_transaction_unit_prices'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_amounts_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_product_amts_idx',
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='cogs',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='average_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='cogs',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_cogs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['type', 'time', 'produit', 'client', 'quantity', 'unit_price', 'cogs'], name='transactions_amounts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['produit', 'type', 'time', 'quantity', 'unit_price', 'cogs'], name='transactions_product_amts_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_cost_of_goods_sold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['time'], name='transactions_time_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def seed_change_log(apps, schema_editor):
+    """
+    Logs every existing product and client once, so that a till syncing from 0 gets the whole catalog.
+    """
+    db_alias = schema_editor.connection.alias
+    ChangeLog = apps.get_model('main', 'ChangeLog')
+    for model, model_name in (('stock', 'Stock'), ('client', 'Client')):
+        pks = apps.get_model('main', model_name).objects.using(db_alias).order_by('pk').values_list('pk', flat=True)
+        ChangeLog.objects.using(db_alias).bulk_create(
+            (ChangeLog(model=model, object_id=pk) for pk in pks.iterator(chunk_size=BATCH_SIZE)),
+            batch_size=BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_transaction_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'change_log',
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
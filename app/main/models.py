@@ -1,8 +1,53 @@
 from django.db import models
-from django.db.models import Func
+from django.db.models import DEFERRED, Func
 
 
-class Stock(models.Model):
+class TrackedModel(models.Model):
+    """
+    Abstract model remembering the values an instance was loaded with.
+
+    Lets the signal handlers tell which fields a ``save()`` actually changed,
+    without reading the row again (see :meth:`has_changed`).
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Champs différés exclus : leur valeur n'a pas été lue
+        instance._loaded_values = {name: value for name, value in zip(field_names, values) if value is not DEFERRED}
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Après les signaux post_save : la sauvegarde suivante se compare aux valeurs désormais en base
+        update_fields = kwargs.get('update_fields')
+        saved = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+            if update_fields is None or field.name in update_fields or field.attname in update_fields
+        }
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), **saved}
+
+    def has_changed(self, *fields):
+        """
+        Tells whether one of the given fields differs from its value in the database.
+
+        Meant for ``post_save`` receivers, which run before the loaded values are refreshed.
+
+        :param fields: Names of the fields to compare.
+        :type fields: str
+        :return: ``True`` as well when the instance was not read from the database.
+        :rtype: bool
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(name not in loaded or loaded[name] != getattr(self, name) for name in fields)
+
+
+class Stock(TrackedModel):
     """
     Represents a Stock model for managing product inventory in a database.
 
@@ -22,11 +67,16 @@ class Stock(models.Model):
     :ivar prix_achat: The purchase price of the product, expressed as a decimal
         value with up to 10 digits and 2 decimal places.
     :type prix_achat: Decimal
+    :ivar average_cost: The weighted average unit cost of the units in stock,
+        maintained by :mod:`main.costing`. ``None`` until the first transaction:
+        the stock is then valued at its purchase price.
+    :type average_cost: Decimal or None
     """
     produit = models.CharField(max_length=255, unique=True)
     quantity = models.PositiveIntegerField(default=0)
     prix_vente = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     prix_achat = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
 
     class Meta:
         db_table = 'stock'  # Pour correspondre au nom de table existant
@@ -36,7 +86,7 @@ class Stock(models.Model):
         return self.produit
 
 
-class Client(models.Model):
+class Client(TrackedModel):
     """
     Represents a client or a supplier in the system.
 
@@ -60,6 +110,10 @@ class Client(models.Model):
     class Meta:
         db_table = 'clients'
         app_label = 'main'
+        indexes = [
+            # Autocomplétion par préfixe nom / prénom
+            models.Index(fields=['name', 'surname'], name='clients_name_surname_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} {self.surname}"
@@ -87,6 +141,15 @@ class Transaction(models.Model):
     :ivar price: The price involved in the transaction, used primarily for
         stock entry operations. Optional.
     :type price: Decimal or None
+    :ivar unit_price: The selling price of the product when the transaction was
+        recorded.
+    :type unit_price: Decimal
+    :ivar unit_cost: The purchase price of the product when the transaction was
+        recorded.
+    :type unit_cost: Decimal
+    :ivar cogs: For a sale, the cost of the goods sold at the weighted average
+        cost of the product (see :mod:`main.costing`), 0 for a purchase.
+    :type cogs: Decimal
     :ivar type: The type of transaction, either purchase ("Achat") or sale
         ("Vente").
     :type type: str
@@ -98,11 +161,24 @@ class Transaction(models.Model):
     client = models.ForeignKey(Client, on_delete=models.DO_NOTHING, db_column='client_id', null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0,
                                 null=True)  # Utilisé seulement dans le cas d'entrée en stock
+    # Prix du produit au moment de la transaction : les totaux ne dépendent plus des prix actuels
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cogs = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     type = models.CharField(max_length=16, choices=(("Achat", "Achat"), ("Vente", "Vente")), default="Vente")
 
     class Meta:
         db_table = 'transactions'
         app_label = 'main'
+        indexes = [
+            # Index couvrants des agrégats de CA / coût / marge : lus sans toucher la table
+            models.Index(fields=['type', 'time', 'produit', 'client', 'quantity', 'unit_price', 'cogs'],
+                         name='transactions_amounts_idx'),
+            models.Index(fields=['produit', 'type', 'time', 'quantity', 'unit_price', 'cogs'],
+                         name='transactions_product_amts_idx'),
+            # Hiérarchie de dates et tri par date de l'administration
+            models.Index(fields=['time'], name='transactions_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.produit.produit} - {self.quantity}"
@@ -119,6 +195,159 @@ class Transaction(models.Model):
     """
 
 
+class ArchivedTransaction(models.Model):
+    """
+    Represents a transaction moved out of the ``transactions`` table by the archive command.
+
+    Archived rows keep the primary key and every column of the original
+    transaction so that they can be audited or restored, but they are no longer
+    read by the pages: their totals are carried by :class:`TransactionSummary`.
+
+    :ivar produit: The stock item associated with the transaction.
+    :type produit: Stock
+    :ivar quantity: The quantity of items involved in the transaction.
+    :type quantity: int
+    :ivar new_stock_qt: The stock quantity after the transaction.
+    :type new_stock_qt: int
+    :ivar time: Timestamp of the original transaction.
+    :type time: datetime
+    :ivar client: The client associated with the transaction, optional.
+    :type client: Client or None
+    :ivar price: The total price of the transaction.
+    :type price: Decimal or None
+    :ivar unit_price: The selling price of the product when the transaction was recorded.
+    :type unit_price: Decimal
+    :ivar unit_cost: The purchase price of the product when the transaction was recorded.
+    :type unit_cost: Decimal
+    :ivar cogs: For a sale, the cost of the goods sold.
+    :type cogs: Decimal
+    :ivar type: The type of transaction, "Achat" or "Vente".
+    :type type: str
+    :ivar archived_at: Timestamp of the archive run that moved the row.
+    :type archived_at: datetime
+    """
+    id = models.BigIntegerField(primary_key=True)
+    produit = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='produit_id',
+                                related_name='archived_transactions')
+    quantity = models.IntegerField(default=1)
+    new_stock_qt = models.IntegerField(default=1, db_column='stock_quantity')
+    time = models.DateTimeField()
+    client = models.ForeignKey(Client, on_delete=models.DO_NOTHING, db_column='client_id', null=True, blank=True,
+                               related_name='archived_transactions')
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0, null=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cogs = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    type = models.CharField(max_length=16, choices=(("Achat", "Achat"), ("Vente", "Vente")), default="Vente")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'transactions_archive'
+        app_label = 'main'
+
+
+class TransactionSummary(models.Model):
+    """
+    Carries the totals of the archived transactions of a product, a client and a type.
+
+    One row exists per (product, client, type) combination found in the
+    archive, so that per-product figures are obtained by grouping on
+    ``produit`` and per-client figures by grouping on ``client``. All-time
+    figures are the sum of these rows and of the hot ``transactions`` table.
+
+    :ivar produit: The stock item the totals belong to.
+    :type produit: Stock
+    :ivar client: The client the totals belong to, ``None`` for anonymous sales.
+    :type client: Client or None
+    :ivar type: The type of the summarised transactions, "Achat" or "Vente".
+    :type type: str
+    :ivar count: Number of archived transactions.
+    :type count: int
+    :ivar quantity: Sum of their quantities.
+    :type quantity: int
+    :ivar amount: Sum of their prices.
+    :type amount: Decimal
+    :ivar cost: Cost of the goods sold for the sales, amount spent for the purchases.
+    :type cost: Decimal
+    :ivar last_time: Timestamp of the most recent archived transaction.
+    :type last_time: datetime
+    """
+    produit = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='produit_id',
+                                related_name='transaction_summaries')
+    client = models.ForeignKey(Client, on_delete=models.DO_NOTHING, db_column='client_id', null=True, blank=True,
+                               related_name='transaction_summaries')
+    type = models.CharField(max_length=16, choices=(("Achat", "Achat"), ("Vente", "Vente")))
+    count = models.PositiveIntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_time = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = 'transactions_summary'
+        app_label = 'main'
+
+
+class StockSnapshot(models.Model):
+    """
+    Checkpoint of the transaction ledger of a product.
+
+    A snapshot records the stock quantity after a given transaction once the
+    ``new_stock_qt`` chain up to it has been verified, so that the next
+    reconciliations only read the transactions recorded since then.
+
+    :ivar produit: The stock item the snapshot belongs to.
+    :type produit: Stock
+    :ivar last_transaction_id: Primary key of the last transaction covered by the snapshot.
+    :type last_transaction_id: int
+    :ivar quantity: The stock quantity after that transaction.
+    :type quantity: int
+    :ivar taken_at: Timestamp of the reconciliation run that took the snapshot.
+    :type taken_at: datetime
+    """
+    produit = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='produit_id',
+                                related_name='snapshots')
+    last_transaction_id = models.BigIntegerField()
+    quantity = models.IntegerField()
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'stock_snapshots'
+        app_label = 'main'
+
+
+class ChangeLog(models.Model):
+    """
+    Sequence of the changes of the stock catalog and of the clients, read by the till sync API.
+
+    A row is appended in the transaction of every creation, deletion or change
+    of a synced field (see :data:`main.sync.FEEDS`) of a product or a client;
+    its ``seq`` orders the changes. Only the latest row of each object is
+    needed to replay the feed: ``manage.py compact_changelog`` deletes the
+    others.
+
+    :ivar seq: Sequence number of the change.
+    :type seq: int
+    :ivar model: Model of the changed object, "stock" or "client".
+    :type model: str
+    :ivar object_id: Primary key of the changed object.
+    :type object_id: int
+    :ivar deleted: Whether the object was deleted (tombstone).
+    :type deleted: bool
+    :ivar time: Timestamp of the change.
+    :type time: datetime
+    """
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'change_log'
+        app_label = 'main'
+
+
 class ExtractMonth(Func):
     """
     Represents a SQL function to extract the month part from a given date or datetime field.
@@ -0,0 +1,103 @@
+"""
+Permission sets cached in the shared cache.
+
+Every view is guarded by ``permission_required``: with the stock
+:class:`~django.contrib.auth.backends.ModelBackend`, the first check of each
+request reads the permissions of the user and of their groups from the
+database (two queries). :class:`CachedModelBackend` keeps the resolved sets
+of each user in the cache shared by the workers, so that a request only
+reads them again after a change.
+
+Invalidation (see :mod:`main.signals`): a change to one user (their groups
+or their own permissions) bumps the version stamp of that user; a change to
+a group or to the permissions of a group bumps a global stamp, which
+invalidates the entries of every user at once. An entry holds both stamps,
+read before the permissions: a request that read the database before a
+change cannot store sets that outlive it.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import versioning
+
+VERSION_KEY = 'permissions_version'
+
+
+def data_version():
+    """
+    Returns the current version stamp of the groups and their permissions.
+
+    :rtype: int
+    """
+    return versioning.current(VERSION_KEY)
+
+
+def bump_data_version():
+    """Invalidates the cached permissions of every user, after a group or its permissions changed."""
+    versioning.bump(VERSION_KEY)
+
+
+def user_key(user_pk):
+    return f"permissions:user:{user_pk}"
+
+
+def user_version_key(user_pk):
+    return f"permissions:user_version:{user_pk}"
+
+
+def user_version(user_pk):
+    """
+    Returns the current version stamp of the groups and own permissions of one user.
+
+    :param user_pk: Primary key of the user.
+    :type user_pk: int
+    :rtype: int
+    """
+    return versioning.current(user_version_key(user_pk))
+
+
+def invalidate_user(user_pk):
+    """
+    Invalidates the cached permissions of one user.
+
+    :param user_pk: Primary key of the user.
+    :type user_pk: int
+    """
+    versioning.bump(user_version_key(user_pk))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    :class:`~django.contrib.auth.backends.ModelBackend` whose permission sets are read from the shared cache.
+
+    The entry of a user holds the global and user version stamps it was
+    computed under, the permissions of the user and those of their groups, as sets of
+    ``"app_label.codename"`` strings.
+    """
+
+    def get_user_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return self._cached_permissions(user_obj)[0]
+
+    def get_group_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return self._cached_permissions(user_obj)[1]
+
+    def _cached_permissions(self, user_obj):
+        # Copie par requête, comme les attributs _perm_cache de ModelBackend
+        if not hasattr(user_obj, '_cached_permissions'):
+            # Versions lues avant les permissions : un changement concurrent invalide l'entrée écrite
+            version = (data_version(), user_version(user_obj.pk))
+            entry = cache.get(user_key(user_obj.pk))
+            if entry is None or entry[0] != version:
+                entry = (
+                    version,
+                    super().get_user_permissions(user_obj),
+                    super().get_group_permissions(user_obj),
+                )
+                cache.set(user_key(user_obj.pk), entry, timeout=settings.PERMISSION_CACHE_TIMEOUT)
+            user_obj._cached_permissions = entry[1:]
+        return user_obj._cached_permissions
@@ -0,0 +1,70 @@
+"""
+Lean read models of the transactions, for the pages and reports that only display them.
+
+Rows are named tuples built straight from ``values_list()``: no model
+instance is created and the names of the product and of the client are
+joined in the same query, instead of one lazy foreign key fetch per row.
+"""
+from collections import namedtuple
+
+# Attribut de la ligne -> champ lu par values_list()
+TRANSACTION_FIELDS = {
+    'id': 'id',
+    'time': 'time',
+    'type': 'type',
+    'quantity': 'quantity',
+    'price': 'price',
+    'unit_price': 'unit_price',
+    'unit_cost': 'unit_cost',
+    'new_stock_qt': 'new_stock_qt',
+    'produit_id': 'produit_id',
+    'produit': 'produit__produit',
+    'client_id': 'client_id',
+    'client_name': 'client__name',
+    'client_surname': 'client__surname',
+}
+
+
+class TransactionRow(namedtuple('TransactionRow', TRANSACTION_FIELDS)):
+    """
+    A transaction as displayed: its own columns plus the product name and the client names.
+
+    ``produit`` is the name of the product, not the ``Stock`` instance.
+    """
+    __slots__ = ()
+
+    @property
+    def client(self):
+        """
+        Returns the full name of the client or supplier, ``None`` without one.
+
+        :rtype: str or None
+        """
+        if self.client_id is None:
+            return None
+        return f"{self.client_name} {self.client_surname}"
+
+
+def transaction_rows(transactions):
+    """
+    Reads a queryset of transactions as :class:`TransactionRow`, in one query.
+
+    :param transactions: The transactions, filtered, ordered and sliced as needed.
+    :type transactions: QuerySet
+    :rtype: list[TransactionRow]
+    """
+    return list(map(TransactionRow._make, transactions.values_list(*TRANSACTION_FIELDS.values())))
+
+
+def iter_transaction_rows(transactions, chunk_size=2000):
+    """
+    Streams a queryset of transactions as :class:`TransactionRow`, read by chunks.
+
+    :param transactions: The transactions, filtered and ordered.
+    :type transactions: QuerySet
+    :param chunk_size: Rows fetched from the database at a time.
+    :type chunk_size: int
+    :rtype: Iterator[TransactionRow]
+    """
+    return map(TransactionRow._make,
+               transactions.values_list(*TRANSACTION_FIELDS.values()).iterator(chunk_size=chunk_size))
@@ -0,0 +1,261 @@
+"""
+PDF report pipeline.
+
+A report is an ordered list of :class:`Section`. The sections do not depend
+on each other until the document is assembled, so each one runs its queries
+and builds its flowables in a bounded thread pool, while its chart, which is
+CPU bound, is drawn in a pool of worker processes. The flowables are then
+assembled in the order of the sections: the latency of a report approaches
+the one of its slowest section instead of the sum of all of them.
+
+A section with an unbounded number of rows (e.g. a full transaction
+history) is a *stream* section: its flowables are generated lazily in the
+thread building the document, as the pages are laid out, and every page is
+compressed as soon as it is finished. The rows are therefore never all in
+memory, only the compressed pages are.
+
+Pool sizes come from ``settings.REPORT_THREADS`` and
+``settings.REPORT_PROCESSES`` (``0`` draws the charts in the section thread).
+"""
+import contextvars
+import io
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connections
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFDictionary, PDFName, PDFStream
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate
+
+_pools_lock = threading.Lock()
+_thread_pool = None
+_process_pool = None
+
+
+class Section:
+    """
+    One independent part of a report.
+
+    To be drawn in another process, ``chart`` must be picklable (a module
+    level function, or a :func:`functools.partial` of one).
+
+    :ivar render: Builds the flowables of the section from its data and chart:
+        ``render(data, image)`` where ``image`` is PNG bytes or ``None``.
+    :type render: Callable[[object, bytes | None], list]
+    :ivar fetch: Runs the queries of the section and returns its data, if any.
+    :type fetch: Callable[[], object] or None
+    :ivar chart: Draws the chart of the section from its data, if any.
+    :type chart: Callable[[object], bytes | None] or None
+    :ivar data: Data of the section when it is already known (e.g. prefetched
+        for a batch of reports), used instead of ``fetch``.
+    :type data: object
+    :ivar stream: ``fetch`` and ``render`` return iterators, consumed in the
+        thread building the document while the pages are laid out.
+    :type stream: bool
+    """
+
+    def __init__(self, render, fetch=None, chart=None, data=None, stream=False):
+        self.render = render
+        self.fetch = fetch
+        self.chart = chart
+        self.data = data
+        self.stream = stream
+
+    def produce(self, local=False):
+        """
+        Builds the section in the current thread.
+
+        :param local: Draw the chart in the current process rather than in the process pool.
+        :type local: bool
+        :return: The flowables of the section.
+        :rtype: list
+        """
+        data = self.fetch() if self.fetch else self.data
+        image = None
+        if self.chart:
+            image = self.chart(data) if local else render_chart(self.chart, data)
+        return self.render(data, image)
+
+
+def build_pdf(sections, output=None, pagesize=letter):
+    """
+    Produces the sections concurrently and assembles them into a PDF document.
+
+    :param sections: The sections of the report, in document order.
+    :type sections: list[Section]
+    :param output: Binary file receiving the document, a new ``BytesIO`` by default.
+    :param pagesize: Page size of the document.
+    :return: ``output``, positioned at the end of the document.
+    """
+    output = output if output is not None else io.BytesIO()
+    SimpleDocTemplate(output, pagesize=pagesize).build(
+        _LazyFlowables(run_sections(sections)), canvasmaker=_CompressingCanvas,
+    )
+    return output
+
+
+def render_pdf(sections, pagesize=letter):
+    """
+    Builds a whole document in the current thread and process, sections one after the other.
+
+    Meant for the worker processes of a batch export, where the parallelism
+    is across reports: the sections must not need the database.
+
+    :param sections: The sections of the report, in document order.
+    :type sections: list[Section]
+    :return: The PDF document.
+    :rtype: bytes
+    """
+    output = io.BytesIO()
+    SimpleDocTemplate(output, pagesize=pagesize).build(
+        [flowable for section in sections for flowable in section.produce(local=True)]
+    )
+    return output.getvalue()
+
+
+def run_sections(sections):
+    """
+    Starts producing the sections in the thread pool and returns their flowables in order.
+
+    The context (replica routing, request metrics) is copied into every
+    section; each section closes the database connections of its thread
+    when it is done. Stream sections are not submitted: they are produced
+    by the caller's thread while it iterates over the result.
+
+    :param sections: The sections to produce.
+    :type sections: list[Section]
+    :rtype: Iterator
+    """
+    pool = _threads()
+    parts = [
+        section if section.stream else pool.submit(contextvars.copy_context().run, _produce, section)
+        for section in sections
+    ]
+    return (
+        flowable
+        for part in parts
+        for flowable in (part.produce() if isinstance(part, Section) else part.result())
+    )
+
+
+def render_chart(chart, *args):
+    """
+    Draws a chart in the process pool and waits for the image.
+
+    :param chart: Picklable callable returning the PNG bytes of the chart.
+    :type chart: Callable
+    :return: What ``chart`` returned.
+    """
+    pool = process_pool()
+    if pool is None:
+        return chart(*args)
+    try:
+        return pool.submit(chart, *args).result()
+    except BrokenProcessPool:
+        # Un worker a été tué (mémoire, signal) : on recrée le pool au prochain rapport
+        discard_process_pool(pool)
+        return chart(*args)
+
+
+class _LazyFlowables(list):
+    """
+    List of flowables filled from an iterator as the document template consumes it.
+
+    The template only looks at the first few flowables of its list and
+    removes them once drawn, so keeping a few of them ahead is enough.
+    """
+
+    LOOKAHEAD = 16
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _fill(self):
+        while self._source is not None and super().__len__() < self.LOOKAHEAD:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._fill()
+        return super().__getitem__(index)
+
+
+class _CompressingCanvas(Canvas):
+    """Canvas compressing the content of every page when it is finished rather than when the document is saved."""
+
+    def showPage(self):
+        pages = self._doc.Pages.pages
+        first = len(pages)
+        super().showPage()
+        for page in pages[first:]:
+            if page.stream and page.compression and not page.Contents:
+                stream = page.stream.encode('utf8') if isinstance(page.stream, str) else page.stream
+                page.Contents = PDFStream(
+                    PDFDictionary({'Filter': PDFArray([PDFName('FlateDecode')])}), zlib.compress(stream),
+                )
+                page.stream = None
+
+
+def _produce(section):
+    try:
+        return section.produce()
+    finally:
+        connections.close_all()
+
+
+def _threads():
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REPORT_THREADS', 4), thread_name_prefix='report-section',
+            )
+        return _thread_pool
+
+
+def process_pool():
+    """
+    Returns the shared pool of worker processes, or ``None`` when ``REPORT_PROCESSES`` is 0.
+
+    The workers set Django up when they start, so that they can import the
+    report modules; they must still not query the database.
+
+    :rtype: ProcessPoolExecutor or None
+    """
+    global _process_pool
+    workers = getattr(settings, 'REPORT_PROCESSES', 2)
+    if not workers:
+        return None
+    with _pools_lock:
+        if _process_pool is None:
+            # "spawn" : les workers ne doivent hériter ni des connexions ni des threads du serveur
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_setup_worker,
+            )
+        return _process_pool
+
+
+def discard_process_pool(pool):
+    """Forgets a broken process pool, a new one is started at the next report."""
+    global _process_pool
+    with _pools_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _setup_worker():
+    import django
+    django.setup()
@@ -0,0 +1,63 @@
+"""
+Charts of the PDF reports.
+
+These functions run in the worker processes of the report pipeline: they
+only depend on matplotlib (never on Django) and draw on their own
+:class:`~matplotlib.figure.Figure` instead of the global ``pyplot`` state, so
+they are also safe to call from several threads.
+"""
+import io
+
+from matplotlib.figure import Figure
+
+
+def _png(figure):
+    output = io.BytesIO()
+    figure.savefig(output, format='png')
+    return output.getvalue()
+
+
+def daily_transactions(title, data):
+    """
+    Draws the sales and purchases of the last days as stacked bars.
+
+    :param title: Title of the chart.
+    :type title: str
+    :param data: ``labels`` (one per day), ``sales`` and ``purchases`` quantities.
+    :type data: dict
+    :return: The chart as a PNG image.
+    :rtype: bytes
+    """
+    labels = data['labels']
+    figure = Figure(figsize=(10, 5))
+    axes = figure.subplots()
+    axes.bar(range(len(labels)), data['sales'], color='blue', label='Ventes')
+    axes.bar(range(len(labels)), data['purchases'], color='green', label='Achats', bottom=data['sales'])
+    axes.set_title(title)
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Quantité')
+    axes.legend()
+    axes.set_xticks(range(0, len(labels), 5), [labels[i] for i in range(0, len(labels), 5)])
+    return _png(figure)
+
+
+def monthly_activity(data):
+    """
+    Draws the number of transactions per month.
+
+    :param data: ``months`` labels and their transaction ``counts``.
+    :type data: dict
+    :return: The chart as a PNG image, or ``None`` when there is no activity.
+    :rtype: bytes or None
+    """
+    if not data['months']:
+        return None
+    figure = Figure(figsize=(10, 4))
+    axes = figure.subplots()
+    axes.bar(range(len(data['counts'])), data['counts'], color='skyblue')
+    axes.set_title('Activité mensuelle')
+    axes.set_xlabel('Mois')
+    axes.set_ylabel('Nombre de transactions')
+    axes.set_xticks(range(len(data['months'])), data['months'], rotation=45)
+    figure.tight_layout()
+    return _png(figure)
@@ -0,0 +1,250 @@
+"""
+Report of a client or supplier, served by ``generate_client_pdf_report``.
+
+Archived transactions (see :mod:`main.archive`) are added to the all-time
+figures. The data of every section is made of plain values, except the
+transaction list: it covers the whole history and is a stream section, read
+from the database while the pages are laid out.
+"""
+import io
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.db.models import Sum, Count
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Table, LongTable, TableStyle, Spacer, Image
+
+from . import Section, charts
+from ..archive import archived_totals, archived_product_totals
+from ..models import Transaction, ExtractMonth, ExtractYear
+from ..read_models import iter_transaction_rows
+
+TRANSACTION_TABLE_ROWS = 500  # Lignes par tableau : découper un tableau recopie toutes ses lignes restantes
+TRANSACTION_FETCH_SIZE = 2000
+TRANSACTION_HEADER = ["Date", "Type", "Produit", "Quantité", "Montant"]
+TRANSACTION_COLUMNS = [1.3 * inch, 0.7 * inch, 2.4 * inch, 0.8 * inch, 1.3 * inch]  # Identiques d'un tableau à l'autre
+TRANSACTION_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+])
+STAT_TYPES = (('sells', 'Vente'), ('buys', 'Achat'))
+
+
+def client_summary(client):
+    """
+    Returns the fields of a client used by the report.
+
+    :param client: The client or supplier.
+    :type client: Client
+    :rtype: dict
+    """
+    return {'pk': client.pk, 'name': client.name, 'surname': client.surname, 'type': client.type}
+
+
+def sections(client, now):
+    """
+    Lists the sections of the report of a client or supplier.
+
+    :param client: The client or supplier.
+    :type client: Client
+    :param now: Reference time of the report.
+    :type now: datetime
+    :rtype: list[Section]
+    """
+    info = client_summary(client)
+    return [
+        Section(partial(render_header, info, now)),
+        Section(partial(render_general, info), fetch=partial(fetch_general, info)),
+        Section(render_periods, fetch=partial(fetch_periods, info['pk'], now)),
+        Section(render_transactions, fetch=partial(fetch_transactions, info['pk']), stream=True),
+        Section(render_activity, fetch=partial(fetch_monthly_activity, info['pk'], now), chart=charts.monthly_activity),
+    ]
+
+
+def report_periods(now):
+    """Returns the transaction filters of every period of the report, with its label."""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ("Dernière heure", {'time__gte': now - timedelta(hours=1)}),
+        ("Aujourd'hui", {'time__gte': today}),
+        ("Hier", {'time__range': [today - timedelta(days=1), today]}),
+        ("Cette semaine", {'time__gte': now - timedelta(days=now.weekday())}),
+        ("Ce mois", {'time__gte': now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)}),
+        ("Total", {}),
+    ]
+
+
+# Requêtes
+
+def fetch_general(info):
+    client_transactions = Transaction.objects.filter(client_id=info['pk'])
+    archived = archived_totals(client_id=info['pk'])
+
+    # Produit le plus acheté (fournisseur : ce qu'on lui achète)
+    main_type = "Vente" if info['type'] == "Client" else "Achat"
+    product_totals = {
+        row['produit__produit']: row['total']
+        for row in client_transactions.filter(type=main_type).values('produit__produit').annotate(total=Sum('quantity'))
+    }
+    archived_products = list(archived_product_totals(client_id=info['pk'], type=main_type))
+    for row in archived_products:
+        product_totals[row['produit__produit']] = product_totals.get(row['produit__produit'], 0) + row['quantity']
+
+    if product_totals:
+        most_purchased_product = max(product_totals, key=product_totals.get)
+        most_purchased_quantity = product_totals[most_purchased_product]
+    else:
+        most_purchased_product = "Aucun"
+        most_purchased_quantity = 0
+
+    total_transactions = client_transactions.count() + sum(total['count'] for total in archived.values())
+    total_amount = ((client_transactions.aggregate(total=Sum('price'))['total'] or 0)
+                    + sum(total['amount'] for total in archived.values()))
+
+    # Si c'est un client (qui achète) : bénéfice réalisé sur ses achats
+    total_benefit = None
+    if info['type'] == "Client":
+        totals = client_transactions.filter(type='Vente').aggregate(amount=Sum('price'), cost=Sum('cogs'))
+        total_benefit = (totals['amount'] or 0) - (totals['cost'] or 0)
+        total_benefit += sum(row['margin'] or 0 for row in archived_products)
+
+    return {
+        'total_transactions': total_transactions,
+        'most_purchased_product': most_purchased_product,
+        'most_purchased_quantity': most_purchased_quantity,
+        'total_amount': total_amount,
+        'total_benefit': total_benefit,
+    }
+
+
+def fetch_periods(pk, now):
+    client_transactions = Transaction.objects.filter(client_id=pk)
+    rows = []
+    for label, filters in report_periods(now):
+        transactions = client_transactions.filter(**filters)
+        rows.append([label] + [
+            transactions.filter(type=type_).aggregate(count=Count('id'), amount=Sum('price'))
+            for _key, type_ in STAT_TYPES
+        ])
+
+    # Report des transactions archivées dans les totaux
+    archived = archived_totals(client_id=pk)
+    for stats, (_key, type_) in zip(rows[-1][1:], STAT_TYPES):
+        stats['count'] += archived[type_]['count']
+        stats['amount'] = (stats['amount'] or 0) + archived[type_]['amount']
+    return rows
+
+
+def fetch_transactions(pk):
+    # Historique complet, lu par paquets : jamais chargé entièrement en mémoire
+    transactions = Transaction.objects.filter(client_id=pk).order_by('-time')
+    return map(transaction_row, iter_transaction_rows(transactions, chunk_size=TRANSACTION_FETCH_SIZE))
+
+
+def transaction_row(trans):
+    """Returns the line of a transaction (a :class:`~main.read_models.TransactionRow`) in the transaction table."""
+    return [trans.time.strftime("%Y-%m-%d %H:%M"), trans.type, trans.produit, trans.quantity,
+            f"{trans.price:.2f}€"]
+
+
+def fetch_monthly_activity(pk, now):
+    monthly_activity = Transaction.objects.filter(client_id=pk, time__gte=now - timedelta(days=365)).annotate(
+        month=ExtractMonth('time'),
+        year=ExtractYear('time')
+    ).values('month', 'year').annotate(
+        count=Count('id'),
+        total=Sum('price')
+    ).order_by('year', 'month')
+    months = []
+    counts = []
+    for item in monthly_activity:
+        months.append(f"{item['year']}-{item['month']}")
+        counts.append(item['count'])
+    return {'months': months, 'counts': counts}
+
+
+# Mise en page
+
+def render_header(info, now, data=None, image=None):
+    styles = getSampleStyleSheet()
+    return [
+        Paragraph(f"Rapport client: {info['name']} {info['surname']}", styles['Title']),
+        Paragraph(f"Type: {info['type']}", styles['Heading3']),
+        Paragraph(f"Date du rapport: {now.strftime('%Y-%m-%d %H:%M')}", styles['Heading3']),
+        Spacer(1, 20),
+    ]
+
+
+def render_general(info, data, image=None):
+    styles = getSampleStyleSheet()
+    client_stats_data = [
+        ["Métrique", "Valeur"],
+        ["Nombre total de transactions", data['total_transactions']],
+        ["Produit le plus {0}".format("acheté" if info['type'] == "Client" else "vendu"), data['most_purchased_product']],
+        ["Quantité", data['most_purchased_quantity']],
+        ["Montant total des transactions", f"{data['total_amount']:.2f}€"],
+    ]
+    if info['type'] == "Client":
+        client_stats_data.append(["Bénéfice total", f"{data['total_benefit']:.2f}€"])
+
+    client_stats_table = Table(client_stats_data)
+    client_stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    return [Paragraph("Statistiques générales", styles['Heading2']), client_stats_table, Spacer(1, 20)]
+
+
+def render_periods(rows, image=None):
+    styles = getSampleStyleSheet()
+    period_data = [["Période", "Ventes (Nb)", "Ventes (€)", "Achats (Nb)", "Achats (€)"]]
+    for period, sells, buys in rows:
+        period_data.append([
+            period,
+            sells['count'],
+            f"{sells['amount'] or 0:.2f}€",
+            buys['count'],
+            f"{buys['amount'] or 0:.2f}€"
+        ])
+
+    period_table = Table(period_data)
+    period_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ]))
+    return [Paragraph("Transactions par période", styles['Heading2']), period_table, Spacer(1, 20)]
+
+
+def render_transactions(rows, image=None):
+    styles = getSampleStyleSheet()
+    yield Paragraph("Liste des transactions", styles['Heading2'])
+    rows = iter(rows)
+    chunk = list(islice(rows, TRANSACTION_TABLE_ROWS))
+    if not chunk:
+        yield Paragraph("Aucune transaction trouvée", styles['Normal'])
+    while chunk:
+        # En-tête répété en haut de chaque page
+        trans_table = LongTable([TRANSACTION_HEADER] + chunk, colWidths=TRANSACTION_COLUMNS, repeatRows=1)
+        trans_table.setStyle(TRANSACTION_TABLE_STYLE)
+        yield trans_table
+        chunk = list(islice(rows, TRANSACTION_TABLE_ROWS))
+    yield Spacer(1, 20)
+
+
+def render_activity(data, image):
+    # Graphique d'activité mensuelle
+    if image is None:
+        return []
+    styles = getSampleStyleSheet()
+    return [Paragraph("Activité mensuelle", styles['Heading2']), Image(io.BytesIO(image), 7 * inch, 3 * inch)]
@@ -0,0 +1,147 @@
+"""
+Batch export of the product reports as a streamed ZIP archive.
+
+The products are handled in chunks: the data of a whole chunk is fetched
+with one query per section (:func:`~main.reports.stock_item.fetch_many`),
+then every report of the chunk is rendered in the process pool while the
+next chunk is fetched. Each PDF is written to the archive as soon as it is
+ready and the archive bytes are handed to the response right away, so the
+memory used does not depend on the number of products.
+
+The progress of an export is kept in the shared cache under the id chosen by
+the client, so that any worker can answer :func:`get_progress`.
+"""
+import io
+import zipfile
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.core.cache import cache
+from django.utils.text import slugify
+
+from . import process_pool, discard_process_pool, stock_item
+from ..models import Stock
+
+CHUNK_SIZE = 50
+PROGRESS_TIMEOUT = 3600
+
+
+def get_progress(export_id):
+    """
+    Returns the progress of an export.
+
+    :param export_id: Id chosen by the client when starting the export.
+    :type export_id: str
+    :return: ``total``, ``done``, ``errors`` and ``finished`` keys, or ``None`` for an unknown export.
+    :rtype: dict or None
+    """
+    return cache.get(_progress_key(export_id))
+
+
+def stream_stock_reports(stocks, now, export_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Generates a ZIP archive containing the report of every selected product.
+
+    :param stocks: The selected products.
+    :type stocks: QuerySet
+    :param now: Reference time of the reports.
+    :type now: datetime
+    :param export_id: Id under which the progress is published, if any.
+    :type export_id: str or None
+    :param chunk_size: Number of products whose data is fetched together.
+    :type chunk_size: int
+    :return: The successive bytes of the archive.
+    :rtype: Iterator[bytes]
+    """
+    pks = list(stocks.order_by('produit').values_list('pk', flat=True))
+    progress = {'total': len(pks), 'done': 0, 'errors': [], 'finished': False}
+    _publish(export_id, progress)
+
+    pipe = _ArchivePipe()
+    archive = zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_STORED)
+    pool = process_pool()
+    max_pending = 2 * (pool._max_workers if pool else 1)
+    pending = {}
+
+    def write(item, render):
+        try:
+            pdf = render()
+        except Exception as e:
+            progress['errors'].append(f"{item['produit']} : {e}")
+        else:
+            info = zipfile.ZipInfo(_report_name(item, now), date_time=now.timetuple()[:6])
+            archive.writestr(info, pdf)
+        progress['done'] += 1
+        _publish(export_id, progress)
+
+    def collect(block):
+        nonlocal pool
+        done, _not_done = wait(pending, return_when=ALL_COMPLETED if block else FIRST_COMPLETED)
+        for future in done:
+            item, data = pending.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                # Worker tué : rendu local pour ce rapport et les suivants
+                if pool is not None:
+                    discard_process_pool(pool)
+                    pool = None
+                write(item, partial(stock_item.render_report, item, now, data))
+            else:
+                write(item, future.result)
+
+    for start in range(0, len(pks), chunk_size):
+        rows = Stock.objects.filter(pk__in=pks[start:start + chunk_size]).order_by('produit')
+        items = [stock_item.item_summary(stock) for stock in rows]
+        chunk_data = stock_item.fetch_many(items, now)
+        for item in items:
+            data = chunk_data.pop(item['pk'])
+            if pool is None:
+                write(item, partial(stock_item.render_report, item, now, data))
+            else:
+                pending[pool.submit(stock_item.render_report, item, now, data)] = (item, data)
+                if len(pending) >= max_pending:
+                    collect(block=False)
+            yield pipe.drain()
+
+    if pending:
+        collect(block=True)
+    if progress['errors']:
+        archive.writestr('ERREURS.txt', '\n'.join(progress['errors']) + '\n')
+    archive.close()
+    yield pipe.drain()
+
+    progress['finished'] = True
+    _publish(export_id, progress)
+
+
+def _report_name(item, now):
+    return f"rapport_{item['pk']}_{slugify(item['produit']) or 'produit'}_{now:%Y%m%d}.pdf"
+
+
+def _publish(export_id, progress):
+    if export_id:
+        cache.set(_progress_key(export_id), {**progress, 'errors': len(progress['errors'])}, PROGRESS_TIMEOUT)
+
+
+def _progress_key(export_id):
+    return f"stock_reports_export:{export_id}"
+
+
+class _ArchivePipe(io.RawIOBase):
+    """Write-only, non seekable file collecting what the ZIP writer produces until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
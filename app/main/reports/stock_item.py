@@ -0,0 +1,319 @@
+"""
+Detailed report of one product, served by ``generate_stock_item_pdf``.
+
+The data of every section is made of plain values (no model instance) so
+that the render functions can run in another process.
+"""
+import io
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from django.db.models import Sum, F, Q, ExpressionWrapper, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Table, TableStyle, Spacer, Image
+
+from . import Section, charts, render_pdf
+from ..models import Transaction
+from ..read_models import transaction_rows, iter_transaction_rows
+
+HISTORY_DAYS = 30
+
+HEADER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+
+def item_summary(stock_item):
+    """
+    Returns the fields of a product used by the report.
+
+    :param stock_item: The product.
+    :type stock_item: Stock
+    :rtype: dict
+    """
+    return {
+        'pk': stock_item.pk,
+        'produit': stock_item.produit,
+        'quantity': stock_item.quantity,
+        'prix_achat': stock_item.prix_achat,
+        'prix_vente': stock_item.prix_vente,
+    }
+
+
+def sections(item, now, data=None):
+    """
+    Lists the sections of the report of a product.
+
+    :param item: The product, as returned by :func:`item_summary`.
+    :type item: dict
+    :param now: Reference time of the report.
+    :type now: datetime
+    :param data: Data prefetched by :func:`fetch_many` for this product; the
+        sections run their own queries when omitted.
+    :type data: dict or None
+    :rtype: list[Section]
+    """
+    if data is None:
+        fetch = {
+            'sales': partial(fetch_sales, item['pk'], now),
+            'daily': partial(fetch_daily_quantities, item['pk'], now),
+            'recent': partial(fetch_recent, item, now),
+        }
+        data = {}
+    else:
+        fetch = {}
+    return [
+        Section(partial(render_header, item, now)),
+        Section(partial(render_details, item)),
+        Section(partial(render_valuation, item)),
+        Section(render_sales, fetch=fetch.get('sales'), data=data.get('sales')),
+        Section(render_chart, fetch=fetch.get('daily'), data=data.get('daily'),
+                chart=partial(charts.daily_transactions, chart_title(item))),
+        Section(render_recent, fetch=fetch.get('recent'), data=data.get('recent')),
+    ]
+
+
+def render_report(item, now, data):
+    """
+    Renders the report of a product from prefetched data, in the current process.
+
+    Module level so that it can be sent to the worker processes of a batch export.
+
+    :return: The PDF document.
+    :rtype: bytes
+    """
+    return render_pdf(sections(item, now, data))
+
+
+def chart_title(item):
+    return f"Transactions pour {item['produit']} ({HISTORY_DAYS} derniers jours)"
+
+
+def sales_periods(now):
+    """Returns the start of every period of the sales statistics, with its label."""
+    return [
+        ("Dernière heure", now - timedelta(hours=1)),
+        ("Aujourd'hui", now.replace(hour=0, minute=0, second=0, microsecond=0)),
+        ("Cette semaine", now - timedelta(days=now.weekday())),
+        ("Ce mois-ci", now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)),
+        ("Cette année", now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)),
+    ]
+
+
+def history_days(now):
+    """Returns the days covered by the chart, oldest first."""
+    first_day = (now - timedelta(days=HISTORY_DAYS)).date()
+    return [first_day + timedelta(days=i) for i in range(HISTORY_DAYS + 1)]
+
+
+# Requêtes
+
+def fetch_sales(pk, now):
+    rows = []
+    for label, start in sales_periods(now):
+        totals = Transaction.objects.filter(produit_id=pk, type='Vente', time__gte=start).aggregate(
+            total_quantity=Sum('quantity'),
+            total_value=Sum(_sale_value()),
+        )
+        rows.append((label, totals['total_quantity'] or 0, totals['total_value'] or 0))
+    return rows
+
+
+def _sale_value():
+    return ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def fetch_daily_quantities(pk, now):
+    # Une requête groupée par jour et par type plutôt que deux requêtes par jour
+    days = history_days(now)
+    start = timezone.make_aware(datetime.combine(days[0], time.min))
+    totals = {
+        (row['day'], row['type']): row['total']
+        for row in Transaction.objects.filter(produit_id=pk, time__gte=start)
+        .annotate(day=TruncDate('time'))
+        .values('day', 'type')
+        .annotate(total=Sum('quantity'))
+    }
+    return daily_series(days, totals)
+
+
+def daily_series(days, totals):
+    """
+    Builds the data of the chart from quantities per ``(day, type)``.
+
+    :rtype: dict
+    """
+    return {
+        'labels': [day.strftime('%d/%m') for day in days],
+        'sales': [totals.get((day, 'Vente')) or 0 for day in days],
+        'purchases': [totals.get((day, 'Achat')) or 0 for day in days],
+    }
+
+
+def fetch_recent(item, now):
+    transactions = (
+        Transaction.objects.filter(produit_id=item['pk'], time__gte=now - timedelta(days=HISTORY_DAYS))
+        .order_by('-time')
+    )
+    return [recent_row(trans) for trans in transaction_rows(transactions)]
+
+
+def recent_row(trans):
+    """Returns the line of a transaction (a :class:`~main.read_models.TransactionRow`) in the history table."""
+    client_name = trans.client or "N/A"
+    if trans.type == 'Vente':
+        total_price = trans.quantity * trans.unit_price
+    else:
+        total_price = trans.quantity * trans.unit_cost
+    return [trans.time.strftime("%d/%m/%Y %H:%M"), trans.type, trans.quantity, f"{total_price:.2f}€", client_name]
+
+
+def fetch_many(items, now):
+    """
+    Fetches the data of the reports of several products with one query per section.
+
+    :param items: The products, as returned by :func:`item_summary`.
+    :type items: list[dict]
+    :param now: Reference time of the reports.
+    :type now: datetime
+    :return: The data to pass to :func:`sections`, by product id.
+    :rtype: dict[int, dict]
+    """
+    pks = [item['pk'] for item in items]
+    transactions = Transaction.objects.filter(produit_id__in=pks)
+
+    # Ventes : une somme conditionnelle par période
+    periods = sales_periods(now)
+    aggregates = {}
+    for index, (_label, start) in enumerate(periods):
+        aggregates[f'quantity_{index}'] = Sum('quantity', filter=Q(time__gte=start))
+        aggregates[f'value_{index}'] = Sum(_sale_value(), filter=Q(time__gte=start))
+    sales = {
+        row['produit_id']: row
+        for row in transactions.filter(type='Vente', time__gte=min(start for _label, start in periods))
+        .values('produit_id').annotate(**aggregates)
+    }
+
+    # Graphique : quantités par produit, jour et type
+    days = history_days(now)
+    daily = {}
+    for row in (transactions.filter(time__gte=timezone.make_aware(datetime.combine(days[0], time.min)))
+                .annotate(day=TruncDate('time'))
+                .values('produit_id', 'day', 'type')
+                .annotate(total=Sum('quantity'))):
+        daily.setdefault(row['produit_id'], {})[(row['day'], row['type'])] = row['total']
+
+    # Historique : lu en flux, déjà trié par produit
+    recent = {}
+    for trans in iter_transaction_rows(transactions.filter(time__gte=now - timedelta(days=HISTORY_DAYS))
+                                       .order_by('produit_id', '-time')):
+        recent.setdefault(trans.produit_id, []).append(recent_row(trans))
+
+    data = {}
+    for pk in pks:
+        row = sales.get(pk, {})
+        data[pk] = {
+            'sales': [
+                (label, row.get(f'quantity_{index}') or 0, row.get(f'value_{index}') or 0)
+                for index, (label, _start) in enumerate(periods)
+            ],
+            'daily': daily_series(days, daily.get(pk, {})),
+            'recent': recent.get(pk, []),
+        }
+    return data
+
+
+# Mise en page
+
+def render_header(item, now, data=None, image=None):
+    styles = getSampleStyleSheet()
+    return [
+        Paragraph(f"Rapport détaillé de l'article : {item['produit']}", styles['Title']),
+        Paragraph(f"Généré le : {now.strftime('%d/%m/%Y à %H:%M')}", styles['Normal']),
+        Spacer(1, 12),
+    ]
+
+
+def render_details(item, data=None, image=None):
+    styles = getSampleStyleSheet()
+    item_table = Table([
+        ["Champ", "Valeur"],
+        ["ID", item['pk']],
+        ["Produit", item['produit']],
+        ["Quantité en stock", item['quantity']],
+        ["Prix d'achat", f"{item['prix_achat']:.2f}€"],
+        ["Prix de vente", f"{item['prix_vente']:.2f}€"],
+    ])
+    item_table.setStyle(HEADER_TABLE_STYLE)
+    return [Paragraph("Détails de l'article", styles['Heading2']), item_table, Spacer(1, 12)]
+
+
+def render_valuation(item, data=None, image=None):
+    # Valeur actuelle du stock et prix de vente potentiel
+    current_stock_value = item['quantity'] * item['prix_achat']
+    potential_retail_value = item['quantity'] * item['prix_vente']
+    margin = potential_retail_value - current_stock_value if potential_retail_value and current_stock_value else 0
+    margin_percentage = (margin / current_stock_value * 100) if current_stock_value else 0
+
+    styles = getSampleStyleSheet()
+    value_table = Table([
+        ["Métrique", "Valeur"],
+        ["Valeur d'achat en stock", f"{current_stock_value:.2f}€"],
+        ["Valeur potentielle de vente", f"{potential_retail_value:.2f}€"],
+        ["Marge potentielle", f"{margin:.2f}€"],
+        ["Pourcentage de marge", f"{margin_percentage:.2f}%"],
+    ])
+    value_table.setStyle(HEADER_TABLE_STYLE)
+    return [Paragraph("Valorisation du stock", styles['Heading2']), value_table, Spacer(1, 12)]
+
+
+def render_sales(rows, image=None):
+    styles = getSampleStyleSheet()
+    sales_table = Table(
+        [["Période", "Quantité vendue", "Valeur des ventes"]]
+        + [[label, quantity, f"{value:.2f}€"] for label, quantity, value in rows]
+    )
+    sales_table.setStyle(HEADER_TABLE_STYLE)
+    return [Paragraph("Statistiques de vente", styles['Heading2']), sales_table, Spacer(1, 12)]
+
+
+def render_chart(data, image):
+    styles = getSampleStyleSheet()
+    return [
+        Paragraph(f"Évolution des transactions ({HISTORY_DAYS} derniers jours)", styles['Heading2']),
+        Image(io.BytesIO(image), 7 * inch, 3.5 * inch),
+        Spacer(1, 12),
+    ]
+
+
+def render_recent(rows, image=None):
+    styles = getSampleStyleSheet()
+    elements = [Paragraph(f"Historique des {HISTORY_DAYS} derniers jours", styles['Heading2'])]
+    if not rows:
+        elements.append(Paragraph(f"Aucune transaction au cours des {HISTORY_DAYS} derniers jours.", styles['Normal']))
+        return elements
+
+    trans_table = Table([["Date", "Type", "Quantité", "Prix Total", "Client/Fournisseur"]] + rows)
+    trans_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    elements.append(trans_table)
+    return elements
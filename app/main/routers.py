@@ -0,0 +1,95 @@
+"""
+Primary / replica database routing.
+
+Reads issued by the views listed in ``settings.REPLICA_READ_VIEWS`` are sent
+to the ``settings.DATABASE_REPLICA_ALIAS`` database; every other query, and
+every write, goes to ``default``. A user who just recorded a transaction is
+pinned to the primary for ``settings.REPLICA_PIN_SECONDS`` so that the pages
+they open next always show their own write, whatever the replication lag.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_ALIAS = 'default'
+PIN_SESSION_KEY = 'primary_pinned_until'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def replica_alias():
+    """
+    Returns the alias of the replica, or ``None`` when no replica is configured.
+
+    :rtype: str or None
+    """
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def reads_from_replica(enabled=True):
+    """
+    Context manager routing the reads of the ``main`` models to the replica.
+
+    :param enabled: When false the block keeps reading from the primary.
+    :type enabled: bool
+    """
+    token = _read_from_replica.set(enabled and replica_alias() is not None)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def pin_to_primary(request):
+    """
+    Keeps the session of the request on the primary for a short window.
+
+    Must be called after a write whose result the user expects to see on the
+    next page (e.g. a recorded transaction).
+
+    :param request: The request of the user who wrote.
+    :type request: HttpRequest
+    """
+    request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def is_pinned_to_primary(request):
+    """
+    Tells whether the session of the request is still pinned to the primary.
+
+    :param request: The incoming request.
+    :type request: HttpRequest
+    :rtype: bool
+    """
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending the reads of the ``main`` models to the replica when allowed.
+
+    Only the application models are routed: sessions, users and permissions
+    always come from the primary so that a login or a permission change is
+    never hidden by the replication lag.
+    """
+    route_app_labels = {'main'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.route_app_labels and _read_from_replica.get():
+            return replica_alias()
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Le primaire et son réplica contiennent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
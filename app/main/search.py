@@ -0,0 +1,266 @@
+"""
+Process-local fuzzy search over product and client names.
+
+Each :class:`TrigramIndex` keeps, in memory, the trigrams of every name and
+an inverted index from trigram to names, so a partial or misspelled query is
+ranked without scanning the table (``LIKE '%x%'``). An index is built from the
+primary database at its first use, then kept up to date by the model signals
+(see :mod:`main.signals`).
+
+With several workers, each process has its own copy: every change bumps a
+version stamp stored in the shared cache, and an index whose version no
+longer matches the stamp (a change made by another worker, a bulk import) is
+rebuilt at its next search.
+"""
+import math
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from . import versioning
+from .models import Stock, Client
+from .routers import PRIMARY_ALIAS
+
+VERSION_CHECK_INTERVAL = 1.0  # Secondes entre deux lectures du numéro de version partagé
+MIN_SCORE = 0.3
+
+_WORD_SEPARATOR = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """
+    Lowercases a name and strips its accents and punctuation.
+
+    :param text: The text to normalize.
+    :type text: str
+    :rtype: str
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD_SEPARATOR.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams of a text, each word padded like ``pg_trgm`` does.
+
+    :param text: The text to split, normalized or not.
+    :type text: str
+    :rtype: frozenset[str]
+    """
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index of named objects.
+
+    Every object gets a dense slot number; the posting list of a trigram is
+    the set of slots whose label contains it, mirrored as a ``numpy`` array so
+    that a search counts the shared trigrams of all candidates with a single
+    ``bincount`` instead of a Python loop.
+
+    :ivar name: Name of the index, used for its shared version stamp.
+    :type name: str
+    """
+
+    def __init__(self, name, loader):
+        """
+        :param name: Name of the index (e.g. ``"stock"``).
+        :type name: str
+        :param loader: Callable returning the ``(pk, label)`` pairs to index.
+        :type loader: Callable[[], Iterable[tuple[int, str]]]
+        """
+        self.name = name
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._version = None
+        self._checked_at = 0.0
+        self._reset()
+
+    @property
+    def version_key(self):
+        return f"search_index_version:{self.name}"
+
+    def __len__(self):
+        return len(self._slots)
+
+    def search(self, query, limit=10):
+        """
+        Returns the entries whose label is the closest to the query.
+
+        The score averages the share of the query trigrams found in the label
+        (so a prefix or a fragment ranks well) and the Jaccard similarity of
+        both sets (so that, among those, the shortest labels come first).
+
+        :param query: Partial or approximate name.
+        :type query: str
+        :param limit: Maximum number of results.
+        :type limit: int
+        :return: ``(pk, label, score)`` tuples, best match first.
+        :rtype: list[tuple[int, str, float]]
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        self._ensure_fresh()
+
+        with self._lock:
+            postings = [self._posting_array(gram) for gram in query_grams if gram in self._postings]
+            if not postings:
+                return []
+            size = len(query_grams)
+            shared = np.bincount(np.concatenate(postings), minlength=len(self._pks))
+            # Le score ne peut dépasser la part de trigrammes communs : on écarte d'emblée les autres
+            candidates = np.flatnonzero(shared >= max(1, math.ceil(MIN_SCORE * size)))
+            common = shared[candidates]
+            scores = (common / size + common / (size + self._sizes[candidates] - common)) / 2
+            keep = scores >= MIN_SCORE
+            candidates, scores = candidates[keep], scores[keep]
+            if len(candidates) > limit:
+                best = np.argpartition(-scores, limit - 1)[:limit]
+                candidates, scores = candidates[best], scores[best]
+            order = np.lexsort((candidates, -scores))
+            return [
+                (self._pks[slot], self._labels[slot], round(float(score), 3))
+                for slot, score in zip(candidates[order].tolist(), scores[order].tolist())
+            ]
+
+    def update(self, pk, label):
+        """
+        Indexes (or re-indexes) one object after it was saved in this process.
+
+        :param pk: Primary key of the object.
+        :type pk: int
+        :param label: Its searchable name.
+        :type label: str
+        """
+        with self._lock:
+            if self._version is not None:
+                self._remove(pk)
+                self._add(pk, label)
+            self._bump_version()
+
+    def remove(self, pk):
+        """
+        Drops one object after it was deleted in this process.
+
+        :param pk: Primary key of the deleted object.
+        :type pk: int
+        """
+        with self._lock:
+            if self._version is not None:
+                self._remove(pk)
+            self._bump_version()
+
+    def invalidate(self):
+        """Forces every worker, this one included, to rebuild the index (e.g. after a bulk import)."""
+        with self._lock:
+            self._version = None
+            self._bump_version()
+
+    def rebuild(self):
+        """Loads every object from the primary database and replaces the index."""
+        with self._lock:
+            # Version lue avant le chargement : un changement concurrent provoquera une reconstruction
+            version = self._shared_version()
+            self._reset()
+            for pk, label in self._loader():
+                self._add(pk, label)
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _reset(self):
+        self._slots = {}  # pk -> slot
+        self._pks = []  # slot -> pk (None une fois supprimé)
+        self._labels = []  # slot -> libellé
+        self._grams = []  # slot -> trigrammes
+        self._sizes = np.zeros(0, dtype=np.int32)  # slot -> nombre de trigrammes
+        self._postings = {}  # trigramme -> slots
+        self._arrays = {}  # trigramme -> slots (tableau numpy, recalculé après modification)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self._version is None or self._shared_version() != self._version:
+                self.rebuild()
+            self._checked_at = now
+
+    def _shared_version(self):
+        return versioning.current(self.version_key)
+
+    def _bump_version(self):
+        version = versioning.bump(self.version_key)
+        # Un autre worker a modifié l'index depuis notre dernière synchronisation : reconstruction
+        if self._version is not None and version != self._version + 1:
+            self._version = None
+            return
+        if self._version is not None:
+            self._version = version
+
+    def _posting_array(self, gram):
+        array = self._arrays.get(gram)
+        if array is None:
+            array = self._arrays[gram] = np.fromiter(self._postings[gram], dtype=np.int32)
+        return array
+
+    def _add(self, pk, label):
+        grams = trigrams(label)
+        slot = len(self._pks)
+        self._slots[pk] = slot
+        self._pks.append(pk)
+        self._labels.append(label)
+        self._grams.append(grams)
+        if slot >= len(self._sizes):
+            self._sizes = np.resize(self._sizes, max(1024, 2 * len(self._sizes)))
+        self._sizes[slot] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(slot)
+            self._arrays.pop(gram, None)
+
+    def _remove(self, pk):
+        # Le slot n'est pas réutilisé ; la prochaine reconstruction compacte l'index
+        slot = self._slots.pop(pk, None)
+        if slot is None:
+            return
+        for gram in self._grams[slot]:
+            slots = self._postings[gram]
+            slots.discard(slot)
+            self._arrays.pop(gram, None)
+            if not slots:
+                del self._postings[gram]
+        self._pks[slot] = None
+        self._labels[slot] = None
+        self._grams[slot] = frozenset()
+        self._sizes[slot] = 0
+
+
+def _load_products():
+    return Stock.objects.using(PRIMARY_ALIAS).values_list('pk', 'produit').iterator()
+
+
+def _load_clients():
+    rows = Client.objects.using(PRIMARY_ALIAS).values_list('pk', 'name', 'surname').iterator()
+    return ((pk, client_label(name, surname)) for pk, name, surname in rows)
+
+
+def client_label(name, surname):
+    """
+    Returns the searchable label of a client.
+
+    :rtype: str
+    """
+    return f"{name} {surname}".strip()
+
+
+products = TrigramIndex('stock', _load_products)
+clients = TrigramIndex('client', _load_clients)
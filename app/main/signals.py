@@ -0,0 +1,118 @@
+"""
+Signal handlers of the ``main`` application.
+
+Connected in :meth:`main.apps.MainConfig.ready`. Handlers touching
+process-local state only run once the database transaction is committed, so
+that a rolled back write never shows up in it.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction as db_transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from . import leaderboards, live, permissions, search, sync
+from .middleware import time_query
+from .models import Stock, Client, Transaction
+
+
+@receiver(connection_created, dispatch_uid='metrics_query_timer')
+def install_query_timer(sender, connection, **kwargs):
+    # Les wrappers survivent aux reconnexions : une seule installation par connexion
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(post_save, sender=Stock, dispatch_uid='search_stock_saved')
+def index_stock(sender, instance, **kwargs):
+    # Une vente ne change que la quantité : l'index partagé n'est pas touché
+    if not instance.has_changed('produit'):
+        return
+    pk, label = instance.pk, instance.produit
+    db_transaction.on_commit(lambda: search.products.update(pk, label), using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=Stock, dispatch_uid='search_stock_deleted')
+def unindex_stock(sender, instance, **kwargs):
+    pk = instance.pk
+    db_transaction.on_commit(lambda: search.products.remove(pk), using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Client, dispatch_uid='search_client_saved')
+def index_client(sender, instance, **kwargs):
+    if not instance.has_changed('name', 'surname'):
+        return
+    pk, label = instance.pk, search.client_label(instance.name, instance.surname)
+    db_transaction.on_commit(lambda: search.clients.update(pk, label), using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=Client, dispatch_uid='search_client_deleted')
+def unindex_client(sender, instance, **kwargs):
+    pk = instance.pk
+    db_transaction.on_commit(lambda: search.clients.remove(pk), using=kwargs.get('using'))
+
+
+# Journal des changements des caisses : écrit dans la transaction, pour partager son sort
+@receiver(post_save, sender=Stock, dispatch_uid='sync_stock_saved')
+@receiver(post_save, sender=Client, dispatch_uid='sync_client_saved')
+def log_change(sender, instance, created, **kwargs):
+    # Une vente ne change que la quantité, qui n'est pas copiée : aucune ligne
+    if created or sync.has_synced_changes(instance):
+        sync.record_change(instance, using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=Stock, dispatch_uid='sync_stock_deleted')
+@receiver(post_delete, sender=Client, dispatch_uid='sync_client_deleted')
+def log_deletion(sender, instance, **kwargs):
+    sync.record_change(instance, deleted=True, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='leaderboards_transaction_saved')
+def rank_transaction(sender, instance, created, **kwargs):
+    if created:
+        entries = leaderboards.transaction_entries(instance)
+        db_transaction.on_commit(lambda: leaderboards.record(entries), using=kwargs.get('using'))
+
+
+# Un produit ou un client supprimé sort des classements : tous les seaux sont relus
+@receiver(post_delete, sender=Stock, dispatch_uid='leaderboards_stock_deleted')
+@receiver(post_delete, sender=Client, dispatch_uid='leaderboards_client_deleted')
+def drop_leaderboards(sender, **kwargs):
+    db_transaction.on_commit(leaderboards.bump_data_version, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='live_transaction_saved')
+def publish_transaction(sender, instance, created, **kwargs):
+    if created:
+        event = live.transaction_event(instance)
+        db_transaction.on_commit(lambda: live.broadcaster.publish(event), using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through, dispatch_uid='permissions_user_groups')
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through, dispatch_uid='permissions_user_permissions')
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pk = instance.pk
+        db_transaction.on_commit(lambda: permissions.invalidate_user(pk), using=kwargs.get('using'))
+    elif pk_set:  # Depuis le groupe ou la permission : utilisateurs nommés
+        pks = list(pk_set)
+        db_transaction.on_commit(lambda: [permissions.invalidate_user(pk) for pk in pks], using=kwargs.get('using'))
+    else:  # clear() depuis le groupe ou la permission : utilisateurs inconnus
+        db_transaction.on_commit(permissions.bump_data_version, using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through, dispatch_uid='permissions_group_permissions')
+def invalidate_group_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        db_transaction.on_commit(permissions.bump_data_version, using=kwargs.get('using'))
+
+
+# La suppression en cascade des liaisons n'envoie pas m2m_changed ; un codename renommé change les chaînes en cache
+@receiver(post_delete, sender=Group, dispatch_uid='permissions_group_deleted')
+@receiver(post_save, sender=Permission, dispatch_uid='permissions_permission_saved')
+@receiver(post_delete, sender=Permission, dispatch_uid='permissions_permission_deleted')
+def invalidate_all_permissions(sender, **kwargs):
+    db_transaction.on_commit(permissions.bump_data_version, using=kwargs.get('using'))
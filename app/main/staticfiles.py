@@ -0,0 +1,111 @@
+"""
+Fingerprinted, pre-compressed static files.
+
+``collectstatic`` stores every file under a name containing the hash of its
+content (:class:`CompressedManifestStaticFilesStorage`) and writes a Brotli
+(``.br``) and a gzip (``.gz``) copy next to every compressible one, at the
+highest levels since this is done once per deployment. :func:`serve` sends
+the smallest variant the client accepts; a hashed name never changes
+content, so it may be cached for a year.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import views as staticfiles_views
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .compression import ENCODINGS, compress, negotiate
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot')
+MIN_COMPRESS_SIZE = 256  # En dessous, l'en-tête Content-Encoding coûte plus qu'il ne rapporte
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Nom produit par ManifestStaticFilesStorage : "nom.<12 caractères hexadécimaux>.ext"
+_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage writing a Brotli and a gzip variant of the hashed files.
+
+    A variant is only kept when it is smaller than the original file.
+    Only ``url()`` and ``@import`` are rewritten in the CSS files: the
+    vendored libraries are shipped without their source maps.
+    """
+    patterns = (
+        ('*.css', ManifestStaticFilesStorage.patterns[0][1][:2]),
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._write_variants(name)
+
+    def _write_variants(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        for encoding, suffix in ENCODINGS.items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if len(content) < MIN_COMPRESS_SIZE:
+                continue
+            compressed = compress(content, encoding)
+            if len(compressed) < len(content):
+                self._save(name + suffix, ContentFile(compressed))
+
+
+def serve(request, path):
+    """
+    Serves a collected static file, pre-compressed if the client accepts it.
+
+    Hashed files are sent with far-future cache headers, the others must be
+    revalidated. With ``DEBUG``, the files are served from the finders
+    (sources of the apps and ``STATICFILES_DIRS``) like ``runserver`` does.
+
+    :param path: Path of the file under ``STATIC_URL``.
+    :type path: str
+    """
+    if settings.DEBUG:
+        return staticfiles_views.serve(request, path)
+
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404("Fichier introuvable")
+    if not os.path.isfile(fullpath):
+        raise Http404("Fichier introuvable")
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    available = [encoding for encoding, suffix in ENCODINGS.items() if os.path.isfile(fullpath + suffix)]
+    encoding = negotiate(request.headers.get('Accept-Encoding', ''), available)
+    served = fullpath + ENCODINGS[encoding] if encoding else fullpath
+
+    stat = os.stat(served)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(served, 'rb'), content_type=content_type, filename=os.path.basename(fullpath))
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    if _HASHED_NAME.search(name):
+        response['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+    if available:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
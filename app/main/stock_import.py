@@ -0,0 +1,166 @@
+"""
+Bulk upsert of the stock catalog from a CSV file.
+
+Rows are matched on the unique ``produit`` name: unknown products are
+inserted, known ones have the prices present in the file updated. The
+quantity of a known product is left alone: stock only moves through
+transactions, so that it stays consistent with their history and with the
+weighted average cost. Rows are
+validated with the model fields only (no query per row) and written with
+``bulk_create(update_conflicts=True)`` in chunks, so that a supplier catalog
+of tens of thousands of products is imported in a handful of queries.
+"""
+import csv
+
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router, transaction as db_transaction
+
+from . import search, sync
+from .models import Stock
+
+IMPORT_FIELDS = ('produit', 'quantity', 'prix_vente', 'prix_achat')
+DECIMAL_FIELDS = ('prix_vente', 'prix_achat')
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """
+    Outcome of a catalog import.
+
+    :ivar inserted: Number of products created.
+    :type inserted: int
+    :ivar updated: Number of existing products updated.
+    :type updated: int
+    :ivar rejected: Number of rows that could not be imported.
+    :type rejected: int
+    :ivar errors: ``(line number, message)`` of the first rejected rows.
+    :type errors: list[tuple[int, str]]
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return f"{self.inserted} ajouté(s), {self.updated} mis à jour, {self.rejected} rejeté(s)"
+
+
+def import_stock_csv(text_file, chunk_size=1000):
+    """
+    Upserts the products of a CSV file into the ``stock`` table.
+
+    The first line must be a header containing ``produit`` and any of
+    ``quantity``, ``prix_vente`` and ``prix_achat``; ``quantity`` is only used
+    for the inserted products. The delimiter (``,`` or
+    ``;``) is detected and decimal commas are accepted. When a product appears
+    several times in the file, the last row wins.
+
+    :param text_file: The CSV file, opened in text mode.
+    :type text_file: TextIO
+    :param chunk_size: Number of products written per ``INSERT`` statement.
+    :type chunk_size: int
+    :return: Counts of inserted, updated and rejected rows.
+    :rtype: ImportResult
+    """
+    result = ImportResult()
+    sample = text_file.read(4096)
+    text_file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(text_file, dialect=dialect)
+    header = [name.strip() for name in reader.fieldnames or []]
+    reader.fieldnames = header
+    if 'produit' not in header:
+        result.reject(1, "La colonne 'produit' est obligatoire.")
+        return result
+    columns = [name for name in IMPORT_FIELDS if name in header]
+    # Quantité initiale des nouveaux produits seulement : l'existant évolue par des transactions
+    update_fields = [name for name in columns if name not in ('produit', 'quantity')]
+
+    # Dédoublonnage : la dernière ligne d'un produit l'emporte
+    rows = {}
+    for line, raw in enumerate(reader, start=2):
+        try:
+            values = _clean_row(raw, columns)
+        except ValidationError as e:
+            result.reject(line, '; '.join(e.messages))
+            continue
+        previous = rows.pop(values['produit'], None)
+        if previous is not None:
+            result.reject(previous[0], f"Remplacée par la ligne {line} (même produit).")
+        rows[values['produit']] = (line, values)
+
+    items = [values for _line, values in rows.values()]
+    for start in range(0, len(items), chunk_size):
+        _upsert_chunk(items[start:start + chunk_size], update_fields, result)
+    if items:
+        # bulk_create n'émet pas post_save : l'index de recherche est reconstruit
+        search.products.invalidate()
+    return result
+
+
+def _clean_row(raw, columns):
+    """Validates and converts one CSV row with the model fields, without touching the database."""
+    values = {}
+    errors = []
+    for name in columns:
+        value = (raw.get(name) or '').strip()
+        if name in DECIMAL_FIELDS:
+            value = value.replace('€', '').replace(' ', '').replace(',', '.')
+        field = Stock._meta.get_field(name)
+        if value == '' and name != 'produit':
+            value = field.get_default()
+        try:
+            values[name] = field.clean(value, None)
+        except ValidationError as e:
+            errors.extend(f"{name} : {message}" for message in e.messages)
+            continue
+        # SQLite n'applique pas les bornes des PositiveIntegerField à la validation
+        if isinstance(field, models.PositiveIntegerField) and values[name] < 0:
+            errors.append(f"{name} : doit être positif")
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def _upsert_chunk(items, update_fields, result):
+    """Writes one chunk of products with a single upsert statement."""
+    names = [values['produit'] for values in items]
+    existing = dict(Stock.objects.filter(produit__in=names).values_list('produit', 'prix_vente'))
+    # Produits nouveaux ou au prix modifié : seuls ceux-là entrent dans le journal des caisses
+    changed = [
+        values['produit'] for values in items
+        if values['produit'] not in existing
+        or ('prix_vente' in update_fields and values['prix_vente'] != existing[values['produit']])
+    ]
+    connection = connections[router.db_for_write(Stock)]
+
+    with db_transaction.atomic():
+        if update_fields:
+            Stock.objects.bulk_create(
+                [Stock(**values) for values in items],
+                update_conflicts=True,
+                # MySQL/MariaDB : ON DUPLICATE KEY UPDATE ne prend pas de colonne cible
+                unique_fields=['produit'] if connection.features.supports_update_conflicts_with_target else None,
+                update_fields=update_fields,
+            )
+        else:
+            # Aucun prix fourni : rien à mettre à jour sur l'existant
+            Stock.objects.bulk_create([Stock(**values) for values in items], ignore_conflicts=True)
+        if changed:
+            # bulk_create ne renvoie pas les clés des lignes mises à jour sous MariaDB : relecture par nom
+            sync.record_changes('stock', Stock.objects.filter(produit__in=changed).values_list('pk', flat=True))
+
+    if update_fields:
+        result.updated += len(existing)
+    result.inserted += len(items) - len(existing)
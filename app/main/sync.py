@@ -0,0 +1,124 @@
+"""
+Change feed of the stock catalog and of the clients, pulled by the offline tills.
+
+Every creation, deletion or change of a synced field of a product or a
+client appends a :class:`~main.models.ChangeLog` row, from the signals of
+:mod:`main.signals` (and explicitly on the bulk path of
+:mod:`main.stock_import`). The row is only written in the database
+transaction of the change when the caller opened one: the views save their
+forms within ``transaction.atomic()``. A till keeps the ``seq`` of the last change it applied, its
+watermark, and asks for the changes since then (:func:`changes_since`): it
+receives the current values of the objects changed since, and the ids of
+the deleted ones. Syncing from 0 replays the whole log, that is the whole
+catalog, since the log keeps at least the latest row of every object.
+
+Sequence numbers are allocated when a row is inserted, not when its
+transaction commits: a change may become visible after a change with a
+higher ``seq``, and shows up meanwhile as a gap in the sequence. The feed
+stops before the first gap, so that a till never moves its watermark past
+a change still to come. A gap followed by a row older than
+``settings.SYNC_GAP_SECONDS`` is taken as final (rolled back transaction,
+row removed by ``compact_changelog``) and skipped.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChangeLog, Client, Stock
+
+# Champs copiés par les caisses : le stock disponible et les coûts restent sur le serveur
+FEEDS = {
+    'stock': (Stock, ('produit', 'prix_vente')),
+    'client': (Client, ('name', 'surname', 'type')),
+}
+IN_BULK_SIZE = 1000
+
+
+def has_synced_changes(instance):
+    """
+    Tells whether a save of a product or a client changed one of its synced fields.
+
+    :param instance: The saved :class:`~main.models.Stock` or :class:`~main.models.Client`.
+    :type instance: TrackedModel
+    :rtype: bool
+    """
+    _model, fields = FEEDS[instance._meta.model_name]
+    return instance.has_changed(*fields)
+
+
+def record_change(instance, deleted=False, using=None):
+    """
+    Appends the change of a product or a client to the log.
+
+    Must be called within the transaction of the change.
+
+    :param instance: The created, changed or deleted object.
+    :type instance: TrackedModel
+    :param deleted: Whether the object was deleted.
+    :type deleted: bool
+    :param using: Alias of the database written to, that of the change.
+    :type using: str or None
+    """
+    ChangeLog.objects.db_manager(using).create(model=instance._meta.model_name, object_id=instance.pk, deleted=deleted)
+
+
+def record_changes(model, pks):
+    """
+    Appends the changes of several objects of one model to the log, in one statement.
+
+    For the bulk write paths, which send no signal.
+
+    :param model: ``"stock"`` or ``"client"``.
+    :type model: str
+    :param pks: Primary keys of the created or changed objects.
+    :type pks: Iterable[int]
+    """
+    ChangeLog.objects.bulk_create([ChangeLog(model=model, object_id=pk) for pk in pks])
+
+
+def changes_since(since, limit):
+    """
+    Returns the changes logged after a watermark, merged per object.
+
+    :param since: ``seq`` of the last change applied by the till, 0 for a full sync.
+    :type since: int
+    :param limit: Maximum number of log rows read.
+    :type limit: int
+    :return: ``next`` (the new watermark), ``more`` (whether changes remain before the first gap) and,
+        per feed, the field names, the rows of the changed objects and the deleted ids.
+    :rtype: dict
+    """
+    abandoned = timezone.now() - timedelta(seconds=settings.SYNC_GAP_SECONDS)
+    entries = list(
+        ChangeLog.objects.filter(seq__gt=since).order_by('seq')
+        .values_list('seq', 'model', 'object_id', 'deleted', 'time')[:limit + 1]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+    previous = since
+    for index, (seq, _model, _pk, _deleted, time) in enumerate(entries):
+        if seq != previous + 1 and time > abandoned:
+            # Séquence manquante récente : sa transaction n'est peut-être pas encore validée
+            entries, more = entries[:index], False
+            break
+        previous = seq
+
+    # Dernier état de chaque objet : les lignes sont lues dans l'ordre des séquences
+    latest = {(model, pk): deleted for _seq, model, pk, deleted, _time in entries}
+    response = {'next': entries[-1][0] if entries else since, 'more': more}
+    for name, (model, fields) in FEEDS.items():
+        changed = [pk for (feed, pk), deleted in latest.items() if feed == name and not deleted]
+        rows = []
+        for start in range(0, len(changed), IN_BULK_SIZE):
+            rows.extend(
+                model.objects.filter(pk__in=changed[start:start + IN_BULK_SIZE])
+                .order_by('pk').values_list('pk', *fields)
+            )
+        response[name] = {
+            'fields': ['id', *fields],
+            # Un objet supprimé depuis n'est plus lu : sa pierre tombale suit dans le journal
+            'rows': [list(row) for row in rows],
+            'deleted': sorted(pk for (feed, pk), deleted in latest.items() if feed == name and deleted),
+        }
+    return response
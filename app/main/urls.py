@@ -17,6 +17,11 @@ urlpatterns = [
 
     # General urls
     path('accueil/', common_views.page_accueil_view, name='home'),
+    path('accueil/async/', common_views.page_accueil_async_view, name='home_async'),
+    path('accueil/live/', common_views.dashboard_events_view, name='home_live'),
+    path('metrics', common_views.metrics_view, name='metrics'),
+    path('search/', common_views.search_view, name='search'),
+    path('sync/changes', common_views.sync_changes_view, name='sync_changes'),
 
     # Transactions urls
     path('transactions/list', transaction_views.page_transactions_view, name='list_transactions'),
@@ -25,16 +30,26 @@ urlpatterns = [
 
     # Produits / Stocks urls
     path('stocks/list', stock_views.page_stocks_view, name='list_stocks'),
+    path('stocks/list/rows', stock_views.stocks_rows_view, name='list_stocks_rows'),
     path('stocks/<int:pk>/edit/', stock_views.page_edit_stock, name='edit_stock'),
     path('stocks/<int:pk>/delete/', stock_views.StockDeleteView.as_view(), name='delete_stock'),
     path('stocks/<int:pk>/details/', stock_views.stock_transactions_view, name='details_stock'),
     path('stocks/<int:pk>/pdf/', stock_views.generate_stock_item_pdf, name='generate_stock_item_pdf'),
     path('stocks/add/', stock_views.page_add_stock, name='add_stock'),
+    path('stocks/autocomplete/', stock_views.autocomplete_stock, name='autocomplete_stock'),
+    path('stocks/reorder/', stock_views.page_reorder_view, name='reorder_stocks'),
+    path('stocks/import/', stock_views.page_import_stock, name='import_stock'),
+    path('stocks/reports/', stock_views.page_export_stock_reports, name='export_stock_reports'),
+    path('stocks/reports.zip', stock_views.stock_reports_zip, name='stock_reports_zip'),
+    path('stocks/reports/status/<str:export_id>', stock_views.stock_reports_status, name='stock_reports_status'),
 
     # Clients urls
     path('clients/list', client_views.client_list, name='list_clients'),
     path('clients/add/', client_views.page_add_client, name='add_client'),
+    path('clients/autocomplete/', client_views.autocomplete_client, name='autocomplete_client'),
     path('clients/<int:pk>/edit/', client_views.page_edit_client, name='edit_client'),
     path('clients/<int:pk>/delete/', client_views.ClientDeleteView.as_view(), name='delete_client'),
     path('clients/<int:client_id>/pdf/', client_views.generate_client_pdf_report, name='client_pdf_report'),
+    path('clients/<int:client_id>/pdf/async/', client_views.generate_client_pdf_report_async,
+         name='client_pdf_report_async'),
 ]
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Version stamps kept in the shared cache.
+
+A stamp is an integer bumped whenever the data behind some cached entries
+changes: the entries hold the stamp they were computed under, and are
+ignored once it moved on. Stamps are stored without expiry and start from
+the clock, so that a key lost anyway (evicted, cache cleared) never brings
+back a number already used.
+
+The file cache has no atomic increment (``incr`` is a read then a write):
+stamps are created and moved on under an exclusive lock on
+``settings.VERSION_LOCK_FILE``, held across the workers of the host, so
+that two concurrent bumps always give two distinct, consecutive values.
+Reads of an existing stamp take no lock.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+_process_lock = threading.Lock()
+
+
+@contextmanager
+def _exclusive():
+    """
+    Holds the lock of the stamps, shared by the threads and the processes of the host.
+    """
+    if fcntl is None:
+        with _process_lock:
+            yield
+        return
+    os.makedirs(os.path.dirname(settings.VERSION_LOCK_FILE) or '.', exist_ok=True)
+    # Un descripteur par appel : flock exclut aussi les autres threads du processus
+    fd = os.open(settings.VERSION_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Libère le verrou
+
+
+def current(key):
+    """
+    Returns the current value of a stamp, creating it when missing.
+
+    :param key: Cache key of the stamp.
+    :type key: str
+    :rtype: int
+    """
+    version = cache.get(key)
+    if version is not None:
+        return version
+    with _exclusive():
+        cache.add(key, time.time_ns(), timeout=None)
+        return cache.get(key, 0)
+
+
+def bump(key):
+    """
+    Moves a stamp on, which invalidates the entries computed under its previous value.
+
+    :param key: Cache key of the stamp.
+    :type key: str
+    :return: The new value.
+    :rtype: int
+    """
+    with _exclusive():
+        version = cache.get(key)
+        # Clé perdue : repartir de l'horloge, au-delà de toute valeur déjà servie
+        version = time.time_ns() if version is None else version + 1
+        cache.set(key, version, timeout=None)
+    return version
@@ -1,58 +1,82 @@
-import io
-from datetime import timedelta
+import tempfile
+import time
 
-import matplotlib.pyplot as plt
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import permission_required
 from django.db.models import Q, Case, When
-from django.db.models import Sum, Count, F, ExpressionWrapper, DecimalField
-from django.http import HttpResponse
+from django.db.models import Sum, Count, DecimalField
+from django.db.models.functions import Coalesce
+from django.db import connections, transaction as db_transaction
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views.generic import DeleteView
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Image, Spacer
 
+from .. import aio, metrics, reports
+from ..archive import archived_client_sum
+from ..common_functions import get_autocomplete_limit
 from ..forms import ClientForm
-from ..models import Client, Transaction, ExtractMonth, ExtractYear
+from ..models import Client
+from ..reports import client as client_report
 
 
 @permission_required('main.view_client', login_url='/login/')
 def client_list(request):
+    # Totaux de la table chaude + totaux reportés des transactions archivées
     clients = Client.objects.annotate(
-        transaction_count=Count('transaction'),
-        total_achat=Sum(
+        transaction_count=Count('transaction') + archived_client_sum('count'),
+        total_achat=Coalesce(Sum(
             Case(
                 When(transaction__type="Achat", then='transaction__price'),
                 default=0,
                 output_field=DecimalField(max_digits=10, decimal_places=2)
             )
-        ),
-        achat_transactions=Count('transaction', filter=Q(transaction__type="Achat")),
-        total_vente=Sum(
+        ), 0, output_field=DecimalField(max_digits=14, decimal_places=2)) + archived_client_sum('amount', type="Achat"),
+        achat_transactions=Count('transaction', filter=Q(transaction__type="Achat"))
+        + archived_client_sum('count', type="Achat"),
+        total_vente=Coalesce(Sum(
             Case(
                 When(transaction__type="Vente", then='transaction__price'),
                 default=0,
                 output_field=DecimalField(max_digits=10, decimal_places=2)
             )
-        ),
+        ), 0, output_field=DecimalField(max_digits=14, decimal_places=2)) + archived_client_sum('amount', type="Vente"),
         vente_transactions=Count('transaction', filter=Q(transaction__type="Vente"))
+        + archived_client_sum('count', type="Vente")
     ).order_by('name', 'surname')
 
     context = {'clients': clients}
     return render(request, 'clients/page_clients.html', context)
 
 
+@permission_required('main.view_client', login_url='/login/')
+def autocomplete_client(request):
+    terms = request.GET.get('q', '').split(maxsplit=1)
+    limit = get_autocomplete_limit(request)
+
+    # Préfixes servis par l'index (name, surname) : "Jean" ou "Jean Dup"
+    clients = Client.objects.order_by('name', 'surname')
+    if terms:
+        clients = clients.filter(name__istartswith=terms[0])
+    if len(terms) > 1:
+        clients = clients.filter(surname__istartswith=terms[1])
+    results = [
+        {'id': pk, 'text': f"{name} {surname}", 'type': type_}
+        for pk, name, surname, type_ in clients.values_list('pk', 'name', 'surname', 'type')[:limit]
+    ]
+    return JsonResponse({'results': results})
+
+
 @permission_required('main.add_client', login_url='/login/')
 def page_add_client(request):
     if request.method == 'POST':
         form = ClientForm(request.POST)
         if form.is_valid():
-            form.save()
+            # Ligne du journal de synchronisation écrite dans la même transaction (main.signals)
+            with db_transaction.atomic():
+                form.save()
             return redirect('main:list_clients')
     else:
         form = ClientForm()
@@ -67,7 +91,8 @@ def page_edit_client(request, pk):
     if request.method == 'POST':
         form = ClientForm(request.POST, instance=client)
         if form.is_valid():
-            form.save()
+            with db_transaction.atomic():
+                form.save()
             return redirect('main:list_clients')
     else:
         form = ClientForm(instance=client)
@@ -81,268 +106,57 @@ class ClientDeleteView(DeleteView):
     template_name = 'clients/page_delete_client.html'
 
 
-@permission_required('main.view_client', login_url='/login/')
-def generate_client_pdf_report(request, client_id):
+def _build_client_pdf(client):
+    # Document écrit dans un fichier temporaire (supprimé à la fermeture de la réponse)
+    output = tempfile.TemporaryFile()
     try:
-        client = Client.objects.get(pk=client_id)
-    except Client.DoesNotExist:
-        return HttpResponse('Client non trouvé', status=404)
-
-    # Création du buffer pour le PDF
-    buffer = io.BytesIO()
-
-    # Définition des intervalles de temps
-    now = timezone.now()
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    yesterday = today - timedelta(days=1)
-    week_start = now - timedelta(days=now.weekday())
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # Récupération de toutes les transactions du client
-    client_transactions = Transaction.objects.filter(client=client).order_by('-time')
-
-    # Produit le plus acheté
-    most_purchased_product = None
-    if client.type == "Client":
-        product_counts = client_transactions.filter(type="Vente").values('produit__produit').annotate(
-            total=Sum('quantity')
-        ).order_by('-total').first()
-    else:  # Fournisseur
-        product_counts = client_transactions.filter(type="Achat").values('produit__produit').annotate(
-            total=Sum('quantity')
-        ).order_by('-total').first()
-
-    most_purchased_product = product_counts['produit__produit'] if product_counts else "Aucun"
-    most_purchased_quantity = product_counts['total'] if product_counts else 0
-
-    # Calcul des statistiques par période
-    hour_transactions = client_transactions.filter(time__gte=now - timedelta(hours=1))
-    today_transactions = client_transactions.filter(time__gte=today)
-    yesterday_transactions = client_transactions.filter(time__range=[yesterday, today])
-    week_transactions = client_transactions.filter(time__gte=week_start)
-    month_transactions = client_transactions.filter(time__gte=month_start)
-
-    # Statistiques de vente/achat
-    stats = {
-        'hour': {
-            'sells': hour_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': hour_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        },
-        'today': {
-            'sells': today_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': today_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        },
-        'yesterday': {
-            'sells': yesterday_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': yesterday_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        },
-        'week': {
-            'sells': week_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': week_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        },
-        'month': {
-            'sells': month_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': month_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        },
-        'all_time': {
-            'sells': client_transactions.filter(type='Vente').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            ),
-            'buys': client_transactions.filter(type='Achat').aggregate(
-                count=Count('id'),
-                amount=Sum('price')
-            )
-        }
-    }
-
-    # Statistiques générales du client
-    total_transactions = client_transactions.count()
-    total_amount = client_transactions.aggregate(total=Sum('price'))['total'] or 0
-
-    # Si c'est un client (qui achète)
-    if client.type == "Client":
-        benefit_transactions = client_transactions.filter(type='Vente').annotate(
-            margin=ExpressionWrapper(
-                F('price') - (F('produit__prix_achat') * F('quantity')),
-                output_field=DecimalField()
-            )
-        )
-        total_benefit = benefit_transactions.aggregate(total=Sum('margin'))['total'] or 0
-    # Si c'est un fournisseur
-    else:
-        total_benefit = "N/A"
-
-    # Création d'un graphique d'activité mensuelle
-    last_year = now - timedelta(days=365)
-    monthly_activity = client_transactions.filter(time__gte=last_year).annotate(
-        month=ExtractMonth('time'),
-        year=ExtractYear('time')
-    ).values('month', 'year').annotate(
-        count=Count('id'),
-        total=Sum('price')
-    ).order_by('year', 'month')
-
-    months = []
-    counts = []
-    for item in monthly_activity:
-        months.append(f"{item['year']}-{item['month']}")
-        counts.append(item['count'])
-
-    # Graphique d'activité mensuelle
-    if months and counts:
-        plt.figure(figsize=(10, 4))
-        plt.bar(range(len(counts)), counts, color='skyblue')
-        plt.title('Activité mensuelle')
-        plt.xlabel('Mois')
-        plt.ylabel('Nombre de transactions')
-        plt.xticks(range(len(months)), months, rotation=45)
-        plt.tight_layout()
-        activity_chart = io.BytesIO()
-        plt.savefig(activity_chart, format='png')
-        plt.close()
-    else:
-        activity_chart = None
-
-    # Génération du PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    # Titre
-    elements.append(Paragraph(f"Rapport client: {client.name} {client.surname}", styles['Title']))
-    elements.append(Paragraph(f"Type: {client.type}", styles['Heading3']))
-    elements.append(Paragraph(f"Date du rapport: {now.strftime('%Y-%m-%d %H:%M')}", styles['Heading3']))
-    elements.append(Spacer(1, 20))
+        reports.build_pdf(client_report.sections(client, timezone.now()), output)
+    except BaseException:
+        output.close()
+        raise
+    return output
 
-    # Statistiques du client
-    elements.append(Paragraph("Statistiques générales", styles['Heading2']))
 
-    client_stats_data = [
-        ["Métrique", "Valeur"],
-        ["Nombre total de transactions", total_transactions],
-        ["Produit le plus {0}".format("acheté" if client.type == "Client" else "vendu"), most_purchased_product],
-        ["Quantité", most_purchased_quantity],
-        ["Montant total des transactions", f"{total_amount:.2f}€"],
-    ]
-
-    if client.type == "Client":
-        client_stats_data.append(["Bénéfice total", f"{total_benefit:.2f}€"])
-
-    client_stats_table = Table(client_stats_data)
-    client_stats_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(client_stats_table)
-    elements.append(Spacer(1, 20))
-
-    # Tableau des statistiques par période
-    elements.append(Paragraph("Transactions par période", styles['Heading2']))
-
-    period_data = [
-        ["Période", "Ventes (Nb)", "Ventes (€)", "Achats (Nb)", "Achats (€)"]
-    ]
+def _client_pdf_response(client, output, started_at):
+    metrics.record_pdf('client', started_at, output.tell())
 
-    for period, data in [
-        ("Dernière heure", stats['hour']),
-        ("Aujourd'hui", stats['today']),
-        ("Hier", stats['yesterday']),
-        ("Cette semaine", stats['week']),
-        ("Ce mois", stats['month']),
-        ("Total", stats['all_time'])
-    ]:
-        period_data.append([
-            period,
-            data['sells']['count'],
-            f"{data['sells']['amount'] or 0:.2f}€",
-            data['buys']['count'],
-            f"{data['buys']['amount'] or 0:.2f}€"
-        ])
+    # Création de la réponse HTTP : le fichier est envoyé par blocs
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=f"rapport_client_{client.pk}.pdf", content_type='application/pdf',
+    )
 
-    period_table = Table(period_data)
-    period_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-    ]))
-    elements.append(period_table)
-    elements.append(Spacer(1, 20))
 
-    # Tableau de toutes les transactions
-    elements.append(Paragraph("Liste des transactions", styles['Heading2']))
-
-    if client_transactions:
-        trans_data = [["Date", "Type", "Produit", "Quantité", "Montant"]]
-        for trans in client_transactions[:50]:  # Limité à 50 transactions pour éviter un PDF trop volumineux
-            trans_data.append([
-                trans.time.strftime("%Y-%m-%d %H:%M"),
-                trans.type,
-                trans.produit.produit,
-                trans.quantity,
-                f"{trans.price:.2f}€"
-            ])
+@permission_required('main.view_client', login_url='/login/')
+def generate_client_pdf_report(request, client_id):
+    try:
+        client = Client.objects.get(pk=client_id)
+    except Client.DoesNotExist:
+        return HttpResponse('Client non trouvé', status=404)
 
-        trans_table = Table(trans_data)
-        trans_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ]))
-        elements.append(trans_table)
-    else:
-        elements.append(Paragraph("Aucune transaction trouvée", styles['Normal']))
+    started_at = time.perf_counter()
+    # Sections (requêtes, graphique, tableaux) produites en parallèle puis assemblées dans l'ordre,
+    # la liste des transactions est lue au fil de la mise en page
+    output = _build_client_pdf(client)
+    return _client_pdf_response(client, output, started_at)
 
-    elements.append(Spacer(1, 20))
 
-    # Graphique d'activité mensuelle
-    if activity_chart:
-        elements.append(Paragraph("Activité mensuelle", styles['Heading2']))
-        activity_chart.seek(0)
-        elements.append(Image(activity_chart, 7 * inch, 3 * inch))
+def _build_client_pdf_in_thread(client):
+    try:
+        return _build_client_pdf(client)
+    finally:
+        # Thread hors requête : la connexion de la liste des transactions n'est fermée par personne d'autre
+        connections.close_all()
 
-    # Construction du PDF
-    doc.build(elements)
 
-    # Création de la réponse HTTP
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="rapport_client_{client_id}.pdf"'
+@aio.async_permission_required('main.view_client', login_url='/login/')
+async def generate_client_pdf_report_async(request, client_id):
+    try:
+        client = await Client.objects.aget(pk=client_id)
+    except Client.DoesNotExist:
+        return HttpResponse('Client non trouvé', status=404)
 
-    return response
+    # Le pipeline de sections a ses propres threads : la boucle d'événements attend sans bloquer
+    started_at = time.perf_counter()
+    output = await sync_to_async(_build_client_pdf_in_thread, thread_sensitive=False)(client)
+    return _client_pdf_response(client, output, started_at)
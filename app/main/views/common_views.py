@@ -1,113 +1,200 @@
+import secrets
 from datetime import timedelta
 from decimal import Decimal
+from functools import partial
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import logout
-from django.contrib.auth.decorators import permission_required
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, permission_required
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.utils import timezone
 
-from ..models import Transaction, Stock
+from .. import aio, leaderboards, live, metrics, search, sync
+from ..models import Transaction, Stock, Client
 
 
-@permission_required('main.view_transaction', login_url='/login/')
-def page_accueil_view(request):
-    # 1) Début du mois courant
-    now = timezone.now()
+def _line_amount(price_field):
+    return ExpressionWrapper(F('quantity') * F(price_field), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _dashboard_queries(now):
+    """
+    Builds the (lazy) querysets of the dashboard, shared by the sync and async views.
+
+    The leaderboards (top products, client of the month) are read from :mod:`main.leaderboards` instead.
+
+    :param now: Reference time, the dashboard covers the last 30 days.
+    :type now: datetime
+    :return: The querysets and the aggregate arguments, by name.
+    :rtype: dict
+    """
+    # Transactions des 30 derniers jours
     month_start = now - timedelta(days=30)
+    ventes = Transaction.objects.filter(time__gte=month_start, type='Vente')
+
+    return {
+        # Nombre de ventes
+        'ventes': ventes,
+        # Chiffre d'affaires du mois aux prix enregistrés, coût des marchandises vendues au coût moyen
+        'month_totals': {
+            'total_ca': Sum(_line_amount('unit_price')),
+            'total_cost': Sum('cogs'),
+        },
+        # Valeur du stock
+        'stock_value': {'valeur_stock': Sum(_line_amount('prix_vente'))},
+    }
 
-    # 2) Filtrer les transactions du mois
-    trans_month = Transaction.objects.filter(time__gte=month_start)
-    ventes = trans_month.filter(type='Vente')
-    achats = trans_month.filter(type='Achat')
 
-    # 3) Nombre de ventes
-    nb_ventes = ventes.count()
+def _dashboard_leaderboards():
+    # Classements précalculés : lecture dans le cache partagé, sans regrouper les transactions
+    return {
+        'most_sold': leaderboards.top('sold'),
+        'most_bought': leaderboards.top('bought'),
+        'client_spend': leaderboards.top('clients', limit=1),
+    }
 
-    # 4) Chiffre d'affaires du mois (= somme quantité * prix_vente)
-    ca_aggregate = ventes.annotate(
-        revenue=ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        )
-    ).aggregate(total_ca=Sum('revenue'))
-    chiffre_affaires = ca_aggregate['total_ca'] or Decimal('0.00')
-
-    # 5) Coût d'achat du mois (= somme quantité * prix_achat)
-    cost_aggregate = ventes.annotate(
-        cost=ExpressionWrapper(
-            F('quantity') * F('produit__prix_achat'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        )
-    ).aggregate(total_cost=Sum('cost'))
-    total_cost = cost_aggregate['total_cost'] or Decimal('0.00')
-
-    # 6) Bénéfice du mois
-    benefice = chiffre_affaires - total_cost
-
-    # 7) Articles les plus vendus (top 5)
-    articles_most_sold = (
-        ventes
-        .values('produit__produit')
-        .annotate(total_qty=Sum('quantity'))
-        .order_by('-total_qty')[:5]
-    )
 
-    # 8) Articles les plus achetés (top 5)
-    articles_most_bought = (
-        achats
-        .values('produit__produit')
-        .annotate(total_qty=Sum('quantity'))
-        .order_by('-total_qty')[:5]
-    )
+def _dashboard_context(nb_ventes, month_totals, most_sold, most_bought, client_spend, stock_value):
+    chiffre_affaires = month_totals['total_ca'] or Decimal('0.00')
+    total_cost = month_totals['total_cost'] or Decimal('0.00')
 
-    # 9) Client du mois (celui qui a généré le plus de CA)
-    client_spend = (
-        ventes
-        .filter(client__isnull=False)
-        .annotate(spent=ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-        .values('client', 'client__name', 'client__surname')
-        .annotate(total_spent=Sum('spent'))
-        .order_by('-total_spent')
-    )
     if client_spend:
         top = client_spend[0]
         client_of_month = {
-            'id': top['client'],
-            'name': f"{top['client__name']} {top['client__surname']}",
-            'total_spent': top['total_spent']
+            'id': top.id,
+            'name': top.label,
+            'total_spent': top.total
         }
     else:
         client_of_month = None
 
-    # 12). Valeur du stock
-    stock_value_agg = Stock.objects.aggregate(
-        valeur_stock=Sum(
-            ExpressionWrapper(
-                F('quantity') * F('prix_vente'),
-                output_field=DecimalField(max_digits=14, decimal_places=2)
-            )
-        )
-    )
-    valeur_stock = stock_value_agg['valeur_stock'] or Decimal('0.00')
-
-    # 13) Passage du contexte à la vue
-    context = {
+    return {
         'nb_ventes': nb_ventes,
         'chiffre_affaires': chiffre_affaires,
-        'benefice': benefice,
-        'articles_most_sold': articles_most_sold,
-        'articles_most_bought': articles_most_bought,
+        'benefice': chiffre_affaires - total_cost,
+        'articles_most_sold': most_sold,
+        'articles_most_bought': most_bought,
         'client_of_month': client_of_month,
-        'valeur_stock': valeur_stock,
+        'valeur_stock': stock_value['valeur_stock'] or Decimal('0.00'),
+        'leaderboard_days': settings.LEADERBOARD_WINDOW_DAYS,
     }
+
+
+@permission_required('main.view_transaction', login_url='/login/')
+def page_accueil_view(request):
+    queries = _dashboard_queries(timezone.now())
+    context = _dashboard_context(
+        nb_ventes=queries['ventes'].count(),
+        month_totals=queries['ventes'].aggregate(**queries['month_totals']),
+        stock_value=Stock.objects.aggregate(**queries['stock_value']),
+        **_dashboard_leaderboards(),
+    )
     return render(request, 'page_accueil.html', context)
 
 
+@aio.async_permission_required('main.view_transaction', login_url='/login/')
+async def page_accueil_async_view(request):
+    # Même tableau de bord, les agrégats indépendants sont exécutés en parallèle
+    queries = _dashboard_queries(timezone.now())
+    results = await aio.gather_queries(
+        nb_ventes=queries['ventes'].acount,
+        month_totals=partial(queries['ventes'].aaggregate, **queries['month_totals']),
+        leaders=_dashboard_leaderboards,
+        stock_value=partial(Stock.objects.aaggregate, **queries['stock_value']),
+    )
+    results.update(results.pop('leaders'))
+    return await sync_to_async(render)(request, 'page_accueil.html', _dashboard_context(**results))
+
+
+@aio.async_permission_required('main.view_transaction', login_url='/login/')
+async def dashboard_events_view(request):
+    if not isinstance(request, ASGIRequest):
+        # Sous WSGI, un flux sans fin bloquerait un thread : 204 arrête les reconnexions du navigateur
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(live.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Pas de mise en tampon par nginx
+    return response
+
+
 def logout_view(request):
     logout(request)
     return redirect('main:home')
+
+
+def metrics_view(request):
+    # Accès réservé au scraper (jeton "Bearer") ou aux membres du staff
+    authorized = _has_bearer_token(request, getattr(settings, 'METRICS_TOKEN', None))
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Accès refusé', status=403, content_type='text/plain')
+
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _has_bearer_token(request, token):
+    """
+    Tells whether the request carries ``Authorization: Bearer <token>``.
+
+    The comparison takes the same time whatever the first differing character,
+    so that the token cannot be guessed from the response times.
+
+    :param request: The request.
+    :type request: HttpRequest
+    :param token: The expected token; ``None`` or empty refuses every request.
+    :type token: str or None
+    :rtype: bool
+    """
+    if not token:
+        return False
+    header = request.headers.get('Authorization', '')
+    return secrets.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+def sync_changes_view(request):
+    # Accès réservé aux caisses (jeton "Bearer") ou aux utilisateurs qui voient produits et clients
+    authorized = _has_bearer_token(request, getattr(settings, 'SYNC_TOKEN', None))
+    if not authorized and not request.user.has_perms(('main.view_stock', 'main.view_client')):
+        return JsonResponse({'error': 'Accès refusé'}, status=403)
+
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', settings.SYNC_BATCH_SIZE))
+    except ValueError:
+        return JsonResponse({'error': "'since' et 'limit' doivent être des entiers"}, status=400)
+    if since < 0 or not 0 < limit <= settings.SYNC_MAX_BATCH_SIZE:
+        return JsonResponse(
+            {'error': f"'since' doit être positif et 'limit' compris entre 1 et {settings.SYNC_MAX_BATCH_SIZE}"},
+            status=400,
+        )
+
+    # Lignes en tableaux, sans espaces : la réponse est ensuite compressée par CompressionMiddleware
+    return JsonResponse(sync.changes_since(since, limit), json_dumps_params={'separators': (',', ':')})
+
+
+SEARCH_LIMIT = 10
+
+
+@login_required(login_url='/login/')
+def search_view(request):
+    # Recherche approchée (fautes de frappe, fragments) dans l'index en mémoire
+    query = request.GET.get('q', '').strip()
+    products, clients = [], []
+    if query and request.user.has_perm('main.view_stock'):
+        matches = search.products.search(query, limit=SEARCH_LIMIT)
+        stocks = Stock.objects.in_bulk([pk for pk, _label, _score in matches])
+        products = [stocks[pk] for pk, _label, _score in matches if pk in stocks]
+    if query and request.user.has_perm('main.view_client'):
+        matches = search.clients.search(query, limit=SEARCH_LIMIT)
+        found = Client.objects.in_bulk([pk for pk, _label, _score in matches])
+        clients = [found[pk] for pk, _label, _score in matches if pk in found]
+
+    return render(request, 'page_search.html', {
+        'query': query,
+        'products': products,
+        'clients': clients,
+    })
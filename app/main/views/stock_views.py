@@ -1,41 +1,137 @@
 import io
 import json
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
+from decimal import Decimal
 
-import matplotlib.pyplot as plt
+import numpy as np
+
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+from django.core.paginator import Paginator
+from django.db import transaction as db_transaction
+from django.db.models import F, ExpressionWrapper, DecimalField
 from django.http import Http404
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views.generic import DeleteView
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer, Image
-
-from ..common_functions import filter_transactions
-from ..forms import StockForm
-from ..models import Transaction, Stock
 
+from .. import forecast, metrics, reports
+from ..archive import archived_totals
+from ..common_functions import filter_transactions, get_autocomplete_limit, get_dates
+from ..forms import StockForm, StockImportForm
+from ..models import Transaction, Stock
+from ..read_models import transaction_rows
+from ..reports import stock_item as stock_item_report
+from ..reports.export import stream_stock_reports, get_progress
+from ..stock_import import import_stock_csv
+
+
+# Tris autorisés : paramètre "sort" -> champ (annoté) du queryset
+STOCK_SORTS = {
+    'produit': 'produit',
+    'quantity': 'quantity',
+    'value': 'retail_value',
+    'margin': 'margin',
+}
+STOCKS_PER_PAGE = 50
+
+
+def _stock_list_context(request):
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', 'produit')
+    descending = sort.startswith('-')
+    sort_key = sort.lstrip('-')
+    if sort_key not in STOCK_SORTS:
+        sort_key, descending = 'produit', False
 
-@permission_required('main.view_stock', login_url='/login/')
-def page_stocks_view(request):
     stocks = Stock.objects.annotate(
         retail_value=ExpressionWrapper(
             F("prix_vente") * F("quantity"),
             output_field=DecimalField(max_digits=10, decimal_places=2, default=0)
-        )
-    ).all()
-    return render(request, 'stocks/page_stocks.html', {
-        'stocks': stocks
+        ),
+        margin=ExpressionWrapper(
+            F("prix_vente") - F("prix_achat"),
+            output_field=DecimalField(max_digits=10, decimal_places=2, default=0)
+        ),
+    )
+    if query:
+        # Recherche par préfixe : LIKE 'xxx%' profite de l'index unique sur produit
+        stocks = stocks.filter(produit__istartswith=query)
+
+    order = STOCK_SORTS[sort_key]
+    stocks = stocks.order_by(f"-{order}" if descending else order, 'id')
+
+    page = Paginator(stocks, STOCKS_PER_PAGE).get_page(request.GET.get('page'))
+    return {
+        'stocks': page,
+        'page': page,
+        'q': query,
+        'sort': f"-{sort_key}" if descending else sort_key,
+    }
+
+
+@permission_required('main.view_stock', login_url='/login/')
+def page_stocks_view(request):
+    return render(request, 'stocks/page_stocks.html', _stock_list_context(request))
+
+
+@permission_required('main.view_stock', login_url='/login/')
+def stocks_rows_view(request):
+    # Fragment : uniquement le corps du tableau, pour le filtrage sans recharger base.html
+    return render(request, 'stocks/_stock_rows.html', _stock_list_context(request))
+
+
+@permission_required('main.view_stock', login_url='/login/')
+def page_reorder_view(request):
+    pks, quantities = forecast.stock_levels()
+    suggestions = forecast.reorder_suggestions(forecast.current_forecast(), pks, quantities)
+    # Produits à commander, les plus proches de la rupture en premier
+    due = np.flatnonzero(suggestions['order'] > 0)
+    due = due[np.argsort(suggestions['cover'][due], kind='stable')]
+
+    page = Paginator(due.tolist(), STOCKS_PER_PAGE).get_page(request.GET.get('page'))
+    names = dict(Stock.objects.filter(pk__in=[int(pks[i]) for i in page]).values_list('pk', 'produit'))
+    rows = [
+        {
+            'id': int(pks[i]),
+            'produit': names.get(int(pks[i]), ''),
+            'quantity': int(quantities[i]),
+            'demand': float(suggestions['demand'][i]),
+            'average': float(suggestions['average'][i]),
+            'reorder_point': float(suggestions['reorder_point'][i]),
+            'cover': float(suggestions['cover'][i]),
+            'order': int(suggestions['order'][i]),
+        }
+        for i in page
+    ]
+    return render(request, 'stocks/page_reorder.html', {
+        'rows': rows,
+        'page': page,
+        'lead_days': settings.REORDER_LEAD_DAYS,
+        'cover_days': settings.REORDER_COVER_DAYS,
+        'window_days': settings.FORECAST_WINDOW_DAYS,
     })
 
 
+@permission_required('main.view_stock', login_url='/login/')
+def autocomplete_stock(request):
+    query = request.GET.get('q', '').strip()
+    limit = get_autocomplete_limit(request)
+
+    stocks = Stock.objects.order_by('produit')
+    if query:
+        stocks = stocks.filter(produit__istartswith=query)
+    results = [
+        {'id': pk, 'text': produit, 'quantity': quantity}
+        for pk, produit, quantity in stocks.values_list('pk', 'produit', 'quantity')[:limit]
+    ]
+    return JsonResponse({'results': results})
+
+
 @permission_required('main.edit_stock', login_url='/login/')
 def page_edit_stock(request, pk):
     stock = get_object_or_404(Stock, pk=pk)
@@ -43,7 +139,9 @@ def page_edit_stock(request, pk):
     if request.method == 'POST':
         form = StockForm(request.POST, instance=stock)
         if form.is_valid():
-            form.save()
+            # Ligne du journal de synchronisation écrite dans la même transaction (main.signals)
+            with db_transaction.atomic():
+                form.save()
             return redirect('main:list_stocks')
     else:
         form = StockForm(instance=stock)
@@ -56,7 +154,8 @@ def page_add_stock(request):
     if request.method == 'POST':
         form = StockForm(request.POST)
         if form.is_valid():
-            form.save()
+            with db_transaction.atomic():
+                form.save()
             return redirect('main:list_stocks')
     else:
         form = StockForm()
@@ -64,6 +163,24 @@ def page_add_stock(request):
     return render(request, 'stocks/page_add_stock.html', {'form': form})
 
 
+# Crée des produits et modifie les prix des produits existants
+@permission_required(('main.add_stock', 'main.change_stock'), login_url='/login/')
+def page_import_stock(request):
+    result = None
+    if request.method == 'POST':
+        form = StockImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            text_file = io.TextIOWrapper(form.cleaned_data['fichier'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_stock_csv(text_file)
+            except UnicodeDecodeError:
+                form.add_error('fichier', "Le fichier doit être encodé en UTF-8.")
+    else:
+        form = StockImportForm()
+
+    return render(request, 'stocks/page_import_stock.html', {'form': form, 'result': result})
+
+
 class StockDeleteView(DeleteView):
     model = Stock
     success_url = reverse_lazy('main:list_stocks')
@@ -83,23 +200,32 @@ def stock_transactions_view(request, pk):
 
     transactions_obj = filter_transactions(transactions_obj, request)
 
-    # Prepare data for JSON
-    transactions = list(transactions_obj.values())
+    # Sans filtre de période, on rappelle les totaux des transactions archivées
+    start_date, end_date = get_dates(request)
+    archived = archived_totals(produit=produit) if start_date is None and end_date is None else None
+    if archived and not any(total['count'] for total in archived.values()):
+        archived = None
 
-    # Transform data
-    transactions = [
-        {**t, 'price': float(t['price'])} if 'price' in t else t
-        for t in transactions
-    ]
+    # Une seule requête pour le tableau et le graphique, en lignes légères
+    rows = transaction_rows(transactions_obj)
+
+    # Prepare data for JSON: only what the chart reads, sales as negative quantities
     transactions = [
-        {**i, 'quantity': i['quantity'] * -1} if i['type'] == 'Vente' else i
-        for i in transactions
+        {
+            'time': row.time,
+            'type': row.type,
+            'quantity': -row.quantity if row.type == 'Vente' else row.quantity,
+            'new_stock_qt': row.new_stock_qt,
+            'price': float(row.price) if row.price is not None else None,
+        }
+        for row in rows
     ]
 
     return render(request, 'stocks/page_view_item_stock.html', {
         'produit': produit,
         'transactions': json.dumps(transactions, cls=DateTimeEncoder),
-        'transactions_obj': transactions_obj,
+        'transactions_obj': rows,
+        'archived': archived,
         'time_filters': {
             'available_spans': ['hour', 'day', 'week'],
         },
@@ -111,6 +237,8 @@ class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
             return obj.timestamp()  # Convert datetime to Unix timestamp
+        if isinstance(obj, Decimal):
+            return float(obj)  # Prix unitaires enregistrés sur les transactions
         return super().default(obj)
 
 
@@ -122,245 +250,13 @@ def generate_stock_item_pdf(request, pk):
     except Stock.DoesNotExist:
         return HttpResponse("Article non trouvé", status=404)
 
-    # 1. Créer un buffer BytesIO pour générer le PDF
-    buffer = io.BytesIO()
-
-    # 2. Calculer les plages de dates
+    started_at = time.perf_counter()
     now = timezone.now()
-    hour_start = now - timedelta(hours=1)
-    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = now - timedelta(days=now.weekday())
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    # 3. Récupérer les statistiques de vente pour différentes périodes
-    sales_last_hour = Transaction.objects.filter(
-        produit=stock_item,
-        type='Vente',
-        time__gte=hour_start
-    ).aggregate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-    )
 
-    sales_last_day = Transaction.objects.filter(
-        produit=stock_item,
-        type='Vente',
-        time__gte=day_start
-    ).aggregate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-    )
-
-    sales_last_week = Transaction.objects.filter(
-        produit=stock_item,
-        type='Vente',
-        time__gte=week_start
-    ).aggregate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-    )
-
-    sales_last_month = Transaction.objects.filter(
-        produit=stock_item,
-        type='Vente',
-        time__gte=month_start
-    ).aggregate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-    )
-
-    sales_last_year = Transaction.objects.filter(
-        produit=stock_item,
-        type='Vente',
-        time__gte=year_start
-    ).aggregate(
-        total_quantity=Sum('quantity'),
-        total_value=Sum(ExpressionWrapper(
-            F('quantity') * F('produit__prix_vente'),
-            output_field=DecimalField(max_digits=14, decimal_places=2)
-        ))
-    )
-
-    # 4. Récupérer les transactions des 30 derniers jours
-    thirty_days_ago = now - timedelta(days=30)
-    recent_transactions = Transaction.objects.filter(
-        produit=stock_item,
-        time__gte=thirty_days_ago
-    ).order_by('-time')
-
-    # 5. Calculer la valeur actuelle du stock et le prix de vente potentiel
-    current_stock_value = stock_item.quantity * stock_item.prix_achat
-    potential_retail_value = stock_item.quantity * stock_item.prix_vente
-    margin = potential_retail_value - current_stock_value if potential_retail_value and current_stock_value else 0
-    margin_percentage = (margin / current_stock_value * 100) if current_stock_value else 0
-
-    # 6. Générer un graphique des transactions pour les 30 derniers jours
-    dates = [(thirty_days_ago + timedelta(days=i)).date() for i in range(31)]
-    sales_data = []
-    purchase_data = []
-
-    for day in dates:
-        day_start = datetime.combine(day, datetime.min.time())
-        day_end = datetime.combine(day, datetime.max.time())
-
-        sales = Transaction.objects.filter(
-            produit=stock_item,
-            type='Vente',
-            time__range=[day_start, day_end]
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-
-        purchases = Transaction.objects.filter(
-            produit=stock_item,
-            type='Achat',
-            time__range=[day_start, day_end]
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-
-        sales_data.append(sales)
-        purchase_data.append(purchases)
-
-    plt.figure(figsize=(10, 5))
-    plt.bar(range(len(dates)), sales_data, color='blue', label='Ventes')
-    plt.bar(range(len(dates)), purchase_data, color='green', label='Achats', bottom=sales_data)
-    plt.title(f'Transactions pour {stock_item.produit} (30 derniers jours)')
-    plt.xlabel('Date')
-    plt.ylabel('Quantité')
-    plt.legend()
-    plt.xticks(range(0, len(dates), 5), [dates[i].strftime('%d/%m') for i in range(0, len(dates), 5)])
-
-    transactions_chart = io.BytesIO()
-    plt.savefig(transactions_chart, format='png')
-    plt.close()
-
-    # 7. Générer le PDF
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    # Titre
-    elements.append(Paragraph(f"Rapport détaillé de l'article : {stock_item.produit}", styles['Title']))
-    elements.append(Paragraph(f"Généré le : {now.strftime('%d/%m/%Y à %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 12))
-
-    # Informations sur l'article
-    elements.append(Paragraph("Détails de l'article", styles['Heading2']))
-    item_data = [
-        ["Champ", "Valeur"],
-        ["ID", stock_item.pk],
-        ["Produit", stock_item.produit],
-        ["Quantité en stock", stock_item.quantity],
-        ["Prix d'achat", f"{stock_item.prix_achat:.2f}€"],
-        ["Prix de vente", f"{stock_item.prix_vente:.2f}€"],
-    ]
-    item_table = Table(item_data)
-    item_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(item_table)
-    elements.append(Spacer(1, 12))
-
-    # Valeur actuelle et potentielle
-    elements.append(Paragraph("Valorisation du stock", styles['Heading2']))
-    value_data = [
-        ["Métrique", "Valeur"],
-        ["Valeur d'achat en stock", f"{current_stock_value:.2f}€"],
-        ["Valeur potentielle de vente", f"{potential_retail_value:.2f}€"],
-        ["Marge potentielle", f"{margin:.2f}€"],
-        ["Pourcentage de marge", f"{margin_percentage:.2f}%"],
-    ]
-    value_table = Table(value_data)
-    value_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(value_table)
-    elements.append(Spacer(1, 12))
-
-    # Statistiques de vente
-    elements.append(Paragraph("Statistiques de vente", styles['Heading2']))
-    sales_data = [
-        ["Période", "Quantité vendue", "Valeur des ventes"],
-        ["Dernière heure", sales_last_hour['total_quantity'] or 0, f"{sales_last_hour['total_value'] or 0:.2f}€"],
-        ["Aujourd'hui", sales_last_day['total_quantity'] or 0, f"{sales_last_day['total_value'] or 0:.2f}€"],
-        ["Cette semaine", sales_last_week['total_quantity'] or 0, f"{sales_last_week['total_value'] or 0:.2f}€"],
-        ["Ce mois-ci", sales_last_month['total_quantity'] or 0, f"{sales_last_month['total_value'] or 0:.2f}€"],
-        ["Cette année", sales_last_year['total_quantity'] or 0, f"{sales_last_year['total_value'] or 0:.2f}€"],
-    ]
-    sales_table = Table(sales_data)
-    sales_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(sales_table)
-    elements.append(Spacer(1, 12))
-
-    # Graphique des transactions
-    elements.append(Paragraph("Évolution des transactions (30 derniers jours)", styles['Heading2']))
-    transactions_chart.seek(0)
-    elements.append(Image(transactions_chart, 7 * inch, 3.5 * inch))
-    elements.append(Spacer(1, 12))
-
-    # Transactions récentes
-    elements.append(Paragraph("Historique des 30 derniers jours", styles['Heading2']))
-    if recent_transactions:
-        trans_data = [["Date", "Type", "Quantité", "Prix Total", "Client/Fournisseur"]]
-        for trans in recent_transactions:
-            client_name = f"{trans.client.name} {trans.client.surname}" if trans.client else "N/A"
-            if trans.type == 'Vente':
-                total_price = trans.quantity * stock_item.prix_vente
-            else:
-                total_price = trans.price * trans.quantity if trans.price else 0
-
-            trans_data.append([
-                trans.time.strftime("%d/%m/%Y %H:%M"),
-                trans.type,
-                trans.quantity,
-                f"{total_price:.2f}€",
-                client_name
-            ])
-        trans_table = Table(trans_data)
-        trans_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(trans_table)
-    else:
-        elements.append(Paragraph("Aucune transaction au cours des 30 derniers jours.", styles['Normal']))
-
-    # Générer le PDF
-    doc.build(elements)
+    # Sections (requêtes, graphique, tableaux) produites en parallèle puis assemblées dans l'ordre
+    item = stock_item_report.item_summary(stock_item)
+    buffer = reports.build_pdf(stock_item_report.sections(item, now))
+    metrics.record_pdf('stock_item', started_at, buffer.getbuffer().nbytes)
 
     # Créer la réponse HTTP
     buffer.seek(0)
@@ -369,3 +265,44 @@ def generate_stock_item_pdf(request, pk):
         'Content-Disposition'] = f'attachment; filename="rapport_{stock_item.produit}_{now.strftime("%Y%m%d")}.pdf"'
 
     return response
+
+
+def _export_selection(request):
+    # Sélection : liste d'identifiants "ids=1,2,3" ou recherche par préfixe "q", comme la liste des stocks
+    stocks = Stock.objects.all()
+    ids = [pk for pk in request.GET.get('ids', '').split(',') if pk.strip().isdigit()]
+    if ids:
+        stocks = stocks.filter(pk__in=ids)
+    query = request.GET.get('q', '').strip()
+    if query:
+        stocks = stocks.filter(produit__istartswith=query)
+    return stocks
+
+
+@permission_required(('main.view_stock', 'main.view_transaction'), login_url='/login/')
+def page_export_stock_reports(request):
+    return render(request, 'stocks/page_export_stock_reports.html', {
+        'q': request.GET.get('q', '').strip(),
+        'ids': request.GET.get('ids', ''),
+        'count': _export_selection(request).count(),
+    })
+
+
+@permission_required(('main.view_stock', 'main.view_transaction'), login_url='/login/')
+def stock_reports_zip(request):
+    now = timezone.now()
+    # Les rapports sont écrits dans l'archive au fur et à mesure de leur rendu
+    response = StreamingHttpResponse(
+        stream_stock_reports(_export_selection(request), now, export_id=request.GET.get('export')),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="rapports_stock_{now.strftime("%Y%m%d")}.zip"'
+    return response
+
+
+@permission_required(('main.view_stock', 'main.view_transaction'), login_url='/login/')
+def stock_reports_status(request, export_id):
+    progress = get_progress(export_id)
+    if progress is None:
+        raise Http404("Export inconnu")
+    return JsonResponse(progress)
@@ -1,8 +1,11 @@
 import io
+import time
 from datetime import datetime, timedelta
 
 import matplotlib.pyplot as plt
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
+from django.db import IntegrityError
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from django.http import HttpResponse
 from django.shortcuts import redirect
@@ -14,9 +17,12 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Image
 
+from .. import ingest, metrics
 from ..common_functions import filter_transactions
 from ..forms import TransactionForm
 from ..models import Transaction, Stock
+from ..read_models import transaction_rows
+from ..routers import pin_to_primary
 
 
 @permission_required('main.view_transaction', login_url='/login/')
@@ -35,7 +41,7 @@ def page_transactions_view(request):
         transactions = transactions.filter(time__range=[start_date, end_date])
 
     return render(request, 'transactions/page_transactions.html', {
-        'transactions': transactions,
+        'transactions': transaction_rows(transactions),
         'show_date': True,
     })
 
@@ -45,32 +51,18 @@ def page_add_transaction(request):
     if request.method == 'POST':
         form = TransactionForm(request.POST)
         if form.is_valid():
-            from django.db import transaction
-            from django.db import IntegrityError
             try:
-                with transaction.atomic():
-                    # Save transaction without committing to DB
-                    transaction = form.save(commit=False)
-
-                    # Fetch associated stock object
-                    stock = transaction.produit
-
-                    # Apply stock changes based on transaction type
-                    if transaction.type == "Vente":
-                        if stock.quantity < transaction.quantity:
-                            raise ValueError("Stock insuffisant !")
-                        transaction.price = stock.prix_vente * transaction.quantity
-                        stock.quantity -= transaction.quantity
-                    else:  # Achat
-                        transaction.price = stock.prix_achat * transaction.quantity
-                        stock.quantity += transaction.quantity
-
-                    # Save updated stock and set new_stock_qt
-                    stock.save()
-                    transaction.new_stock_qt = stock.quantity
-                    transaction.save()
-
-                    return redirect('main:list_transactions')
+                # Save transaction without committing to DB
+                transaction = form.save(commit=False)
+                if settings.INGEST_GROUP_COMMIT and transaction.type == 'Vente':
+                    # Ventes en caisse : validées avec celles des autres requêtes, dans le même commit
+                    ingest.committer.submit(transaction)
+                else:
+                    ingest.save_transaction(transaction)
+                # Les pages suivantes doivent afficher cette transaction
+                pin_to_primary(request)
+
+                return redirect('main:list_transactions')
 
             except ValueError as e:
                 form.add_error('quantity', str(e))
@@ -78,6 +70,10 @@ def page_add_transaction(request):
             except IntegrityError:
                 form.add_error(None, "Erreur système. Veuillez réessayer.")
 
+            except TimeoutError:
+                # La vente peut encore être écrite : la ressaisir risquerait un doublon
+                form.add_error(None, "Vente en attente d'écriture. Vérifiez la liste des transactions avant de la ressaisir.")
+
     else:
         form = TransactionForm()
 
@@ -86,6 +82,8 @@ def page_add_transaction(request):
 
 @permission_required('main.view_transaction', login_url='/login/')
 def generate_transactions_pdf_report(request):
+    started_at = time.perf_counter()
+
     # 1. Create BytesIO buffer for PDF generation
     buffer = io.BytesIO()
 
@@ -111,9 +109,9 @@ def generate_transactions_pdf_report(request):
     week_count = Transaction.objects.filter(time__range=[week_start, week_end]).count()
 
     # Recent transactions for extract
-    recent_transactions = Transaction.objects.filter(
+    recent_transactions = transaction_rows(Transaction.objects.filter(
         time__gte=month_start
-    ).order_by('-time')[:10]
+    ).order_by('-time')[:10])
 
     # Daily transaction counts
     dates = [(month_start + timedelta(days=i)).date() for i in range(32)
@@ -196,7 +194,7 @@ def generate_transactions_pdf_report(request):
         trans_data.append([
             trans.time.strftime("%Y-%m-%d"),
             trans.type,
-            trans.produit.produit,
+            trans.produit,
             trans.quantity,
             f"{trans.price:.2f}€"
         ])
@@ -218,6 +216,7 @@ def generate_transactions_pdf_report(request):
 
     # Generate PDF
     doc.build(elements)
+    metrics.record_pdf('transactions', started_at, buffer.getbuffer().nbytes)
 
     # Create HTTP response
     buffer.seek(0)
@@ -0,0 +1,47 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Represents a select widget whose options are loaded on demand from a JSON endpoint.
+
+    Only the empty choice and the currently selected object are rendered as
+    ``<option>`` elements, so displaying the form no longer loads every row of
+    the queryset of the field. The endpoint, given in ``data-autocomplete-url``,
+    is queried by the page script with ``?q=<prefix>`` and must answer
+    ``{"results": [{"id": ..., "text": ...}, ...]}``.
+
+    :ivar url: URL of the autocomplete endpoint (may be lazy).
+    :type url: str
+    """
+
+    def __init__(self, url, attrs=None):
+        super().__init__(attrs=attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = set()
+        pk_field = self.choices.queryset.model._meta.pk
+        for v in value:
+            if v in (None, ''):
+                continue
+            # Valeur postée non convertible (formulaire invalide réaffiché) : aucune option à sélectionner
+            try:
+                selected.add(pk_field.to_python(v))
+            except ValidationError:
+                continue
+        options = []
+        if not self.is_required or not selected:
+            options.append(self.create_option(name, '', self.choices.field.empty_label or '', not selected, 0))
+        if selected:
+            queryset = self.choices.queryset.filter(pk__in=selected)
+            for index, obj in enumerate(queryset, start=1):
+                option_value, label = self.choices.choice(obj)
+                options.append(self.create_option(name, option_value, label, True, index))
+        return [(None, options, 0)]